@@ -1,16 +1,29 @@
-from flask import Flask, request, render_template, jsonify
+from flask import Flask, Response, request, render_template, jsonify, stream_with_context
 import os
+import uuid
 from langfuse.openai import OpenAI
 from langfuse import Langfuse
 from langfuse.decorators import langfuse_context, observe
 import logging
+from promptpilot.logs import log_event, setup_logging
+from promptpilot.serving.admission import Overloaded, admission_from_env, client_key
+from promptpilot.serving.chat import (ERROR_MESSAGE, MODEL_NAME, OLLAMA_BASE_URL, PROMPT_NAME, PROMPT_VARIABLES,
+                                      SAMPLING_PARAMS, build_messages as compile_messages, prompts_page,
+                                      requested_session)
+from promptpilot.serving.dispatch import chat_dispatcher_from_env
+from promptpilot.serving.metrics import CONTENT_TYPE, Registry, StageTimer, stats_gauges, table_gauges
+from promptpilot.serving.response_cache import response_cache_from_env, response_cache_key
+from promptpilot.serving.router import model_router_from_env
+from promptpilot.serving.sessions import llm_summarizer, session_store_from_env
+from promptpilot.serving.sse import CachedStream, CompletionStream
 from promptpilot.versioning.tree import PromptTree  # Import PromptTree
 
 # Flask app instance
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# JSON logs written by a background thread; see promptpilot.logs for the
+# LOG_* settings (truncation, per-event sampling)
+log_pipeline = setup_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize the Langfuse client
@@ -21,21 +34,131 @@ langfuse_client = Langfuse(
 )
 
 # Initialize the OpenAI client from LangFuse
-client = OpenAI(
-    base_url="http://ollama:11434/v1",  # Ollama's API endpoint
-    api_key="ollama",  # Required but not used by Ollama
-)
+def make_client(base_url):
+    return OpenAI(
+        base_url=base_url,  # Ollama's API endpoint
+        api_key="ollama",  # Required but not used by Ollama
+    )
+
+# With several OLLAMA_BASE_URLS, a ModelRouter balances them and stands in
+# for the client
+router = model_router_from_env(make_client)
+client = router or make_client(OLLAMA_BASE_URL)
+
+model_name = MODEL_NAME
+prompt_name = PROMPT_NAME
+
+# Initialize the PromptTree with the Langfuse client. It serves from the local
+# prompt_history.json right away and reconciles with Langfuse in the background.
+# Under several worker processes set PROMPT_SYNC=leader: one worker syncs and
+# the others follow the shared files
+prompt_manager = PromptTree(langfuse_client=langfuse_client,
+                            sync_on_init=os.environ.get('PROMPT_SYNC', 'background'))
+
+# Optional cache of /message replies, off unless RESPONSE_CACHE is set
+response_cache = response_cache_from_env()
+
+# Optional coalescing and batching of /message completions, off unless
+# CHAT_DISPATCH is set; looks up client per call so it can be swapped
+dispatcher = chat_dispatcher_from_env(lambda **kwargs: client.chat.completions.create(**kwargs))
 
-model_name = "smollm2"
-prompt_name = "movie-critic"
+# Optional admission control in front of Ollama, off unless
+# ADMISSION_MAX_CONCURRENCY is set
+admission = admission_from_env()
+# Set only behind a proxy that overwrites it, e.g. X-Forwarded-For
+admission_client_header = os.environ.get('ADMISSION_CLIENT_HEADER')
 
-# Initialize the PromptTree with the Langfuse client
-prompt_manager = PromptTree(langfuse_client=langfuse_client)
+# Conversation memory for clients that send a session_id; on unless
+# CHAT_SESSIONS=off. Under several worker processes set CHAT_SESSIONS=sqlite
+# so every worker sees every conversation
+sessions = session_store_from_env(llm_summarizer(lambda **kwargs: client.chat.completions.create(**kwargs),
+                                                 model_name))
+
+# Prometheus metrics served on /metrics
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram("chat_stage_seconds", "Time spent in each stage of the chat routes",
+                                  ["route", "stage"])
+IN_FLIGHT = metrics.gauge("chat_requests_in_flight", "Requests being handled", ["route"])
+REQUESTS = metrics.counter("chat_requests_total", "Requests handled", ["route", "status"])
+UPSTREAM_ERRORS = metrics.counter("chat_upstream_errors_total", "Failed Ollama calls", ["error"])
+TOKENS = metrics.counter("chat_tokens_total", "Tokens reported by Ollama", ["kind"])
+CACHE_RESULTS = metrics.counter("chat_response_cache_total", "Response cache lookups", ["result"])
+
+def component_gauges():
+    gauges = []
+    for name, component in serving_components().items():
+        stats = component.stats()
+        gauges.extend(stats_gauges(f"chat_{name}", stats))
+        if name == "router":
+            gauges.extend(table_gauges("chat_backend", stats["backends"], "backend"))
+    return gauges
+
+metrics.add_collector(component_gauges)
 
 @app.route("/", methods=["GET"])
 def index():
     return render_template("chat.html")
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    # Readiness probe: 200 once the prompt tree has synced with Langfuse
+    status = prompt_manager.sync_status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+def serving_components():
+    # The optional serving components that are switched on
+    components = {"admission": admission, "response_cache": response_cache, "dispatcher": dispatcher,
+                  "router": router, "sessions": sessions, "logging": log_pipeline}
+    return {name: component for name, component in components.items() if component is not None}
+
+@app.route("/stats", methods=["GET"])
+def stats():
+    return jsonify({name: component.stats() for name, component in serving_components().items()})
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype=CONTENT_TYPE)
+
+@app.after_request
+def count_request(response):
+    REQUESTS.inc(route=request.url_rule.rule if request.url_rule else "unmatched", status=response.status_code)
+    return response
+
+def build_messages(user_input, timer, session_id=None):
+    # The latest system prompt from PromptTree, compiled once per version,
+    # then the session's earlier turns
+    with timer.stage("prompt_lookup"):
+        prompt = prompt_manager.get_latest_prompt(prompt_name)
+    with timer.stage("prompt_compile"):
+        system_prompt = prompt_manager.compile_prompt(prompt_name, prompt, **PROMPT_VARIABLES) if prompt else None
+    history = ()
+    if session_id is not None:
+        with timer.stage("session_history"):
+            history = sessions.history(session_id)
+    return prompt, compile_messages(prompt, user_input, system_prompt, history)
+
+def resume_session():
+    # Raises ValueError for a malformed session_id, sessions on or off
+    opted_in, session_id = requested_session(request.json)
+    if sessions is None or not opted_in:
+        return None
+    return sessions.resume(session_id)
+
+def reply(response_text, session_id):
+    body = {"response": response_text}
+    if session_id is not None:
+        body["session_id"] = session_id
+    return jsonify(body)
+
+def admit():
+    # Wait for a slot in front of Ollama; the start time goes to release()
+    return admission.acquire(client_key(request.remote_addr, request.headers, admission_client_header))
+
+def refuse(e):
+    # Fail fast instead of letting requests pile up behind Ollama
+    logger.warning(f"Refused chat completion ({e.status}): {e.reason}")
+    return jsonify({"error": e.reason}), e.status, {"Retry-After": str(e.retry_after)}
+
 @observe(as_type="generation")
 @app.route("/message", methods=["POST"])
 def message():
@@ -44,70 +167,238 @@ def message():
         return jsonify({"error": "No message provided."}), 400
 
     try:
-        # Get the latest system prompt using PromptTree
-        prompt = prompt_manager.get_latest_prompt(name=prompt_name)
+        session_id = resume_session()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Stage timings go to /metrics and, with the outcome, onto the trace
+    timer = StageTimer(STAGE_SECONDS, route="/message")
+    trace = {"id": str(uuid.uuid4()), "name": "message", "input": user_input,
+             "metadata": {"prompt_name": prompt_name}}
+    if session_id is not None:
+        trace["session_id"] = session_id
+    with IN_FLIGHT.track(route="/message"):
+        try:
+            return answer(user_input, timer, trace, session_id)
+        finally:
+            timer.finish()
+            trace["metadata"]["timings_ms"] = timer.timings_ms()
+            langfuse_client.trace(**trace)
+
+def answer(user_input, timer, trace, session_id=None):
+    try:
+        prompt, messages = build_messages(user_input, timer, session_id)
+        trace["metadata"]["prompt_version"] = getattr(prompt, "version", None)
+        if session_id is not None:
+            trace["metadata"]["history_messages"] = len(messages) - 2
+        extra = {}
+        if response_cache is not None:
+            with timer.stage("cache"):
+                # The key carries the prompt version, so a new version always misses
+                cache_key = response_cache_key(model_name, prompt, messages, user_input, SAMPLING_PARAMS)
+                cached = response_cache.get(cache_key)
+            CACHE_RESULTS.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                log_event(logger, "chat.reply", trace_id=trace["id"], session_id=session_id, cache="hit",
+                          user_input=user_input, response=cached)
+                trace.update(output=cached, tags=["cache-hit"])
+                trace["metadata"]["cache"] = "hit"
+                if session_id is not None:
+                    sessions.record(session_id, user_input, cached)
+                with timer.stage("serialize"):
+                    return reply(cached, session_id)
+            extra["tags"] = trace["tags"] = ["cache-miss"]
+            trace["metadata"]["cache"] = "miss"
+
+        create = dispatcher.complete if dispatcher is not None else client.chat.completions.create
+        started_at = None
+        try:
+            if admission is not None:
+                with timer.stage("admission"):
+                    started_at = admit()
+            with timer.stage("upstream"):
+                response = create(
+                    model=model_name,
+                    messages=messages,
+                    metadata={"prompt_name": prompt_name},
+                    trace_id=trace["id"],
+                    **SAMPLING_PARAMS,
+                    **extra,
+                )
+        except Overloaded as e:
+            trace["metadata"]["refused"] = e.status
+            return refuse(e)
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(error=type(e).__name__)
+            raise
+        finally:
+            if started_at is not None:
+                admission.release(started_at)
 
-        # If no prompt is found, use a default
-        if prompt:
-            system_prompt = prompt.compile(criticLevel="expert", movie="Inception")
-        else:
-            system_prompt = "You are a helpful assistant."
-
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input},
-            ],
-            metadata={"prompt_name": prompt_name},
-        )
         response_text = response.choices[0].message.content
-        logger.info(f"User input: {user_input}")
-        logger.info(f"Assistant response: {response_text}")
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+            TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+        log_event(logger, "chat.reply", trace_id=trace["id"], session_id=session_id,
+                  prompt_version=trace["metadata"]["prompt_version"], user_input=user_input, response=response_text)
+        if response_cache is not None and response_text:
+            response_cache.set(cache_key, response_text)
+        if session_id is not None and response_text:
+            sessions.record(session_id, user_input, response_text)
 
-        return jsonify({"response": response_text})
+        trace["output"] = response_text
+        with timer.stage("serialize"):
+            return reply(response_text, session_id)
     except Exception as e:
         logger.error(f"Error during chat completion: {e}", exc_info=True)
-        return jsonify({
-            "error": "Unexpected error occurred. Please check your request and contact support: https://langfuse.com/support."
-        }), 500
+        trace["metadata"]["error"] = str(e)
+        return jsonify({"error": ERROR_MESSAGE}), 500
+
+@app.route("/message/stream", methods=["POST"])
+def message_stream():
+    """Like /message, but tokens are sent as Server-Sent Events as they arrive.
+
+    Events: ``token`` ({"token"}) per chunk, then either ``done`` ({"response",
+    "ttft_ms", "total_ms"}) or, if Ollama fails mid-stream, ``error`` ({"error",
+    "response"} with the partial text). Failures before the first byte get
+    the same JSON 500 as /message. The session, if any, is in X-Session-Id
+    and only completed replies are remembered. Replies come from the same
+    response cache as /message when it is on; a hit is sent as one token.
+    """
+    user_input = request.json.get("message")
+    if not user_input:
+        return jsonify({"error": "No message provided."}), 400
+
+    try:
+        session_id = resume_session()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    timer = StageTimer(STAGE_SECONDS, route="/message/stream")
+    started_at = timer.started_at
+    trace_id = str(uuid.uuid4())
+    IN_FLIGHT.inc(route="/message/stream")
+    # The admission slot is held until the stream ends or the client leaves
+    admitted_at = []
+    upstream = []
+    finished = []
+
+    def finish():
+        # Once, when the stream ends or the response is closed. Closing the
+        # upstream stream also covers one that was never iterated, so a
+        # routed backend gets its slot back
+        if finished:
+            return
+        finished.append(True)
+        for stream in upstream:
+            close = getattr(stream, "close", None)
+            if callable(close):
+                close()
+        if admitted_at:
+            admission.release(admitted_at.pop())
+        IN_FLIGHT.dec(route="/message/stream")
+        timer.finish()
+
+    cache_key = cached = None
+    extra = {}
+    try:
+        prompt, messages = build_messages(user_input, timer, session_id)
+        if response_cache is not None:
+            with timer.stage("cache"):
+                cache_key = response_cache_key(model_name, prompt, messages, user_input, SAMPLING_PARAMS)
+                cached = response_cache.get(cache_key)
+            CACHE_RESULTS.inc(result="miss" if cached is None else "hit")
+            extra["tags"] = ["cache-miss" if cached is None else "cache-hit"]
+        if cached is not None:
+            stream = CachedStream(cached)
+        else:
+            if admission is not None:
+                with timer.stage("admission"):
+                    admitted_at.append(admit())
+            # Streams go straight to the client, not through the dispatcher:
+            # it hands each caller one finished result, and a stream's tokens
+            # are consumed once, as they arrive. Admission still bounds them
+            try:
+                with timer.stage("upstream"):
+                    stream = client.chat.completions.create(
+                        model=model_name,
+                        messages=messages,
+                        metadata={"prompt_name": prompt_name},
+                        stream=True,
+                        **SAMPLING_PARAMS,
+                        trace_id=trace_id,
+                        **extra,
+                    )
+                upstream.append(stream)
+            except Exception as e:
+                UPSTREAM_ERRORS.inc(error=type(e).__name__)
+                raise
+    except Overloaded as e:
+        finish()
+        return refuse(e)
+    except Exception as e:
+        finish()
+        logger.error(f"Error starting streamed chat completion: {e}", exc_info=True)
+        return jsonify({"error": ERROR_MESSAGE}), 500
+
+    def record(result):
+        if result.time_to_first_token is not None:
+            timer.record("first_token", result.time_to_first_token)
+        finish()
+        # The generation itself is recorded by the Langfuse OpenAI wrapper
+        # when the stream ends; the trace gets the outcome and timings
+        log_event(logger, "chat.stream_reply", trace_id=trace_id, session_id=session_id, status=result.status,
+                  user_input=user_input, response=result.text, **result.timings())
+        completed = result.status == 'completed' and result.text
+        if session_id is not None and completed:
+            sessions.record(session_id, user_input, result.text)
+        if cache_key is not None and cached is None and completed:
+            response_cache.set(cache_key, result.text)
+        langfuse_client.trace(
+            id=trace_id,
+            name="message-stream",
+            input=user_input,
+            output=result.text,
+            session_id=session_id,
+            metadata=dict(result.timings(), stream_status=result.status, stream_error=result.error,
+                          timings_ms=timer.timings_ms()),
+            **extra,
+        )
+
+    # Keep proxies from buffering the stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if session_id is not None:
+        headers["X-Session-Id"] = session_id
+    response = Response(
+        stream_with_context(CompletionStream(stream, on_finish=record, started_at=started_at)),
+        mimetype="text/event-stream",
+        headers=headers,
+    )
+    # Also covers a client gone before the stream started
+    response.call_on_close(finish)
+    return response
 
 @app.route("/prompts", methods=["GET"])
 def display_prompts():
-    try:
-        # Fetch prompts from Langfuse
-        response = langfuse_client.client.prompts.list()
-        prompts = response.data
-
-        # Prepare data to display
-        prompts_list = []
-        for prompt_meta in prompts:
-            # Get the latest version
-            latest_version = max(prompt_meta.versions) if prompt_meta.versions else None
-
-            # Get the last updated time
-            last_updated = prompt_meta.last_updated_at.isoformat() if prompt_meta.last_updated_at else ''
-
-            prompt_info = {
-                "name": prompt_meta.name,
-                "versions": prompt_meta.versions,
-                "latest_version": latest_version,
-                "labels": prompt_meta.labels,
-                "tags": prompt_meta.tags,
-                "last_updated_at": last_updated,
-                "last_config": prompt_meta.last_config,
-            }
-            prompts_list.append(prompt_info)
-
-        # Return the prompts as JSON
-        return jsonify(prompts_list)
+    # Served from the local PromptTree; pollers revalidate with If-None-Match
+    etag = prompt_manager.revision_tag
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
 
+    try:
+        prompts_list, headers = prompts_page(prompt_manager, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        logger.error(f"Error fetching prompts: {e}", exc_info=True)
+        logger.error(f"Error listing prompts: {e}", exc_info=True)
         return (
             "An error occurred while fetching prompts. Please try again later.",
             500,
         )
 
+    response = jsonify(prompts_list)
+    response.headers.update(headers)
+    response.set_etag(etag)
+    return response
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=True)
\ No newline at end of file
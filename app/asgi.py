@@ -0,0 +1,413 @@
+"""Async serving mode for the chat app.
+
+The same routes as app.py on Quart, so an in-flight chat waits on the
+event loop instead of holding a worker thread. Ollama and Langfuse are
+reached through pooled, keep-alive httpx clients created once per process,
+every upstream call has a timeout, and a client that disconnects cancels
+its request task, which closes the upstream connection.
+
+Sessions, the response cache and admission control are configured as for
+app.py; their blocking calls run on threads. Not available here: the model
+router (OLLAMA_BASE_URLS), the dispatcher (CHAT_DISPATCH) and /stats, which
+are built on the blocking OpenAI client. Chats go to OLLAMA_BASE_URL.
+
+    hypercorn app.asgi:app --bind 0.0.0.0:5001
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import os
+import uuid
+
+import httpx
+from langfuse import Langfuse
+from langfuse.openai import AsyncOpenAI
+from quart import Quart, Response, jsonify, render_template, request
+
+from promptpilot.logs import log_event, setup_logging
+from promptpilot.serving.admission import Overloaded, admission_from_env, client_key
+from promptpilot.serving.chat import (ERROR_MESSAGE, MODEL_NAME, OLLAMA_BASE_URL, PROMPT_NAME, PROMPT_VARIABLES,
+                                      SAMPLING_PARAMS, build_messages, prompts_page, requested_session)
+from promptpilot.serving.metrics import CONTENT_TYPE, Registry, StageTimer
+from promptpilot.serving.response_cache import response_cache_from_env, response_cache_key
+from promptpilot.serving.sessions import llm_summarizer, session_store_from_env
+from promptpilot.serving.sse import AsyncCompletionStream, CachedStream
+from promptpilot.versioning.async_tree import AsyncLangfuseClient, AsyncPromptTree
+
+app = Quart(__name__)
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Upstream limits; generation can be slow, so reads get the longest budget
+OLLAMA_TIMEOUT = float(os.environ.get('OLLAMA_TIMEOUT', 120))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5))
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get('OLLAMA_MAX_CONNECTIONS', 100))
+LANGFUSE_TIMEOUT = float(os.environ.get('LANGFUSE_TIMEOUT', 10))
+LANGFUSE_MAX_CONNECTIONS = int(os.environ.get('LANGFUSE_MAX_CONNECTIONS', 20))
+# Set only behind a proxy that overwrites it, e.g. X-Forwarded-For
+ADMISSION_CLIENT_HEADER = os.environ.get('ADMISSION_CLIENT_HEADER')
+
+
+class Services:
+    """Process-wide upstream clients, created when the server starts."""
+
+    ollama = None
+    langfuse_api = None
+    prompt_manager = None
+    tracer = None
+    response_cache = None
+    sessions = None
+    admission = None
+    # Threads requests wait for an admission slot on, apart from the
+    # default executor so a full queue does not hold up other blocking calls
+    admission_waits = None
+
+
+services = Services()
+
+# Prometheus metrics served on /metrics, named as in app.py
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram("chat_stage_seconds", "Time spent in each stage of the chat routes",
+                                  ["route", "stage"])
+IN_FLIGHT = metrics.gauge("chat_requests_in_flight", "Requests being handled", ["route"])
+REQUESTS = metrics.counter("chat_requests_total", "Requests handled", ["route", "status"])
+UPSTREAM_ERRORS = metrics.counter("chat_upstream_errors_total", "Failed Ollama calls", ["error"])
+
+
+@app.before_serving
+async def startup():
+    if services.ollama is None:
+        http = httpx.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS),
+        )
+        services.ollama = AsyncOpenAI(base_url=OLLAMA_BASE_URL, api_key="ollama", http_client=http,
+                                      max_retries=0)
+    if services.langfuse_api is None:
+        services.langfuse_api = AsyncLangfuseClient(timeout=LANGFUSE_TIMEOUT,
+                                                    max_connections=LANGFUSE_MAX_CONNECTIONS)
+    if services.prompt_manager is None:
+        services.prompt_manager = AsyncPromptTree(services.langfuse_api)
+        # Serve from the local history while the first sync runs, retried
+        # until Langfuse answers
+        app.add_background_task(services.prompt_manager.sync_until_ready)
+    if services.tracer is None:
+        # Trace events are batched and sent by the SDK's own background thread
+        services.tracer = Langfuse(
+            public_key=os.environ.get('LANGFUSE_PUBLIC_KEY'),
+            secret_key=os.environ.get('LANGFUSE_SECRET_KEY'),
+            host=os.environ.get('LANGFUSE_HOST'),
+        )
+    if services.response_cache is None:
+        services.response_cache = response_cache_from_env()
+    if services.sessions is None:
+        loop = asyncio.get_running_loop()
+
+        def create(**kwargs):
+            # Summaries are written on the store's own thread, through the
+            # loop's pooled client
+            return asyncio.run_coroutine_threadsafe(services.ollama.chat.completions.create(**kwargs),
+                                                    loop).result()
+
+        services.sessions = session_store_from_env(llm_summarizer(create, MODEL_NAME))
+    if services.admission is None:
+        services.admission = admission_from_env()
+        if services.admission is not None:
+            services.admission_waits = ThreadPoolExecutor(
+                max_workers=services.admission.max_concurrency + services.admission.max_queue,
+                thread_name_prefix="admission")
+
+
+@app.after_serving
+async def shutdown():
+    if services.ollama is not None:
+        await services.ollama.close()
+    if services.prompt_manager is not None:
+        await services.prompt_manager.aclose()
+    if services.tracer is not None:
+        services.tracer.flush()
+    if hasattr(services.response_cache, "close"):
+        services.response_cache.close()
+    if hasattr(services.sessions, "close"):
+        services.sessions.close()
+    if services.admission_waits is not None:
+        services.admission_waits.shutdown(wait=False)
+
+
+@app.route("/", methods=["GET"])
+async def index():
+    return await render_template("chat.html")
+
+
+@app.route("/ready", methods=["GET"])
+async def ready():
+    status = services.prompt_manager.sync_status()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@app.route("/metrics", methods=["GET"])
+async def prometheus_metrics():
+    return Response(metrics.render(), mimetype=CONTENT_TYPE)
+
+
+@app.after_request
+async def count_request(response):
+    REQUESTS.inc(route=request.url_rule.rule if request.url_rule else "unmatched", status=response.status_code)
+    return response
+
+
+def in_thread(fn, *args):
+    # Blocking calls, e.g. to the SQLite stores, are kept off the event loop
+    return asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args))
+
+
+async def chat_messages(user_input, timer, session_id=None):
+    prompt_manager = services.prompt_manager
+    with timer.stage("prompt_lookup"):
+        prompt = await prompt_manager.get_latest_prompt(PROMPT_NAME)
+    with timer.stage("prompt_compile"):
+        system_prompt = prompt_manager.compile_prompt(PROMPT_NAME, prompt, **PROMPT_VARIABLES) if prompt else None
+    history = ()
+    if session_id is not None:
+        with timer.stage("session_history"):
+            history = await in_thread(services.sessions.history, session_id)
+    return prompt, build_messages(prompt, user_input, system_prompt, history)
+
+
+async def resume_session(body):
+    # As in app.py; raises ValueError for a malformed session_id
+    opted_in, session_id = requested_session(body)
+    if services.sessions is None or not opted_in:
+        return None
+    return await in_thread(services.sessions.resume, session_id)
+
+
+def reply(response_text, session_id):
+    body = {"response": response_text}
+    if session_id is not None:
+        body["session_id"] = session_id
+    return jsonify(body)
+
+
+async def admit():
+    # acquire() blocks while queued, so the wait happens on a thread. A slot
+    # granted after the request went away is handed straight back
+    admission = services.admission
+    waiting = asyncio.get_running_loop().run_in_executor(
+        services.admission_waits, admission.acquire,
+        client_key(request.remote_addr, request.headers, ADMISSION_CLIENT_HEADER))
+    try:
+        return await asyncio.shield(waiting)
+    except asyncio.CancelledError:
+        waiting.add_done_callback(release_unclaimed)
+        raise
+
+
+def release_unclaimed(waiting):
+    if not waiting.cancelled() and waiting.exception() is None:
+        services.admission.release(waiting.result())
+
+
+def refuse(e):
+    logger.warning(f"Refused chat completion ({e.status}): {e.reason}")
+    return jsonify({"error": e.reason}), e.status, {"Retry-After": str(e.retry_after)}
+
+
+@app.route("/message", methods=["POST"])
+async def message():
+    body = await request.get_json() or {}
+    user_input = body.get("message")
+    if not user_input:
+        return jsonify({"error": "No message provided."}), 400
+    try:
+        session_id = await resume_session(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    timer = StageTimer(STAGE_SECONDS, route="/message")
+    with IN_FLIGHT.track(route="/message"):
+        try:
+            return await answer(user_input, timer, session_id)
+        finally:
+            timer.finish()
+
+
+async def answer(user_input, timer, session_id=None):
+    try:
+        prompt, messages = await chat_messages(user_input, timer, session_id)
+        cache = services.response_cache
+        sessions = services.sessions
+        extra = {}
+        if cache is not None:
+            with timer.stage("cache"):
+                cache_key = response_cache_key(MODEL_NAME, prompt, messages, user_input, SAMPLING_PARAMS)
+                cached = await in_thread(cache.get, cache_key)
+            if cached is not None:
+                log_event(logger, "chat.reply", session_id=session_id, cache="hit", user_input=user_input,
+                          response=cached)
+                services.tracer.trace(
+                    name="message",
+                    input=user_input,
+                    output=cached,
+                    session_id=session_id,
+                    tags=["cache-hit"],
+                    metadata={"prompt_name": PROMPT_NAME, "prompt_version": getattr(prompt, "version", None),
+                              "cache": "hit"},
+                )
+                if session_id is not None:
+                    await in_thread(sessions.record, session_id, user_input, cached)
+                return reply(cached, session_id)
+            extra["tags"] = ["cache-miss"]
+
+        started_at = None
+        try:
+            if services.admission is not None:
+                with timer.stage("admission"):
+                    started_at = await admit()
+            with timer.stage("upstream"):
+                response = await services.ollama.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=messages,
+                    metadata={"prompt_name": PROMPT_NAME},
+                    **SAMPLING_PARAMS,
+                    **extra,
+                )
+        except Overloaded as e:
+            return refuse(e)
+        except Exception as e:
+            UPSTREAM_ERRORS.inc(error=type(e).__name__)
+            raise
+        finally:
+            if started_at is not None:
+                services.admission.release(started_at)
+        response_text = response.choices[0].message.content
+        log_event(logger, "chat.reply", session_id=session_id, prompt_version=getattr(prompt, "version", None),
+                  user_input=user_input, response=response_text)
+        if cache is not None and response_text:
+            await in_thread(cache.set, cache_key, response_text)
+        if session_id is not None and response_text:
+            await in_thread(sessions.record, session_id, user_input, response_text)
+        return reply(response_text, session_id)
+    except Exception as e:
+        logger.error(f"Error during chat completion: {e}", exc_info=True)
+        return jsonify({"error": ERROR_MESSAGE}), 500
+
+
+@app.route("/message/stream", methods=["POST"])
+async def message_stream():
+    body = await request.get_json() or {}
+    user_input = body.get("message")
+    if not user_input:
+        return jsonify({"error": "No message provided."}), 400
+    try:
+        session_id = await resume_session(body)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    timer = StageTimer(STAGE_SECONDS, route="/message/stream")
+    trace_id = str(uuid.uuid4())
+    cache = services.response_cache
+    cache_key = cached = None
+    # The admission slot is held until the stream ends or is closed
+    admitted_at = []
+
+    def release():
+        if admitted_at:
+            services.admission.release(admitted_at.pop())
+
+    extra = {}
+    try:
+        prompt, messages = await chat_messages(user_input, timer, session_id)
+        if cache is not None:
+            with timer.stage("cache"):
+                cache_key = response_cache_key(MODEL_NAME, prompt, messages, user_input, SAMPLING_PARAMS)
+                cached = await in_thread(cache.get, cache_key)
+            extra["tags"] = ["cache-miss" if cached is None else "cache-hit"]
+        if cached is not None:
+            stream = CachedStream(cached)
+        else:
+            if services.admission is not None:
+                with timer.stage("admission"):
+                    admitted_at.append(await admit())
+            try:
+                with timer.stage("upstream"):
+                    stream = await services.ollama.chat.completions.create(
+                        model=MODEL_NAME,
+                        messages=messages,
+                        metadata={"prompt_name": PROMPT_NAME},
+                        stream=True,
+                        **SAMPLING_PARAMS,
+                        trace_id=trace_id,
+                        **extra,
+                    )
+            except Exception as e:
+                UPSTREAM_ERRORS.inc(error=type(e).__name__)
+                raise
+    except Overloaded as e:
+        timer.finish()
+        return refuse(e)
+    except asyncio.CancelledError:
+        release()
+        raise
+    except Exception as e:
+        release()
+        timer.finish()
+        logger.error(f"Error starting streamed chat completion: {e}", exc_info=True)
+        return jsonify({"error": ERROR_MESSAGE}), 500
+
+    def record(result):
+        release()
+        if result.time_to_first_token is not None:
+            timer.record("first_token", result.time_to_first_token)
+        timer.finish()
+        log_event(logger, "chat.stream_reply", trace_id=trace_id, session_id=session_id, status=result.status,
+                  user_input=user_input, response=result.text, **result.timings())
+        # Runs on the loop and cannot await; the writes go to a thread
+        completed = result.status == 'completed' and result.text
+        if session_id is not None and completed:
+            in_thread(services.sessions.record, session_id, user_input, result.text)
+        if cache_key is not None and cached is None and completed:
+            in_thread(cache.set, cache_key, result.text)
+        services.tracer.trace(
+            id=trace_id,
+            name="message-stream",
+            input=user_input,
+            output=result.text,
+            session_id=session_id,
+            metadata=dict(result.timings(), stream_status=result.status, stream_error=result.error,
+                          timings_ms=timer.timings_ms()),
+            **extra,
+        )
+
+    stream = AsyncCompletionStream(stream, on_finish=record, started_at=timer.started_at)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if session_id is not None:
+        headers["X-Session-Id"] = session_id
+    response = Response(stream.events(), mimetype="text/event-stream", headers=headers)
+    # Streams may legitimately outlive Quart's default response timeout
+    response.timeout = None
+    return response
+
+
+@app.route("/prompts", methods=["GET"])
+async def display_prompts():
+    # Served from the local PromptTree; pollers revalidate with If-None-Match
+    etag = services.prompt_manager.revision_tag
+    if request.if_none_match.contains(etag):
+        return Response("", status=304, headers={"ETag": f'"{etag}"'})
+
+    try:
+        prompts, headers = prompts_page(services.prompt_manager, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error listing prompts: {e}", exc_info=True)
+        return "An error occurred while fetching prompts. Please try again later.", 500
+
+    response = jsonify(prompts)
+    response.headers.update(headers)
+    response.set_etag(etag)
+    return response
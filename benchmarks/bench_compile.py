@@ -0,0 +1,64 @@
+"""Micro-benchmark of the /message prompt path: compile per request vs memoized.
+
+Both paths resolve the latest prompt through a warm PromptTree. "compile"
+is what the route used to do, compiling the Langfuse template on every
+request; "memoized" serves the compiled text from get_compiled_prompt.
+Prompts are real Langfuse TextPromptClients, so compile() does its actual
+template work.
+
+    python -m benchmarks.bench_compile --template-words 400 --number 20000
+"""
+import argparse
+import os
+import tempfile
+import timeit
+
+from langfuse.api.resources.prompts.types import Prompt_Text
+from langfuse.model import TextPromptClient
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.chat import PROMPT_NAME, PROMPT_VARIABLES, build_messages
+from promptpilot.versioning.tree import PromptTree
+
+
+def make_template(words):
+    filler = " ".join(f"word{i}" for i in range(words))
+    return f"You are an {{{{criticLevel}}}} movie critic. {filler} Review {{{{movie}}}} in depth."
+
+
+class LangfuseTextPrompts(FakeLangfuse):
+    # Hand out real TextPromptClients instead of the fake's string replace
+    def get_prompt(self, name, version=None, **kwargs):
+        fake = super().get_prompt(name, version, **kwargs)
+        return TextPromptClient(Prompt_Text(name=fake.name, version=fake.version, prompt=fake.prompt,
+                                            config=fake.config, labels=[], tags=[]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--template-words', type=int, default=400)
+    parser.add_argument('--number', type=int, default=20000, help="requests per timing run")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        langfuse = LangfuseTextPrompts()
+        tree = PromptTree(langfuse, os.path.join(tmp, 'prompt_history.json'), sync_on_init='never')
+        tree.create_prompt(PROMPT_NAME, make_template(args.template_words), {})
+
+        def compile_each_time():
+            return build_messages(tree.get_latest_prompt(PROMPT_NAME), "What about Inception?")
+
+        def memoized():
+            prompt, system_prompt = tree.get_compiled_prompt(PROMPT_NAME, **PROMPT_VARIABLES)
+            return build_messages(prompt, "What about Inception?", system_prompt)
+
+        assert compile_each_time() == memoized()
+        for label, fn in (("compile", compile_each_time), ("memoized", memoized)):
+            best = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+            print(f"{label:<9} {best / args.number * 1e6:8.2f} us/request")
+
+
+if __name__ == '__main__':
+    main()
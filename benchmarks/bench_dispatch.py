@@ -0,0 +1,82 @@
+"""Bursts of /message completions: direct calls vs the ChatDispatcher.
+
+A fake Ollama with ``--parallel`` slots answers each completion after
+``--latency`` seconds. Each burst fires ``--burst`` requests at once from
+as many threads, drawn from ``--distinct`` different questions, and is
+sent directly, through the dispatcher, and through the dispatcher with a
+``--max-wait-ms`` batching window.
+
+    python -m benchmarks.bench_dispatch --burst 64 --distinct 16 --latency 0.2 --parallel 4
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import statistics
+import time
+
+import httpx
+import openai
+
+from benchmarks.fake_ollama import FakeOllama, serve_in_thread
+from promptpilot.serving.dispatch import ChatDispatcher
+
+
+def run_burst(create, burst, distinct):
+    def one(i):
+        start = time.perf_counter()
+        create(model="smollm2", messages=[{"role": "user", "content": f"question {i % distinct}"}])
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=burst) as executor:
+        latencies = sorted(executor.map(one, range(burst)))
+    return {
+        "wall_s": time.perf_counter() - start,
+        "p50_s": statistics.median(latencies),
+        "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--burst', type=int, default=64)
+    parser.add_argument('--distinct', type=int, default=16, help="different questions in a burst")
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--parallel', type=int, default=4, help="fake Ollama slots")
+    parser.add_argument('--concurrency', type=int, default=4, help="dispatcher workers")
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    ollama = FakeOllama(latency=args.latency, parallel=args.parallel)
+    url, stop = serve_in_thread(ollama)
+    client = openai.OpenAI(base_url=f"{url}/v1", api_key="ollama", max_retries=0,
+                           http_client=httpx.Client(limits=httpx.Limits(max_connections=args.burst), timeout=60))
+    create = client.chat.completions.create
+
+    results = {}
+    for label, dispatcher in (
+            ("direct", None),
+            ("dispatch", ChatDispatcher(create, concurrency=args.concurrency)),
+            ("dispatch+batch", ChatDispatcher(create, max_wait=args.max_wait_ms / 1000,
+                                              max_batch_size=args.concurrency, concurrency=args.concurrency))):
+        before = ollama.requests
+        stats = run_burst(dispatcher.complete if dispatcher else create, args.burst, args.distinct)
+        stats["upstream_requests"] = ollama.requests - before
+        results[label] = stats
+        print(f"{label:<15} {stats['upstream_requests']:>4} upstream  wall={stats['wall_s']:.3f}s  "
+              f"p50={stats['p50_s']:.3f}s p95={stats['p95_s']:.3f}s")
+        if dispatcher is not None:
+            dispatcher.close()
+    stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
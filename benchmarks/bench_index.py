@@ -0,0 +1,82 @@
+"""Micro-benchmark of PromptTree lookups: linear scans vs TreeIndex.
+
+    python -m benchmarks.bench_index --names 1000 --versions 100
+"""
+import argparse
+import random
+import timeit
+
+from promptpilot.versioning.index import TreeIndex
+
+
+def build_tree(names, versions):
+    tree = {"prompts": {}}
+    for i in range(names):
+        name = f"prompt-{i}"
+        tree["prompts"][name] = [
+            {
+                "id": f"{name}_v{v}",
+                "name": name,
+                "version": v,
+                "parent_id": f"{name}_v{v - 1}" if v > 1 else None,
+                "created_at": "2024-01-01T00:00:00+00:00",
+            }
+            for v in range(1, versions + 1)
+        ]
+    return tree
+
+
+# The scans PromptTree used before the index existed
+def scan_by_id(tree, prompt_id):
+    for prompts in tree["prompts"].values():
+        for prompt in prompts:
+            if prompt["id"] == prompt_id:
+                return prompt
+    return None
+
+
+def scan_next_version(tree, name):
+    versions = [p['version'] for p in tree['prompts'].get(name, [])]
+    return max(versions, default=0) + 1
+
+
+def scan_latest(tree, name):
+    return sorted(tree['prompts'][name], key=lambda x: x['version'], reverse=True)[0]
+
+
+def bench(label, func, args, number):
+    seconds = timeit.timeit(lambda: [func(*a) for a in args], number=number)
+    per_call = seconds / (number * len(args)) * 1e6
+    print(f"{label:<28} {per_call:12.3f} us/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--names', type=int, default=1000)
+    parser.add_argument('--versions', type=int, default=100)
+    parser.add_argument('--lookups', type=int, default=200)
+    args = parser.parse_args()
+
+    tree = build_tree(args.names, args.versions)
+    rng = random.Random(0)
+    names = [f"prompt-{rng.randrange(args.names)}" for _ in range(args.lookups)]
+    ids = [(f"{name}_v{rng.randint(1, args.versions)}",) for name in names]
+    names = [(name,) for name in names]
+
+    build = timeit.timeit(lambda: TreeIndex(tree), number=1)
+    index = TreeIndex(tree)
+    print(f"{args.names * args.versions} versions, index built in {build:.3f}s")
+
+    bench("scan get_prompt_by_id", lambda pid: scan_by_id(tree, pid), ids, 1)
+    bench("index get_prompt_by_id", index.get, ids, 100)
+    bench("scan get_next_version", lambda n: scan_next_version(tree, n), names, 10)
+    bench("index get_next_version", index.next_version, names, 100)
+    bench("scan latest", lambda n: scan_latest(tree, n), names, 10)
+    bench("index latest", index.latest.get, names, 100)
+    leaf = f"prompt-0_v{args.versions}"
+    bench("index ancestors (depth)", index.ancestors, [(leaf,)], 10)
+    bench("index path", index.path, [(leaf, "prompt-0_v1")], 10)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Memory and load time of the node layouts: plain dicts vs PromptNode.
+
+    python -m benchmarks.bench_memory --sizes 100000 1000000
+"""
+import argparse
+from datetime import datetime, timedelta, timezone
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from promptpilot.versioning.content import content_hash
+from promptpilot.versioning.node import compact_tree
+from promptpilot.versioning.storage import JsonFileStorage
+
+
+def prompt_content(name, version):
+    # A short system prompt, distinct per version like real edits
+    return (f"You are a {{{{criticLevel}}}} movie critic ({name}, revision {version}). Review {{{{movie}}}} "
+            "in a few sentences: plot, pacing and performances, without spoilers.")
+
+
+def build_history(names, versions):
+    # Nodes as PromptTree writes them: microsecond timestamps, the content
+    # and its hash
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    tree = {"prompts": {}}
+    for i in range(names):
+        name = f"prompt-{i}"
+        tree["prompts"][name] = []
+        for v in range(1, versions + 1):
+            content = prompt_content(name, v)
+            tree["prompts"][name].append({
+                "id": f"{name}_v{v}",
+                "name": name,
+                "version": v,
+                "parent_id": f"{name}_v{v - 1}" if v > 1 else None,
+                "created_at": (start + timedelta(seconds=i * versions + v, microseconds=v)).isoformat(),
+                "content_hash": content_hash(content),
+                "content": content,
+            })
+    return tree
+
+
+def load(path, compact):
+    tree = JsonFileStorage(path).load()
+    return compact_tree(tree) if compact else tree
+
+
+def measure(path, compact):
+    gc.collect()
+    start = time.perf_counter()
+    tree = load(path, compact)
+    seconds = time.perf_counter() - start
+    del tree
+
+    # Traced separately: tracemalloc slows allocation down several times
+    gc.collect()
+    tracemalloc.start()
+    tree = load(path, compact)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tree, seconds, size, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--versions', type=int, default=100, help="versions per prompt name")
+    args = parser.parse_args()
+
+    print(f"{'nodes':>9} {'layout':<8} {'load':>8} {'retained':>10} {'peak':>10} {'per node':>9}")
+    for size in args.sizes:
+        history = build_history(max(size // args.versions, 1), min(args.versions, size))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'prompt_history.json')
+            JsonFileStorage(path).save(history)
+            del history
+            for label, compact in (("dict", False), ("compact", True)):
+                tree, seconds, retained, peak = measure(path, compact)
+                print(f"{size:>9} {label:<8} {seconds:>7.2f}s {retained / 2 ** 20:>8.1f}MB "
+                      f"{peak / 2 ** 20:>8.1f}MB {retained / size:>8.0f}B")
+                if compact:
+                    # The compact tree must write back the very same file
+                    copy = os.path.join(tmp, 'copy.json')
+                    JsonFileStorage(copy).save(tree)
+                    with open(path, 'rb') as a, open(copy, 'rb') as b:
+                        assert a.read() == b.read(), "compact layout changed the JSON format"
+                del tree
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Overhead of the /message instrumentation.
+
+Times what the route adds per request (a StageTimer with four stages,
+the in-flight gauge and the request and token counters) on its own, and
+a whole /message round trip through the Flask test client against an
+instant fake Ollama, so the first can be read as a share of the second.
+A real Ollama call adds hundreds of milliseconds on top, so this is an
+upper bound on the relative cost.
+
+    python -m benchmarks.bench_metrics --number 5000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import timeit
+from types import SimpleNamespace
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.metrics import Registry, StageTimer
+from promptpilot.versioning.tree import PromptTree
+
+
+def instrumentation():
+    registry = Registry()
+    stages = registry.histogram("chat_stage_seconds", "Stages", ["stage"])
+    in_flight = registry.gauge("chat_requests_in_flight", "In flight", ["route"])
+    requests = registry.counter("chat_requests_total", "Requests", ["route", "status"])
+    tokens = registry.counter("chat_tokens_total", "Tokens", ["kind"])
+
+    def per_request():
+        timer = StageTimer(stages)
+        with in_flight.track(route="/message"):
+            for stage in ("prompt", "upstream", "serialize"):
+                with timer.stage(stage):
+                    pass
+            tokens.inc(12, kind="prompt")
+            tokens.inc(40, kind="completion")
+            timer.finish()
+            timer.timings_ms()
+        requests.inc(route="/message", status=200)
+
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    from app import app as app_module
+
+    completion = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="A fine film."))],
+                                 usage=SimpleNamespace(prompt_tokens=12, completion_tokens=40))
+    with tempfile.TemporaryDirectory() as tmp:
+        langfuse = FakeLangfuse()
+        tree = PromptTree(langfuse, os.path.join(tmp, 'prompt_history.json'), sync_on_init='never')
+        tree.create_prompt(app_module.prompt_name, "You are a {{criticLevel}} critic of {{movie}}.", {})
+        app_module.prompt_manager = tree
+        app_module.langfuse_client = SimpleNamespace(trace=lambda **kwargs: None)
+        app_module.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **kwargs: completion)))
+        client = app_module.app.test_client()
+
+        def request():
+            client.post("/message", json={"message": "What about Inception?"})
+
+        timings = {}
+        for label, fn in (("instrumentation", instrumentation()), ("request", request)):
+            number = args.number if label == "request" else args.number * 10
+            timings[label] = min(timeit.repeat(fn, number=number, repeat=args.repeat)) / number * 1e6
+            print(f"{label:<16} {timings[label]:8.2f} us")
+        print(f"overhead         {timings['instrumentation'] / timings['request']:8.1%} of an instant-Ollama request")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Load test of /message: the Flask app vs the ASGI app.
+
+Both apps talk to the same fake Ollama, which answers after ``--latency``
+seconds, and read prompts from a fake Langfuse. Flask runs on a
+``--flask-threads`` worker pool, as it would under a threaded WSGI server;
+the ASGI app runs on hypercorn. Each concurrency level is driven for
+``--duration`` seconds by that many clients sending requests back to back.
+``--ollama-parallel`` caps the fake Ollama's concurrent completions, and
+``--admission N`` puts the Flask app behind an admission controller with N
+slots, so saturation can be compared with and without it.
+
+    python -m benchmarks.bench_serving --latency 2 --concurrency 1 16 64 --duration 8
+    python -m benchmarks.bench_serving --servers flask --latency 0.5 --ollama-parallel 4 \
+        --flask-threads 64 --concurrency 64 --admission 4
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+import httpx
+import openai
+from werkzeug.serving import BaseWSGIServer
+
+from benchmarks.fake_langfuse import AsyncFakeLangfuse, FakeLangfuse
+from benchmarks.fake_ollama import FakeOllama, serve_in_thread
+from promptpilot.serving.admission import AdmissionController
+from promptpilot.serving.chat import PROMPT_NAME
+from promptpilot.versioning.async_tree import AsyncPromptTree
+from promptpilot.versioning.tree import PromptTree
+
+PROMPT = "You are a {{criticLevel}} movie critic. Review {{movie}}."
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug server handing connections to a fixed pool of threads."""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve_flask(ollama_url, tmp, threads, admission=None):
+    from app import app as flask_app
+
+    flask_app.admission = admission
+    langfuse = FakeLangfuse()
+    langfuse.create_prompt(PROMPT_NAME, PROMPT)
+    flask_app.prompt_manager = PromptTree(langfuse, os.path.join(tmp, 'flask_history.json'))
+    flask_app.client = openai.OpenAI(base_url=f"{ollama_url}/v1", api_key="ollama", max_retries=0)
+
+    server = PooledWSGIServer('127.0.0.1', 0, flask_app.app, threads)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.pool.shutdown(wait=False, cancel_futures=True)
+
+    return f"http://127.0.0.1:{server.server_port}", stop
+
+
+def serve_asgi(ollama_url, tmp, max_connections):
+    from app import asgi
+
+    langfuse = AsyncFakeLangfuse()
+    langfuse._create_prompt(PROMPT_NAME, PROMPT, {}, ["production"], [])
+    # The clients the app builds at startup, minus Langfuse tracing
+    asgi.services.ollama = openai.AsyncOpenAI(
+        base_url=f"{ollama_url}/v1", api_key="ollama", max_retries=0,
+        http_client=httpx.AsyncClient(timeout=httpx.Timeout(asgi.OLLAMA_TIMEOUT, connect=5),
+                                      limits=httpx.Limits(max_connections=max_connections,
+                                                          max_keepalive_connections=max_connections)))
+    asgi.services.langfuse_api = langfuse
+    asgi.services.prompt_manager = AsyncPromptTree(langfuse, os.path.join(tmp, 'asgi_history.json'))
+    return serve_in_thread(asgi.app)
+
+
+async def drive(url, concurrency, duration, timeout):
+    latencies = []
+    errors = 0
+    rejected = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal errors, rejected
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/message", json={"message": "What about Inception?"})
+                    if response.status_code in (429, 503):
+                        # Refused by admission control; back off as told
+                        rejected += 1
+                        await asyncio.sleep(min(float(response.headers.get("Retry-After", 1)), 0.1))
+                        continue
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else None
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rejected": rejected,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_s": statistics.median(latencies) if latencies else None,
+        "p95_s": percentile(0.95),
+        "p99_s": percentile(0.99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.5, help="fake Ollama seconds per completion")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64, 256])
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per concurrency level")
+    parser.add_argument('--flask-threads', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30.0, help="client timeout per request")
+    parser.add_argument('--servers', nargs='+', choices=['flask', 'asgi'], default=['flask', 'asgi'])
+    parser.add_argument('--ollama-parallel', type=int, help="fake Ollama concurrent completions")
+    parser.add_argument('--admission', type=int, help="Flask admission controller slots")
+    parser.add_argument('--admission-queue', type=int, default=8)
+    parser.add_argument('--admission-wait', type=float, default=2.0, help="seconds a request may queue")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+    # Request logging from the apps would dominate the measurement
+    logging.disable(logging.CRITICAL)
+
+    ollama_url, stop_ollama = serve_in_thread(FakeOllama(latency=args.latency, parallel=args.ollama_parallel))
+    admission = None
+    if args.admission:
+        admission = AdmissionController(max_concurrency=args.admission, max_queue=args.admission_queue,
+                                        max_wait=args.admission_wait)
+    servers = {
+        "flask": lambda: serve_flask(ollama_url, tmp, args.flask_threads, admission),
+        "asgi": lambda: serve_asgi(ollama_url, tmp, max(args.concurrency)),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in args.servers:
+            start_server = servers[label]
+            url, stop = start_server()
+            results[label] = []
+            for concurrency in args.concurrency:
+                stats = asyncio.run(drive(url, concurrency, args.duration, args.timeout))
+                results[label].append(stats)
+                print(f"{label:<6} c={concurrency:<5} {stats['throughput_rps']:>8.1f} req/s  "
+                      f"p50={stats['p50_s'] or 0:.3f}s p95={stats['p95_s'] or 0:.3f}s "
+                      f"p99={stats['p99_s'] or 0:.3f}s errors={stats['errors']} rejected={stats['rejected']}")
+            stop()
+    stop_ollama()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Per-turn /message latency as a conversation grows.
+
+One conversation of ``--turns`` turns goes through the Flask test client,
+once with an unbounded history (what a client resending the whole
+conversation gets) and once with the server's ``--budget`` tokens of
+history. The fake model's latency grows with the prompt, ``--base-ms`` plus
+``--per-token-ms`` per prompt token, as prefill does on a real one.
+
+    python -m benchmarks.bench_sessions --turns 40 --budget 1500
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.chat import PROMPT_NAME
+from promptpilot.serving.sessions import SessionStore, estimate_tokens
+from promptpilot.versioning.tree import PromptTree
+
+PROMPT = "You are a {{criticLevel}} movie critic. Review {{movie}}."
+REPLY = " ".join(["The pacing holds up and the third act lands."] * 6)
+
+
+def fake_create(base_ms, per_token_ms, prompt_tokens):
+    def create(**kwargs):
+        tokens = sum(estimate_tokens(message["content"]) for message in kwargs["messages"])
+        prompt_tokens.append(tokens)
+        time.sleep((base_ms + per_token_ms * tokens) / 1000)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=REPLY))], usage=None)
+    return create
+
+
+def converse(app_module, store, turns, base_ms, per_token_ms):
+    prompt_tokens = []
+    app_module.sessions = store
+    app_module.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=fake_create(base_ms, per_token_ms, prompt_tokens))))
+    client = app_module.app.test_client()
+    session_id, rows = None, []
+    for turn in range(1, turns + 1):
+        start = time.perf_counter()
+        response = client.post("/message", json={"message": f"Turn {turn}: what about the score?",
+                                                 "session_id": session_id})
+        latency = time.perf_counter() - start
+        session_id = response.get_json()["session_id"]
+        rows.append({"turn": turn, "prompt_tokens": prompt_tokens[-1], "latency_ms": round(latency * 1000, 2)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--turns', type=int, default=40)
+    parser.add_argument('--budget', type=int, default=1500, help="server history budget, in tokens")
+    parser.add_argument('--base-ms', type=float, default=20.0)
+    parser.add_argument('--per-token-ms', type=float, default=0.05)
+    parser.add_argument('--every', type=int, default=5, help="print every Nth turn")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    from app import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmp:
+        langfuse = FakeLangfuse()
+        langfuse.create_prompt(PROMPT_NAME, PROMPT)
+        app_module.prompt_manager = PromptTree(langfuse, os.path.join(tmp, 'prompt_history.json'))
+        app_module.langfuse_client = SimpleNamespace(trace=lambda **kwargs: None)
+        app_module.response_cache = None
+        results = {
+            "unbounded": converse(app_module, SessionStore(max_history_tokens=10 ** 9), args.turns,
+                                  args.base_ms, args.per_token_ms),
+            "budget": converse(app_module, SessionStore(max_history_tokens=args.budget), args.turns,
+                               args.base_ms, args.per_token_ms),
+        }
+
+    print(f"{'turn':>5} {'unbounded tokens':>17} {'ms':>8} {'budget tokens':>14} {'ms':>8}")
+    for unbounded, budget in zip(results["unbounded"], results["budget"]):
+        if unbounded["turn"] % args.every and unbounded["turn"] != 1:
+            continue
+        print(f"{unbounded['turn']:>5} {unbounded['prompt_tokens']:>17} {unbounded['latency_ms']:>8.1f} "
+              f"{budget['prompt_tokens']:>14} {budget['latency_ms']:>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
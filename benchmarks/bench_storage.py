@@ -0,0 +1,58 @@
+"""Load and append cost of the PromptTree storage backends.
+
+    python -m benchmarks.bench_storage --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.bench_index import build_tree
+from promptpilot.versioning.storage import JournalStorage, JsonFileStorage
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench(storage, tree, appends):
+    storage.save(tree)
+    name = next(iter(tree["prompts"]))
+    nodes = tree["prompts"][name]
+    append = 0.0
+    for _ in range(appends):
+        version = nodes[-1]["version"] + 1
+        node = {"id": f"{name}_v{version}", "name": name, "version": version,
+                "parent_id": nodes[-1]["id"], "created_at": "2024-01-01T00:00:00+00:00"}
+        nodes.append(node)
+        append += timed(storage.append, tree, [node])
+    load = timed(storage.load)
+    for _ in range(appends):
+        nodes.pop()
+    return append / appends, load
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--versions', type=int, default=100, help="versions per prompt name")
+    parser.add_argument('--appends', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'nodes':>9} {'backend':<8} {'append':>12} {'load':>10}")
+    for size in args.sizes:
+        tree = build_tree(max(size // args.versions, 1), min(args.versions, size))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'prompt_history.json')
+            for label, storage in (("json", JsonFileStorage(path)),
+                                   ("journal", JournalStorage(path, compact_every=10 ** 9))):
+                append, load = bench(storage, tree, args.appends)
+                print(f"{size:>9} {label:<8} {append * 1e3:>10.2f}ms {load:>9.3f}s")
+                if hasattr(storage, 'close'):
+                    storage.close()
+
+
+if __name__ == '__main__':
+    main()
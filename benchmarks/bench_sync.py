@@ -0,0 +1,42 @@
+"""Compare sequential and pooled PromptTree.sync_with_langfuse.
+
+    python -m benchmarks.bench_sync --prompts 50 --versions 10 --latency 0.02
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.tree import PromptTree
+
+
+def run(prompts, versions, latency, workers):
+    langfuse = FakeLangfuse(prompt_count=prompts, versions_per_prompt=versions, latency=latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        tree = PromptTree(langfuse, os.path.join(tmp, 'prompt_history.json'), max_workers=workers)
+        elapsed = time.perf_counter() - start
+    return elapsed, tree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--prompts', type=int, default=50)
+    parser.add_argument('--versions', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16, 32])
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in args.workers:
+        elapsed, tree = run(args.prompts, args.versions, args.latency, workers)
+        if baseline is None:
+            baseline = tree.tree
+        assert tree.tree == baseline, "sync produced a different tree"
+        print(f"workers={workers:>3}  sync={elapsed:7.3f}s  "
+              f"versions={args.prompts * args.versions}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""PromptTree benchmark suite against a latency-injecting fake Langfuse.
+
+    python -m benchmarks.bench_tree --prompts 50 --versions 20 --latency 0.005 \\
+        --output results.json --baseline benchmarks/baseline.json
+
+Every case is timed ``--runs`` times on a fresh temp directory and reported
+as per-operation seconds. Results are printed as a table and, with
+``--output``, written as JSON. With ``--baseline`` each case's median is
+compared with the stored one and the run exits with status 1 when any case
+is more than ``--tolerance`` slower; ``--update-baseline`` rewrites the
+baseline from this run instead.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.storage import JournalStorage, JsonFileStorage
+from promptpilot.versioning.tree import PromptTree
+
+STORAGES = {"json": JsonFileStorage, "journal": JournalStorage}
+
+
+class Case:
+    """Collects the timings of one benchmark case."""
+
+    def __init__(self):
+        self.samples = []
+        self.errors = 0
+
+    def time(self, func, *args, ops=1):
+        start = time.perf_counter()
+        try:
+            func(*args)
+        except Exception:
+            self.errors += 1
+        self.samples.append((time.perf_counter() - start) / ops)
+
+    def summary(self):
+        samples = sorted(self.samples)
+        return {
+            "runs": len(samples),
+            "errors": self.errors,
+            "min": samples[0],
+            "median": statistics.median(samples),
+            "mean": statistics.fmean(samples),
+            "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        }
+
+
+def make_tree(args, tmp, langfuse):
+    path = os.path.join(tmp, 'prompt_history.json')
+    return PromptTree(langfuse, path, max_workers=args.workers, storage=STORAGES[args.storage](path),
+                      sync_on_init='never')
+
+
+def make_langfuse(args):
+    return FakeLangfuse(prompt_count=args.prompts, versions_per_prompt=args.versions,
+                        latency=args.latency, failure_rate=args.failure_rate, seed=args.seed)
+
+
+def run_cases(args):
+    cases = {name: Case() for name in (
+        "sync_full", "sync_incremental", "create_prompt", "get_prompt_by_id",
+        "get_latest_prompt_cold", "get_latest_prompt_warm", "load_tree", "save_tree")}
+    langfuse_calls = {"calls": 0, "failures": 0}
+    rng = random.Random(args.seed)
+    names = [f"prompt-{i}" for i in range(args.prompts)]
+    ids = [f"{name}_v{v}" for name in names for v in range(1, args.versions + 1)]
+
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            langfuse = make_langfuse(args)
+            tree = make_tree(args, tmp, langfuse)
+            cases["sync_full"].time(tree.sync_with_langfuse, False)
+            # Steady state: nothing changed in Langfuse since the last sync
+            cases["sync_incremental"].time(tree.sync_with_langfuse, True)
+
+            name = rng.choice(names)
+            # The latest version may be missing if the sync hit injected failures
+            latest = tree.index.get_latest(name)
+            cases["create_prompt"].time(tree.create_prompt, name, f"{name} benchmark {rng.random()}", {},
+                                        latest["id"] if latest else None)
+
+            lookups = [rng.choice(ids) for _ in range(args.lookups)]
+            cases["get_prompt_by_id"].time(lambda: [tree.get_prompt_by_id(i) for i in lookups],
+                                           ops=args.lookups)
+
+            tree.prompt_cache.invalidate()
+            cases["get_latest_prompt_cold"].time(tree.get_latest_prompt, name)
+            cases["get_latest_prompt_warm"].time(lambda: [tree.get_latest_prompt(name) for _ in range(args.lookups)],
+                                                 ops=args.lookups)
+
+            cases["save_tree"].time(tree.save_tree)
+            cases["load_tree"].time(tree.load_tree)
+            tree.storage.close()
+            langfuse_calls["calls"] += sum(langfuse.calls.values())
+            langfuse_calls["failures"] += langfuse.failures
+
+    return {name: case.summary() for name, case in cases.items()}, langfuse_calls
+
+
+def compare(results, baseline, tolerance, min_delta):
+    # A case regresses when its median is both relatively and absolutely slower
+    regressions = {}
+    for name, stats in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            continue
+        ratio = stats["median"] / before["median"] if before["median"] else float('inf')
+        if ratio > 1 + tolerance and stats["median"] - before["median"] > min_delta:
+            regressions[name] = {"baseline": before["median"], "median": stats["median"], "ratio": ratio}
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prompts', type=int, default=50, help="prompt names in the fake Langfuse")
+    parser.add_argument('--versions', type=int, default=20, help="versions per prompt name")
+    parser.add_argument('--latency', type=float, default=0.005, help="seconds added to every Langfuse call")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of Langfuse calls that fail")
+    parser.add_argument('--workers', type=int, default=8, help="PromptTree max_workers")
+    parser.add_argument('--storage', choices=sorted(STORAGES), default='json')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--lookups', type=int, default=1000, help="operations per run for the in-memory reads")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown per case")
+    parser.add_argument('--min-delta', type=float, default=1e-4,
+                        help="ignore slowdowns smaller than this many seconds")
+    parser.add_argument('--update-baseline', action='store_true', help="write this run to --baseline")
+    parser.add_argument('--log-level', default='CRITICAL',
+                        help="PromptTree logging; injected failures are logged at ERROR")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+
+    config = {key: getattr(args, key) for key in (
+        "prompts", "versions", "latency", "failure_rate", "workers", "storage", "runs", "lookups", "seed")}
+    results, langfuse_calls = run_cases(args)
+    report = {
+        "config": config,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "langfuse": langfuse_calls,
+        "results": results,
+    }
+
+    print(f"{'case':<24} {'median':>12} {'p95':>12} {'errors':>7}")
+    for name, stats in report["results"].items():
+        print(f"{name:<24} {stats['median'] * 1e3:>10.4f}ms {stats['p95'] * 1e3:>10.4f}ms {stats['errors']:>7}")
+    print(f"Langfuse calls: {langfuse_calls['calls']}, injected failures: {langfuse_calls['failures']}")
+
+    status = 0
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("Warning: baseline was recorded with a different configuration", file=sys.stderr)
+        report["regressions"] = compare(report["results"], baseline, args.tolerance, args.min_delta)
+        for name, regression in report["regressions"].items():
+            print(f"REGRESSION {name}: {regression['baseline'] * 1e3:.4f}ms -> "
+                  f"{regression['median'] * 1e3:.4f}ms ({regression['ratio']:.2f}x)")
+        status = 1 if report["regressions"] else 0
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Throughput of /message and /prompts as hypercorn worker processes are added.
+
+For each ``--workers`` count the Flask app (benchmarks.worker_app) is served
+by ``hypercorn --workers N`` against one fake Ollama that answers after
+``--latency`` seconds, and driven for ``--duration`` seconds by
+``--concurrency`` clients. All workers share one prompt history in leader
+mode. With a real Ollama the completions dominate; keep ``--latency`` low
+to see what the workers themselves can serve.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --latency 0.01 --duration 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.bench_serving import drive
+from benchmarks.fake_ollama import FakeOllama, _wait_for_port, serve_in_thread
+
+
+def serve_workers(workers, ollama_url, history_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PROMPT_HISTORY_PATH=history_path, FAKE_OLLAMA_URL=f"{ollama_url}/v1")
+    # The app's own prompt tree must not lead syncs of the working directory
+    env.pop('PROMPT_SYNC', None)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'hypercorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+         'benchmarks.worker_app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    _wait_for_port('127.0.0.1', port, timeout=30)
+    # Wait until the workers answer, and the prompt tree has synced
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/ready", timeout=5).status_code == 200:
+                break
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+
+    return url, stop
+
+
+async def drive_prompts(url, concurrency, duration, timeout):
+    completed = errors = 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal completed, errors
+            while time.perf_counter() < deadline:
+                try:
+                    (await client.get("/prompts", params={"limit": 50})).raise_for_status()
+                    completed += 1
+                except Exception:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {"requests": completed, "errors": errors, "throughput_rps": completed / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--latency', type=float, default=0.01, help="fake Ollama seconds per completion")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds per run")
+    parser.add_argument('--timeout', type=float, default=30.0, help="client timeout per request")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    ollama_url, stop_ollama = serve_in_thread(FakeOllama(latency=args.latency))
+    results = []
+    print(f"{os.cpu_count()} CPUs")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            url, stop = serve_workers(workers, ollama_url, os.path.join(tmp, 'prompt_history.json'))
+            try:
+                message = asyncio.run(drive(url, args.concurrency, args.duration, args.timeout))
+                prompts = asyncio.run(drive_prompts(url, args.concurrency, args.duration, args.timeout))
+            finally:
+                stop()
+        results.append({"workers": workers, "message": message, "prompts": prompts})
+        print(f"workers={workers:<3} /message {message['throughput_rps']:>8.1f} req/s "
+              f"p50={message['p50_s'] or 0:.3f}s p99={message['p99_s'] or 0:.3f}s errors={message['errors']}  "
+              f"/prompts {prompts['throughput_rps']:>8.1f} req/s errors={prompts['errors']}")
+    stop_ollama()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
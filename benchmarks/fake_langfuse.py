@@ -0,0 +1,183 @@
+"""In-process stand-in for the Langfuse client used by PromptTree.
+
+Only the surface PromptTree touches is implemented: ``client.prompts.list()``,
+``client.prompt_version.update()``, ``get_prompt`` and ``create_prompt``. Every call can be slowed down by a fixed
+latency and made to fail at a configurable rate, which is what the benchmarks
+and the concurrency tests need.
+"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import asyncio
+import random
+import threading
+import time
+
+
+class FakePromptMeta:
+    def __init__(self, name, versions, labels, tags, last_updated_at, last_config):
+        self.name = name
+        self.versions = versions
+        self.labels = labels
+        self.tags = tags
+        self.last_updated_at = last_updated_at
+        self.last_config = last_config
+
+
+class FakePromptClient:
+    def __init__(self, name, version, prompt, config):
+        self.name = name
+        self.version = version
+        self.prompt = prompt
+        self.config = config
+
+    def compile(self, **kwargs):
+        text = self.prompt
+        for key, value in kwargs.items():
+            text = text.replace("{{" + key + "}}", str(value))
+        return text
+
+
+class FakeLangfuseError(Exception):
+    pass
+
+
+class FakeLangfuse:
+    def __init__(self, prompt_count=0, versions_per_prompt=1, latency=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.client = SimpleNamespace(prompts=SimpleNamespace(list=self._list_prompts),
+                                      prompt_version=SimpleNamespace(update=self._update_labels))
+        self.calls = {"list": 0, "get_prompt": 0, "create_prompt": 0, "update_labels": 0}
+        self.failures = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prompts = {}  # name -> {version: (content, config)}
+        self._meta = {}  # name -> FakePromptMeta
+        self.labels = {}  # (name, label) -> version
+
+        epoch = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        for i in range(prompt_count):
+            name = f"prompt-{i}"
+            for version in range(1, versions_per_prompt + 1):
+                parent_id = f"{name}_v{version - 1}" if version > 1 else None
+                self._store(name, f"{name} content v{version} {{{{movie}}}}",
+                            {"parent_id": parent_id}, epoch + timedelta(minutes=version))
+
+    def _store(self, name, content, config, updated_at, labels=None, tags=None):
+        versions = self._prompts.setdefault(name, {})
+        version = max(versions, default=0) + 1
+        versions[version] = (content, config)
+        meta = self._meta.get(name)
+        if meta is None:
+            meta = FakePromptMeta(name, [], labels or [], tags or [], updated_at, config)
+            self._meta[name] = meta
+        meta.versions.append(version)
+        self.labels.update({(name, label): version for label in labels or []})
+        meta.last_updated_at = updated_at
+        meta.last_config = config
+        return version
+
+    def _call(self, kind):
+        fail = self._enter(kind)
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            if fail:
+                raise FakeLangfuseError(f"Simulated {kind} failure")
+        finally:
+            self._exit()
+
+    def _enter(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            fail = self.failure_rate and self._random.random() < self.failure_rate
+            self.failures += bool(fail)
+            return fail
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _list_prompts(self, **kwargs):
+        self._call("list")
+        return SimpleNamespace(data=self._snapshot())
+
+    def _snapshot(self):
+        with self._lock:
+            data = [
+                FakePromptMeta(m.name, list(m.versions), list(m.labels), list(m.tags),
+                               m.last_updated_at, m.last_config)
+                for m in self._meta.values()
+            ]
+        return data
+
+    def _update_labels(self, name, version, new_labels, **kwargs):
+        self._call("update_labels")
+        return self._relabel(name, version, new_labels)
+
+    def _relabel(self, name, version, labels):
+        with self._lock:
+            if version not in self._prompts.get(name, {}):
+                raise FakeLangfuseError(f"Version {version} of prompt '{name}' not found.")
+            self.labels.update({(name, label): version for label in labels})
+        return self._get_prompt(name, version)
+
+    def get_prompt(self, name, version=None, **kwargs):
+        self._call("get_prompt")
+        return self._get_prompt(name, version)
+
+    def _get_prompt(self, name, version):
+        with self._lock:
+            versions = self._prompts.get(name)
+            if not versions:
+                raise FakeLangfuseError(f"Prompt '{name}' not found.")
+            if version is None:
+                version = max(versions)
+            if version not in versions:
+                raise FakeLangfuseError(f"Version {version} of prompt '{name}' not found.")
+            content, config = versions[version]
+        return FakePromptClient(name, version, content, config)
+
+    def create_prompt(self, name, prompt, config=None, labels=None, tags=None, **kwargs):
+        self._call("create_prompt")
+        return self._create_prompt(name, prompt, config, labels, tags)
+
+    def _create_prompt(self, name, prompt, config, labels, tags):
+        with self._lock:
+            version = self._store(name, prompt, config or {}, datetime.now(timezone.utc), labels, tags)
+            content, config = self._prompts[name][version]
+        return FakePromptClient(name, version, content, config)
+
+
+class AsyncFakeLangfuse(FakeLangfuse):
+    """Same prompt store, exposed through the AsyncLangfuseClient interface."""
+
+    async def _acall(self, kind):
+        fail = self._enter(kind)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if fail:
+                raise FakeLangfuseError(f"Simulated {kind} failure")
+        finally:
+            self._exit()
+
+    async def list_prompts(self):
+        await self._acall("list")
+        return self._snapshot()
+
+    async def get_prompt(self, name, version=None, **kwargs):
+        await self._acall("get_prompt")
+        return self._get_prompt(name, version)
+
+    async def create_prompt(self, name, prompt, config=None, labels=None, tags=None, **kwargs):
+        await self._acall("create_prompt")
+        return self._create_prompt(name, prompt, config, labels, tags)
+
+    async def update_prompt_labels(self, name, version, labels):
+        await self._acall("update_labels")
+        return self._relabel(name, version, labels)
@@ -0,0 +1,213 @@
+"""Stand-in for the Langfuse public API, over HTTP.
+
+A bare ASGI app, like fake_ollama, that the real Langfuse SDK (and
+AsyncLangfuseClient) can be pointed at with LANGFUSE_HOST. It serves the
+routes PromptPilot uses: the v2 prompts API, trace listing and details, and
+batch ingestion of traces, generations and scores. Prompts live in a
+FakeLangfuse store, so a test can seed them the same way as in process;
+traces and scores are kept as they are ingested. Every request waits
+``latency`` seconds first, and credentials are not checked.
+
+    hypercorn benchmarks.fake_langfuse_api:app --bind 127.0.0.1:3000
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+import json
+import math
+from urllib.parse import parse_qs, unquote
+
+from benchmarks.fake_langfuse import FakeLangfuse, FakeLangfuseError
+
+PROMPTS = "/api/public/v2/prompts"
+TRACES = "/api/public/traces"
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_time(value):
+    at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return at if at.tzinfo else at.replace(tzinfo=timezone.utc)
+
+
+class FakeLangfuseAPI:
+    def __init__(self, prompts=None, latency=0.0):
+        self.prompts = prompts if prompts is not None else FakeLangfuse()
+        self.latency = latency
+        self.traces = {}  # id -> trace body, merged across upserts
+        self.observations = {}  # id -> generation or span body
+        self.scores = {}  # id -> score body
+        self._linked = defaultdict(lambda: ({}, {}))  # trace id -> (observation ids, score ids)
+        self.requests = 0
+        self.events = 0
+
+    def add_trace(self, trace_id, timestamp=None, **fields):
+        """Seed a trace, e.g. one for the evaluator to score."""
+        self._upsert(self.traces, dict(fields, id=trace_id, timestamp=timestamp or _now()))
+
+    def stats(self):
+        return {"requests": self.requests, "events": self.events, "traces": len(self.traces),
+                "observations": len(self.observations), "scores": len(self.scores)}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = unquote(scope["path"].rstrip("/"))
+        query = parse_qs(scope["query_string"].decode())
+        try:
+            status, payload = self._route(scope["method"], path, query, json.loads(body or b"{}"))
+        except FakeLangfuseError as e:
+            status, payload = 404, {"message": str(e)}
+        body = json.dumps(payload).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    def _route(self, method, path, query, payload):
+        if path == "/api/public/health":
+            return 200, {"status": "OK", "version": "fake"}
+        if path == "/api/public/ingestion" and method == "POST":
+            return 207, self._ingest(payload.get("batch", []))
+        if path == PROMPTS:
+            if method == "POST":
+                prompt = self.prompts._create_prompt(payload["name"], payload["prompt"], payload.get("config"),
+                                                     payload.get("labels"), payload.get("tags"))
+                return 200, self._prompt(prompt.name, prompt.version)
+            return 200, self._list_prompts(query)
+        if path.startswith(PROMPTS + "/"):
+            name, _, version = path[len(PROMPTS) + 1:].partition("/versions/")
+            if version and method == "PATCH":
+                self.prompts._relabel(name, int(version), payload.get("newLabels", []))
+                return 200, self._prompt(name, int(version))
+            return 200, self._prompt(name, self._resolve(name, query))
+        if path == TRACES:
+            return 200, self._list_traces(query)
+        if path.startswith(TRACES + "/"):
+            trace = self.traces.get(path[len(TRACES) + 1:])
+            if trace is None:
+                return 404, {"message": "Trace not found"}
+            return 200, self._trace(trace, details=True)
+        return 404, {"message": "Not found"}
+
+    def _resolve(self, name, query):
+        if "version" in query:
+            return int(query["version"][0])
+        label = query.get("label", ["production"])[0]
+        if label == "latest":
+            return None
+        version = self.prompts.labels.get((name, label))
+        if version is None:
+            raise FakeLangfuseError(f"Prompt '{name}' has no version labeled '{label}'.")
+        return version
+
+    def _prompt(self, name, version):
+        prompt = self.prompts._get_prompt(name, version)
+        labels = [label for (prompt_name, label), labeled in self.prompts.labels.items()
+                  if prompt_name == name and labeled == prompt.version]
+        meta = self.prompts._meta[name]
+        return {"name": name, "version": prompt.version, "type": "text", "prompt": prompt.prompt,
+                "config": prompt.config, "labels": labels, "tags": list(meta.tags)}
+
+    def _list_prompts(self, query):
+        data = [{"name": meta.name, "versions": meta.versions, "labels": meta.labels, "tags": meta.tags,
+                 "lastUpdatedAt": meta.last_updated_at.isoformat(), "lastConfig": meta.last_config}
+                for meta in self.prompts._snapshot()]
+        return self._page(data, query)
+
+    def _list_traces(self, query):
+        traces = sorted(self.traces.values(), key=lambda trace: trace["timestamp"], reverse=True)
+        tags = set(query.get("tags", []))
+        if tags:
+            traces = [trace for trace in traces if tags <= set(trace.get("tags") or [])]
+        for key, keep in (("fromTimestamp", lambda at, bound: at >= bound),
+                          ("toTimestamp", lambda at, bound: at < bound)):
+            if key in query:
+                bound = _parse_time(query[key][0])
+                traces = [trace for trace in traces if keep(_parse_time(trace["timestamp"]), bound)]
+        for key in ("name", "sessionId", "userId"):
+            if key in query:
+                traces = [trace for trace in traces if trace.get(key) == query[key][0]]
+        page = self._page(traces, query)
+        page["data"] = [self._trace(trace) for trace in page["data"]]
+        return page
+
+    def _trace(self, trace, details=False):
+        observations, scores = self._linked[trace["id"]]
+        observations, scores = list(observations), list(scores)
+        if details:
+            observations = [self.observations[observation_id] for observation_id in observations]
+            scores = [self.scores[score_id] for score_id in scores]
+        return dict(trace, htmlPath=f"/trace/{trace['id']}", latency=0.0, totalCost=0.0,
+                    observations=observations, scores=scores)
+
+    @staticmethod
+    def _page(data, query):
+        page = int(query.get("page", [1])[0])
+        limit = int(query.get("limit", [50])[0])
+        return {"data": data[(page - 1) * limit:page * limit],
+                "meta": {"page": page, "limit": limit, "totalItems": len(data),
+                         "totalPages": max(1, math.ceil(len(data) / limit))}}
+
+    def _ingest(self, batch):
+        successes = []
+        for event in batch:
+            self.events += 1
+            kind, body = event.get("type", ""), dict(event.get("body") or {})
+            if kind.startswith("trace"):
+                body.setdefault("timestamp", event.get("timestamp") or _now())
+                self._upsert(self.traces, body)
+            elif kind.startswith("score"):
+                body.setdefault("id", event["id"])
+                self._link(1, self._upsert(self.scores, self._score(body, event.get("timestamp") or _now())))
+            elif kind.startswith(("generation", "span", "event", "observation")):
+                self._link(0, self._upsert(self.observations, self._observation(kind, body)))
+            successes.append({"id": event.get("id"), "status": 201})
+        return {"successes": successes, "errors": []}
+
+    @staticmethod
+    def _upsert(records, body):
+        record = records.setdefault(body["id"], {})
+        record.update({key: value for key, value in body.items() if value is not None})
+        return record
+
+    def _link(self, kind, record):
+        if record.get("traceId"):
+            self._linked[record["traceId"]][kind][record["id"]] = None
+
+    @staticmethod
+    def _score(body, timestamp):
+        data_type = body.get("dataType") or ("NUMERIC" if isinstance(body.get("value"), (int, float)) else
+                                             "CATEGORICAL")
+        score = dict(body, dataType=data_type, source="API", timestamp=timestamp, createdAt=timestamp,
+                     updatedAt=timestamp)
+        if data_type == "CATEGORICAL":
+            score["stringValue"], score["value"] = str(body.get("value")), None
+        return score
+
+    @staticmethod
+    def _observation(kind, body):
+        observation = dict(body, type=kind.split("-")[0].upper(), level=body.get("level") or "DEFAULT")
+        if kind.endswith("create"):
+            observation.setdefault("startTime", _now())
+        return observation
+
+
+app = FakeLangfuseAPI()
@@ -0,0 +1,187 @@
+"""OpenAI-compatible stand-in for Ollama's /v1/chat/completions.
+
+A bare ASGI app, so it can be served by hypercorn next to the app under
+test. Every completion waits ``latency`` seconds before answering; streamed
+completions then send one chunk per word, ``token_delay`` apart. With
+``latency_sigma`` set the wait is drawn from a lognormal distribution with
+median ``latency`` instead, for the long tail a real model has. With
+``token_rate`` set, replies are generated at that many words a second,
+streamed or not. With
+``parallel`` set, only that many completions run at once and the rest
+queue, like Ollama's OLLAMA_NUM_PARALLEL slots. ``/api/ps`` lists the
+``loaded`` models, and while ``down`` is set every request gets a 503.
+
+    hypercorn benchmarks.fake_ollama:app --bind 127.0.0.1:11434
+"""
+import asyncio
+import json
+import math
+import random
+import socket
+import threading
+import time
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+
+class FakeOllama:
+    def __init__(self, latency=0.0, token_delay=0.0, reply="This is a fake answer from the model.",
+                 parallel=None, loaded=("smollm2:latest",), token_rate=None, latency_sigma=0.0, seed=None):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.token_rate = token_rate
+        self._random = random.Random(seed)
+        self.loaded = list(loaded)
+        self.down = False
+        self.parallel = parallel
+        self._slots = None
+        self.token_delay = token_delay
+        self.reply = reply
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        if self.down:
+            await self._send_json(send, 503, {"error": "unavailable"})
+            return
+        if scope["path"].rstrip("/") == "/api/ps":
+            await self._send_json(send, 200, {"models": [{"name": name, "model": name} for name in self.loaded]})
+            return
+        if scope["path"].rstrip("/") != "/v1/chat/completions" or scope["method"] != "POST":
+            await self._send_json(send, 404, {"error": "not found"})
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        payload = json.loads(body or b"{}")
+
+        self.requests += 1
+        if self.parallel and self._slots is None:
+            self._slots = asyncio.Semaphore(self.parallel)
+        if self._slots is not None:
+            async with self._slots:
+                await self._respond(send, payload)
+        else:
+            await self._respond(send, payload)
+
+    async def _respond(self, send, payload):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.first_token_delay())
+            if payload.get("stream"):
+                await self._stream(send, payload)
+            else:
+                if self.token_rate:
+                    await asyncio.sleep(len(self.reply.split(" ")) / self.token_rate)
+                await self._send_json(send, 200, self._completion(payload))
+        finally:
+            self.in_flight -= 1
+
+    def first_token_delay(self):
+        if self.latency_sigma and self.latency:
+            return self._random.lognormvariate(math.log(self.latency), self.latency_sigma)
+        return self.latency
+
+    def _completion(self, payload):
+        return {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": self.reply}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": len(self.reply.split()), "total_tokens": 0},
+        }
+
+    async def _stream(self, send, payload):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/event-stream")]})
+        words = self.reply.split(" ")
+        token_delay = 1 / self.token_rate if self.token_rate else self.token_delay
+        for i, word in enumerate(words):
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": payload.get("model", "fake"),
+                "choices": [{"index": 0, "finish_reason": None,
+                             "delta": {"role": "assistant", "content": word + (" " if i < len(words) - 1 else "")}}],
+            }
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(chunk)}\n\n".encode(),
+                        "more_body": True})
+            if token_delay:
+                await asyncio.sleep(token_delay)
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+    @staticmethod
+    async def _send_json(send, status, payload):
+        body = json.dumps(payload).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+app = FakeOllama()
+
+
+def serve_in_thread(asgi_app, host='127.0.0.1', port=0):
+    """Serve an ASGI app with hypercorn on a daemon thread.
+
+    Returns ``(base_url, stop)``; call ``stop()`` to shut the server down.
+    """
+    if port == 0:
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    config.accesslog = None
+    config.errorlog = None
+    config.backlog = 2048
+    config.keep_alive_timeout = 60
+
+    loop = asyncio.new_event_loop()
+    stopped = None
+    started = threading.Event()
+
+    async def run():
+        nonlocal stopped
+        stopped = asyncio.Event()
+        started.set()
+        await serve(asgi_app, config, shutdown_trigger=stopped.wait)
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(run(),), daemon=True)
+    thread.start()
+    started.wait()
+    _wait_for_port(host, port)
+
+    def stop():
+        loop.call_soon_threadsafe(stopped.set)
+        thread.join(timeout=10)
+
+    return f"http://{host}:{port}", stop
+
+
+def _wait_for_port(host, port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.02)
+    raise RuntimeError(f"Server on {host}:{port} did not start")
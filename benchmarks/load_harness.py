@@ -0,0 +1,347 @@
+"""End-to-end load test of the chat app and the evaluator, against local fakes.
+
+Brings up a fake Ollama (FakeOllama: lognormal first-token latency around
+``--ollama-latency``, replies of ``--reply-words`` words generated at
+``--ollama-token-rate`` words a second) and a fake Langfuse API
+(FakeLangfuseAPI: the chat prompt, ``--eval-traces`` traces tagged for the
+evaluator, and whatever the app and the evaluator ingest). The Flask app is
+served by ``hypercorn --workers N`` pointed at both (the multi-worker setup
+commented in app/Dockerfile; compose runs the single-process
+``python app/app.py``), and the evaluator module is imported in process with
+the same environment.
+
+Each scenario is driven open loop at its own target rate, all at once for
+``--duration`` seconds: ``message`` posts to /message, ``prompts`` gets
+/prompts, ``evaluator`` runs one pass of the evaluator loop. Latency is
+measured from when a request was due, not when it went out, so a backed-up
+server shows up as latency instead of a lower request rate; past
+``--max-in-flight`` outstanding requests a due request is dropped and
+counted. The report (p50/p95/p99 latency, throughput and error rates per
+scenario, plus what the fakes saw) is printed as JSON, or written to
+``--output``; ``--compare`` prints the change against an earlier report.
+
+    python -m benchmarks.load_harness --duration 30 --message-rps 20 --prompts-rps 50 --output release.json
+    python -m benchmarks.load_harness --duration 30 --message-rps 20 --compare release.json
+    python -m benchmarks.load_harness --app-url http://localhost:5001 --scenarios message prompts
+
+With ``--app-url`` an already running app is driven instead; it keeps
+talking to whatever Ollama and Langfuse it was started with.
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+import importlib
+import json
+import logging
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from benchmarks.fake_langfuse_api import FakeLangfuseAPI
+from benchmarks.fake_ollama import FakeOllama, _wait_for_port, serve_in_thread
+from promptpilot.serving.chat import PROMPT_NAME
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPT = "You are a {{criticLevel}} movie critic. Review {{movie}}."
+MOVIES = ["Inception", "Memento", "Tenet", "Interstellar", "Dunkirk", "Oppenheimer", "Insomnia", "Following"]
+EVAL_TAG = "ext_eval_pipelines"
+SCENARIOS = ("message", "prompts", "evaluator")
+
+
+def percentile(ordered, p):
+    # Nearest rank
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(len(ordered) * p) - 1))]
+
+
+async def run_open_loop(name, op, rps, duration, max_in_flight):
+    """Start ``op()`` every 1/``rps`` seconds for ``duration`` seconds.
+
+    ``op`` returns an HTTP status; 429 and 503 count as rejected, other
+    statuses from 400 up and exceptions as errors.
+    """
+    latencies, error_kinds = [], {}
+    counts = {"sent": 0, "ok": 0, "errors": 0, "rejected": 0, "dropped": 0}
+    tasks = set()
+
+    async def one(due):
+        try:
+            status = await op()
+        except Exception as e:
+            status = type(e).__name__
+        if isinstance(status, int) and status < 400:
+            counts["ok"] += 1
+            latencies.append(time.perf_counter() - due)
+            return
+        counts["rejected" if status in (429, 503) else "errors"] += 1
+        error_kinds[str(status)] = error_kinds.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    for i in range(int(rps * duration)):
+        due = start + i / rps
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) >= max_in_flight:
+            counts["dropped"] += 1
+            continue
+        counts["sent"] += 1
+        task = asyncio.ensure_future(one(due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    due = counts["sent"] + counts["dropped"]
+    return dict(
+        counts,
+        scenario=name,
+        target_rps=rps,
+        elapsed_s=round(elapsed, 3),
+        throughput_rps=counts["ok"] / elapsed if elapsed else 0.0,
+        error_rate=counts["errors"] / counts["sent"] if counts["sent"] else 0.0,
+        rejected_rate=counts["rejected"] / counts["sent"] if counts["sent"] else 0.0,
+        dropped_rate=counts["dropped"] / due if due else 0.0,
+        error_kinds=error_kinds,
+        latency_s={
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else None,
+            "mean": sum(latencies) / len(latencies) if latencies else None,
+        },
+    )
+
+
+def start_fakes(args):
+    ollama = FakeOllama(latency=args.ollama_latency, latency_sigma=args.ollama_latency_sigma,
+                        token_rate=args.ollama_token_rate, parallel=args.ollama_parallel,
+                        reply=" ".join(["word"] * args.reply_words), seed=args.seed)
+    langfuse = FakeLangfuseAPI(FakeLangfuse(), latency=args.langfuse_latency)
+    langfuse.prompts.create_prompt(PROMPT_NAME, PROMPT, {}, labels=["production"])
+    # Old enough for the evaluator's window, which ends at the current minute
+    at = (datetime.now(timezone.utc) - timedelta(minutes=10)).isoformat()
+    for i in range(args.eval_traces):
+        langfuse.add_trace(f"eval-{i}", timestamp=at, name="message", tags=[EVAL_TAG],
+                           input=f"What about {MOVIES[i % len(MOVIES)]}?", output="A fine film, well paced.")
+    ollama_url, stop_ollama = serve_in_thread(ollama)
+    langfuse_url, stop_langfuse = serve_in_thread(langfuse)
+
+    def stop():
+        stop_ollama()
+        stop_langfuse()
+
+    return ollama, langfuse, f"{ollama_url}/v1", langfuse_url, stop
+
+
+def stack_env(langfuse_url, ollama_url):
+    return {
+        "LANGFUSE_HOST": langfuse_url,
+        "LANGFUSE_PUBLIC_KEY": "pk-lf-load-test",
+        "LANGFUSE_SECRET_KEY": "sk-lf-load-test",
+        "OLLAMA_BASE_URL": ollama_url,
+    }
+
+
+def serve_app(langfuse_url, ollama_url, workers, cwd, timeout=60):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, **stack_env(langfuse_url, ollama_url))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")]))
+    env["PROMPT_SYNC"] = "leader" if workers > 1 else "background"
+    # A single fake Ollama; the router would only add health checks
+    env.pop("OLLAMA_BASE_URLS", None)
+    # The prompt history is written to the working directory
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'hypercorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', 'app.app:app'],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+
+    def stop():
+        process.terminate()
+        process.wait(timeout=30)
+
+    try:
+        _wait_for_port('127.0.0.1', port, timeout=timeout)
+        wait_until_ready(url, timeout)
+    except Exception:
+        stop()
+        raise
+    return url, stop
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/ready", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"App at {url} was not ready after {timeout}s")
+
+
+def load_evaluator(langfuse_url, ollama_url):
+    # The evaluator builds its clients from the environment at import
+    os.environ.update(stack_env(langfuse_url, ollama_url))
+    if "evaluator.evaluator" in sys.modules:
+        return importlib.reload(sys.modules["evaluator.evaluator"])
+    return importlib.import_module("evaluator.evaluator")
+
+
+def scenario_ops(args, http, evaluator):
+    rng = random.Random(args.seed)
+
+    async def message():
+        movie = rng.choice(MOVIES)
+        return (await http.post("/message", json={"message": f"What do you think of {movie}?"})).status_code
+
+    async def prompts():
+        return (await http.get("/prompts", params={"limit": 50})).status_code
+
+    async def evaluate():
+        await asyncio.to_thread(evaluator.evaluate_recent_traces, args.eval_traces)
+        return 200
+
+    return {"message": message, "prompts": prompts, "evaluator": evaluate}
+
+
+async def drive_all(args, app_url, evaluator):
+    rates = {"message": args.message_rps, "prompts": args.prompts_rps, "evaluator": args.evaluator_rps}
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(base_url=app_url or "http://unused", limits=limits, timeout=args.timeout) as http:
+        ops = scenario_ops(args, http, evaluator)
+        names = [name for name in args.scenarios if rates[name] > 0]
+        results = await asyncio.gather(*(run_open_loop(name, ops[name], rates[name], args.duration,
+                                                       args.max_in_flight) for name in names))
+    return dict(zip(names, results))
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(args):
+    ollama, langfuse, ollama_url, langfuse_url, stop_fakes = start_fakes(args)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            app_url, stop_app = args.app_url, None
+            if app_url is None and {"message", "prompts"} & set(args.scenarios):
+                app_url, stop_app = serve_app(langfuse_url, ollama_url, args.workers, tmp)
+            try:
+                evaluator = load_evaluator(langfuse_url, ollama_url) if "evaluator" in args.scenarios else None
+                started_at = datetime.now(timezone.utc).isoformat()
+                scenarios = asyncio.run(drive_all(args, app_url, evaluator))
+                if evaluator is not None:
+                    evaluator.langfuse_client.flush()
+            finally:
+                if stop_app is not None:
+                    stop_app()
+    finally:
+        stop_fakes()
+
+    return {
+        "label": args.label,
+        "revision": revision(),
+        "started_at": started_at,
+        "host": {"cpus": os.cpu_count(), "python": platform.python_version()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": scenarios,
+        "fakes": {
+            "ollama": {"requests": ollama.requests, "max_in_flight": ollama.max_in_flight},
+            "langfuse": langfuse.stats(),
+        },
+    }
+
+
+def compare(baseline, report):
+    """Lines showing how each scenario moved against ``baseline``."""
+    lines = [f"{'scenario':<10} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}"]
+    for name, current in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        rows = [("throughput_rps", before["throughput_rps"], current["throughput_rps"]),
+                ("error_rate", before["error_rate"], current["error_rate"])]
+        rows += [(f"latency_{p}_s", before["latency_s"][p], current["latency_s"][p]) for p in ("p50", "p95", "p99")]
+        for metric, old, new in rows:
+            change = f"{(new - old) / old:+.1%}" if old and new is not None else ""
+            lines.append(f"{name:<10} {metric:<15} {_fmt(old):>10} {_fmt(new):>10} {change:>8}")
+    return lines
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.4g}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds to drive the load for")
+    parser.add_argument('--message-rps', type=float, default=10.0)
+    parser.add_argument('--prompts-rps', type=float, default=20.0)
+    parser.add_argument('--evaluator-rps', type=float, default=0.5, help="evaluator passes a second")
+    parser.add_argument('--max-in-flight', type=int, default=256, help="per scenario")
+    parser.add_argument('--timeout', type=float, default=30.0, help="client timeout per request")
+    parser.add_argument('--workers', type=int, default=1, help="hypercorn worker processes for the app")
+    parser.add_argument('--app-url', help="drive this running app instead of starting one")
+    parser.add_argument('--ollama-latency', type=float, default=0.2, help="median seconds to the first token")
+    parser.add_argument('--ollama-latency-sigma', type=float, default=0.5,
+                        help="lognormal shape of the first-token latency, 0 for a fixed latency")
+    parser.add_argument('--ollama-token-rate', type=float, default=50.0, help="words generated a second")
+    parser.add_argument('--ollama-parallel', type=int, help="fake Ollama concurrent completions")
+    parser.add_argument('--reply-words', type=int, default=40)
+    parser.add_argument('--langfuse-latency', type=float, default=0.005, help="fake Langfuse seconds per request")
+    parser.add_argument('--eval-traces', type=int, default=10, help="traces each evaluator pass scores")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', help="name of this run in the report, e.g. the release")
+    parser.add_argument('--output', help="write the report to this file instead of stdout")
+    parser.add_argument('--compare', help="an earlier report to compare this run with")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Request logging would dominate the measurement
+    logging.disable(logging.CRITICAL)
+
+    report = run(args)
+    for name, result in report["scenarios"].items():
+        latency = result["latency_s"]
+        print(f"{name:<10} {result['throughput_rps']:>8.1f} req/s of {result['target_rps']:g}  "
+              f"p50={latency['p50'] or 0:.3f}s p95={latency['p95'] or 0:.3f}s p99={latency['p99'] or 0:.3f}s "
+              f"errors={result['error_rate']:.1%} rejected={result['rejected_rate']:.1%} "
+              f"dropped={result['dropped_rate']:.1%}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), report)), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+"""The Flask app wired to a fake Langfuse and Ollama, for multi-worker runs.
+
+Imported by hypercorn in every worker process (see bench_workers). Every
+worker gets an identical fake Langfuse; the prompt tree runs in leader
+mode on PROMPT_HISTORY_PATH, so only one of them syncs.
+"""
+import logging
+import os
+
+import openai
+
+from app import app as app_module
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.chat import PROMPT_NAME
+from promptpilot.versioning.tree import PromptTree
+
+PROMPT = "You are a {{criticLevel}} movie critic. Review {{movie}}."
+
+# Request logging would dominate the measurement
+logging.disable(logging.CRITICAL)
+
+langfuse = FakeLangfuse()
+langfuse.create_prompt(PROMPT_NAME, PROMPT)
+app_module.prompt_manager = PromptTree(langfuse, os.environ['PROMPT_HISTORY_PATH'], sync_on_init='leader')
+app_module.client = openai.OpenAI(base_url=os.environ['FAKE_OLLAMA_URL'], api_key="ollama", max_retries=0)
+
+app = app_module.app
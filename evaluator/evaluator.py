@@ -6,9 +6,11 @@ import time
 import logging
 from flask import Flask, render_template, request, redirect, url_for, flash
 from threading import Thread
+from promptpilot.logs import log_event, setup_logging
+from promptpilot.serving.router import model_router_from_env
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging: JSON lines from a background writer, see promptpilot.logs
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize Langfuse client
@@ -19,10 +21,16 @@ langfuse_client = Langfuse(
 )
 
 # Initialize OpenAI client
-client = OpenAI(
-    base_url="http://ollama:11434/v1",
-    api_key="ollama",
-)
+def make_client(base_url):
+    return OpenAI(
+        base_url=base_url,
+        api_key="ollama",
+    )
+
+# With several OLLAMA_BASE_URLS, a ModelRouter balances them and stands in
+# for the client
+router = model_router_from_env(make_client)
+client = router or make_client(os.getenv('OLLAMA_BASE_URL', "http://ollama:11434/v1"))
 
 model_name = "smollm2"
 
@@ -137,35 +145,44 @@ def evaluate_trace(trace):
         comment=joy["reason"]
     )
 
+def evaluate_recent_traces(limit=TOTAL_TRACES):
+    """
+    Scores the tagged traces of the last hour once; returns how many were evaluated.
+    """
+    now = datetime.now(timezone.utc)
+    to_timestamp = now.replace(second=0, microsecond=0)
+    from_timestamp = now - timedelta(hours=1)
+
+    logger.debug(f"Fetching traces from {from_timestamp} to {to_timestamp}")
+
+    traces = get_traces(
+        tags="ext_eval_pipelines",
+        limit=limit,
+        from_timestamp=from_timestamp,
+        to_timestamp=to_timestamp
+    )
+    logger.info(f"Fetched {len(traces)} traces")
+
+    evaluated = 0
+    for trace in traces:
+        if trace.output:
+            try:
+                evaluate_trace(trace)
+                evaluated += 1
+                log_event(logger, "eval.trace_evaluated", trace_id=trace.id)
+            except Exception as e:
+                logger.error(f"Error evaluating trace {trace.id}: {e}")
+        else:
+            log_event(logger, "eval.trace_skipped", logging.WARNING, trace_id=trace.id, reason="no output")
+    return evaluated
+
 def background_evaluation_loop():
     """
     Runs the evaluation loop in the background.
     """
     while True:
         try:
-            now = datetime.now(timezone.utc)
-            to_timestamp = now.replace(second=0, microsecond=0)
-            from_timestamp = now - timedelta(hours=1)
-            
-            logger.debug(f"Fetching traces from {from_timestamp} to {to_timestamp}")
-            
-            traces = get_traces(
-                tags="ext_eval_pipelines",
-                limit=TOTAL_TRACES,
-                from_timestamp=from_timestamp,
-                to_timestamp=to_timestamp
-            )
-            logger.info(f"Fetched {len(traces)} traces")
-            
-            for trace in traces:
-                if trace.output:
-                    try:
-                        evaluate_trace(trace)
-                        logger.info(f"Evaluated trace {trace.id}")
-                    except Exception as e:
-                        logger.error(f"Error evaluating trace {trace.id}: {e}")
-                else:
-                    logger.warning(f"Trace {trace.id} has no output")
+            evaluate_recent_traces()
         except Exception as e:
             logger.error(f"Unexpected error in evaluation loop: {e}")
         
@@ -2,28 +2,16 @@ import logging
 import json
 import re
 from ollama import chat, ChatResponse
+from promptpilot.logs import log_event, setup_logging
 
-# Configure logging
+# Configure logging: INFO to the console and DEBUG to debug.log, as JSON
+# lines written by a background thread (see promptpilot.logs)
+setup_logging(level=logging.INFO, file_path='debug.log', file_level=logging.DEBUG, file_mode='w')
+# Debug records from this script only, not from the HTTP clients
+logging.getLogger().setLevel(logging.INFO)
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-# Create console handler with INFO level
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-
-# Create file handler with DEBUG level
-file_handler = logging.FileHandler('debug.log', mode='w')
-file_handler.setLevel(logging.DEBUG)
-
-# Set a detailed format for both handlers
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-file_handler.setFormatter(formatter)
-
-# Add handlers to the logger
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
-
 
 # LLM variables
 model_name = "llama3.2:3b"
@@ -69,22 +57,17 @@ PRINT THE LIST ALONE, NOTHING ELSE. The result MUST match this format:
 def improve_prompt(instruction_prompt: str, metric_prompt: str):
     logger.debug("Starting prompt improvement process.")
     logger.debug(f"Improving prompt using model '{model_name}'.")
+    user_message = improve_prompt_user.format(instruction_prompt=instruction_prompt, metric_prompt=metric_prompt)
     response: ChatResponse = chat(
         model=model_name,
         messages=[
             {"role": "system", "content": improve_prompt_system},
-            {
-                "role": "user",
-                "content": improve_prompt_user.format(
-                    instruction_prompt=instruction_prompt, metric_prompt=metric_prompt
-                ),
-            },
+            {"role": "user", "content": user_message},
         ],
     )
     response_text = response.message.content
-    logger.debug(f"Input improve prompt: {improve_prompt_user.format(instruction_prompt=instruction_prompt, metric_prompt=metric_prompt)}")
-    logger.info(f"User prompt: {instruction_prompt}")
-    logger.info(f"Output prompt: {response_text}")
+    log_event(logger, "experiment.improve_prompt_input", logging.DEBUG, prompt=user_message)
+    log_event(logger, "experiment.prompt_improved", instruction=instruction_prompt, improved=response_text)
     logger.debug("Prompt improvement completed successfully.")
     return response_text
 
@@ -103,22 +86,16 @@ def parse_score_explanation(text):
 
 def relevance_score(user_input: str, response: str):
     logger.debug("Evaluating relevance score using relevance prompt.")
+    evaluation_prompt = relevance_prompt.format(user_input=user_input, response=response)
     evaluation: ChatResponse = chat(
         model=model_name,
-        messages=[
-            {
-                "role": "user",
-                "content": relevance_prompt.format(
-                    user_input=user_input, response=response
-                ),
-            }
-        ]
+        messages=[{"role": "user", "content": evaluation_prompt}]
     )
-    result = parse_score_explanation(evaluation.message.content.strip())
-    logger.info(f"Evaluating user input: {user_input}")
-    logger.debug(f"Relevance prompt: {relevance_prompt.format(user_input=user_input, response=response)}")
-    logger.debug(f"Assistant response: {evaluation.message.content.strip()}")
-    logger.info(f"Relevance evaluation result: {result}")
+    evaluation_text = evaluation.message.content.strip()
+    result = parse_score_explanation(evaluation_text)
+    log_event(logger, "experiment.relevance_prompt", logging.DEBUG, prompt=evaluation_prompt,
+              response=evaluation_text)
+    log_event(logger, "experiment.relevance_scored", user_input=user_input, result=result)
     return result
 
 
@@ -132,8 +109,7 @@ def instructions_response(user_input: str):
         ],
     )
     response_text = response.message.content
-    logger.info(f"User input instructions: {user_input}")
-    logger.info(f"Assistant response: {response_text}")
+    log_event(logger, "experiment.response", user_input=user_input, response=response_text)
     logger.debug("Response generation completed successfully.")
     return response_text
 
@@ -0,0 +1,217 @@
+"""Structured logging that stays off the request path.
+
+``setup_logging`` puts a queue handler on the root logger. A request thread
+only samples the record and puts it on a bounded queue; a background
+writer formats it as one JSON object per line and does the I/O. When the
+queue is full the record is dropped and counted instead of waiting.
+
+Events go through ``log_event(logger, "chat.reply", user_input=...,
+response=...)``: the fields stay as they are until the writer serializes
+them, strings longer than ``max_length`` are truncated, and each event name
+can be sampled at its own rate, e.g. LOG_SAMPLE="chat.reply=0.1".
+"""
+import atexit
+from datetime import datetime, timezone
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import queue
+import random
+import sys
+import threading
+
+DEFAULT_MAX_LENGTH = 1000
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def truncate(value, max_length):
+    """``value`` with every string in it cut to ``max_length`` characters."""
+    if isinstance(value, str):
+        if max_length and len(value) > max_length:
+            return f"{value[:max_length]}... [{len(value) - max_length} more chars]"
+        return value
+    if isinstance(value, dict):
+        return {key: truncate(item, max_length) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [truncate(item, max_length) for item in value]
+    return value
+
+
+class EventMessage:
+    """The message of an event record, rendered only if a handler asks."""
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        fields = truncate(self.fields, DEFAULT_MAX_LENGTH)
+        return " ".join([self.event] + [f"{key}={value!r}" for key, value in fields.items()])
+
+
+def log_event(logger, event, level=logging.INFO, **fields):
+    """Log ``event`` with structured ``fields``; nothing is formatted here."""
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s", EventMessage(event, fields), extra={"event": event, "fields": fields})
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object a line: ts, level, logger, then event and fields or message."""
+
+    def __init__(self, max_length=DEFAULT_MAX_LENGTH):
+        super().__init__()
+        self.max_length = max_length
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        event = getattr(record, "event", None)
+        if event is not None:
+            entry["event"] = event
+            for key, value in truncate(record.fields, self.max_length).items():
+                entry.setdefault(key, value)
+        else:
+            entry["message"] = truncate(record.getMessage(), self.max_length)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SampledQueueHandler(QueueHandler):
+    """Samples records by event and hands them to a queue without blocking.
+
+    ``sample_rates`` maps event names to the fraction of them to keep, with
+    ``*`` for events not listed; records that are not events are all kept.
+    """
+
+    def __init__(self, log_queue, sample_rates=None, random=random.random):
+        super().__init__(log_queue)
+        self.sample_rates = dict(sample_rates or {})
+        self.random = random
+        self.queued = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self._counts_lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        if event is not None:
+            rate = self.sample_rates.get(event, self.sample_rates.get("*", 1.0))
+            if rate < 1.0 and self.random() >= rate:
+                with self._counts_lock:
+                    self.sampled_out += 1
+                return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        # The writer thread formats; the default would format here, on the
+        # request thread. Records are never pickled, so they go as they are
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._counts_lock:
+                self.dropped += 1
+        else:
+            with self._counts_lock:
+                self.queued += 1
+
+    def stats(self):
+        with self._counts_lock:
+            counts = {"queued": self.queued, "sampled_out": self.sampled_out, "dropped": self.dropped}
+        return dict(counts, backlog=self.queue.qsize())
+
+
+class LogPipeline:
+    """The queue handler on the root logger and the writer thread behind it."""
+
+    def __init__(self, handler, listener):
+        self.handler = handler
+        self.listener = listener
+        self._stopped = False
+        self._stop_lock = threading.Lock()
+
+    def stats(self):
+        return self.handler.stats()
+
+    def stop(self):
+        # Writes out what is still queued; safe to call again, e.g. at exit
+        with self._stop_lock:
+            if self._stopped:
+                return
+            self._stopped = True
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+
+
+def parse_sample_rates(spec):
+    """``"chat.reply=0.1,*=0.5"`` -> ``{"chat.reply": 0.1, "*": 0.5}``."""
+    rates = {}
+    for item in (spec or "").split(","):
+        if item.strip():
+            event, _, rate = item.partition("=")
+            rates[event.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(level=None, file_path=None, file_level=None, stream=None, file_mode='a',
+                  environ=os.environ):
+    """Route the root logger through a queue to a background JSON writer.
+
+    Writes to ``stream`` (stderr) at ``level`` and, with ``file_path``,
+    to that file at ``file_level``, appending unless ``file_mode`` is 'w'. LOG_LEVEL, LOG_FILE,
+    LOG_MAX_LENGTH, LOG_SAMPLE and LOG_QUEUE_SIZE override the defaults;
+    LOG_FORMAT=text keeps the plain format. Once per process: later calls
+    return the same pipeline.
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return _pipeline
+
+        level = environ.get('LOG_LEVEL') or level or logging.INFO
+        unknown_level = None
+        if isinstance(level, str):
+            # getLevelName answers "Level X" for a name it does not know
+            name, level = level, logging.getLevelName(level.strip().upper())
+            if not isinstance(level, int):
+                unknown_level, level = name, logging.INFO
+        file_path = environ.get('LOG_FILE', file_path)
+        file_level = level if file_level is None else file_level
+        max_length = int(environ.get('LOG_MAX_LENGTH', DEFAULT_MAX_LENGTH))
+        if environ.get('LOG_FORMAT', 'json').strip().lower() == 'text':
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        else:
+            formatter = JsonFormatter(max_length)
+
+        handlers = [logging.StreamHandler(stream or sys.stderr)]
+        handlers[0].setLevel(level)
+        if file_path:
+            handlers.append(logging.FileHandler(file_path, mode=file_mode, encoding='utf-8'))
+            handlers[1].setLevel(file_level)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=int(environ.get('LOG_QUEUE_SIZE', 10000)))
+        queue_handler = SampledQueueHandler(log_queue, parse_sample_rates(environ.get('LOG_SAMPLE')))
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+
+        root = logging.getLogger()
+        root.setLevel(min(level, file_level) if file_path else level)
+        root.addHandler(queue_handler)
+        _pipeline = LogPipeline(queue_handler, listener)
+        if unknown_level is not None:
+            logging.getLogger(__name__).warning(f"Unknown log level {unknown_level!r}, using INFO.")
+        atexit.register(_pipeline.stop)
+        return _pipeline
@@ -0,0 +1,203 @@
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """A request turned away by admission control.
+
+    ``status`` is 429 for a client over its rate limit and 503 when the
+    backend is saturated; ``retry_after`` is in whole seconds.
+    """
+
+    def __init__(self, status, reason, retry_after):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    """Per-client token buckets: ``rate`` requests per second, bursts of ``burst``."""
+
+    def __init__(self, rate, burst, max_clients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self._buckets = OrderedDict()  # client -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def take(self, client):
+        """Take a token; return 0 on success or the seconds until one is available."""
+        now = self.clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[client] = (tokens, now)
+            # The least recently seen clients are forgotten, i.e. start full
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            return wait
+
+
+class AdmissionController:
+    """Bounds the requests in front of the model server.
+
+    At most ``max_concurrency`` requests run at once. Up to ``max_queue``
+    more wait in FIFO order, each for at most ``max_wait`` seconds; a
+    request whose expected wait (from the queue ahead of it and recent
+    service times) already exceeds that is refused on arrival instead of
+    timing out later. With ``rate`` set, each client also has a token
+    bucket. Refusals raise Overloaded.
+    """
+
+    def __init__(self, max_concurrency=8, max_queue=32, max_wait=10.0, rate=None, burst=None,
+                 clock=time.monotonic):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.clock = clock
+        self.buckets = TokenBuckets(rate, burst or max(1, math.ceil(rate)), clock=clock) if rate else None
+        self.active = 0
+        self.admitted = 0
+        self.rejected = {"rate_limited": 0, "queue_full": 0, "deadline": 0}
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+        # Moving average of how long an admitted request holds its slot
+        self.service_seconds = None
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def admit(self, client=None):
+        started_at = self.acquire(client)
+        try:
+            yield
+        finally:
+            self.release(started_at)
+
+    def acquire(self, client=None):
+        """Wait for a slot and return the admission time for release()."""
+        if self.buckets is not None:
+            wait = self.buckets.take(client)
+            if wait > 0:
+                with self._cond:
+                    self.rejected["rate_limited"] += 1
+                raise Overloaded(429, "Too many requests from this client.", math.ceil(wait))
+
+        arrived_at = self.clock()
+        with self._cond:
+            if self.active < self.max_concurrency and not self._waiters:
+                return self._admit(arrived_at)
+            if len(self._waiters) >= self.max_queue:
+                self.rejected["queue_full"] += 1
+                raise Overloaded(503, "Server is busy, the request queue is full.", self._retry_after())
+            expected = self._expected_wait(len(self._waiters))
+            if expected is not None and expected > self.max_wait:
+                self.rejected["deadline"] += 1
+                raise Overloaded(503, "Server is busy, try again later.", self._retry_after())
+
+            ticket = object()
+            self._waiters.append(ticket)
+            deadline = arrived_at + self.max_wait
+            while self._waiters[0] is not ticket or self.active >= self.max_concurrency:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    self._waiters.remove(ticket)
+                    self.rejected["deadline"] += 1
+                    # The head may have changed; let the new one check its turn
+                    self._cond.notify_all()
+                    raise Overloaded(503, "Server is busy, try again later.", self._retry_after())
+                self._cond.wait(remaining)
+            self._waiters.popleft()
+            started_at = self._admit(arrived_at)
+            self._cond.notify_all()
+            return started_at
+
+    def release(self, started_at):
+        with self._cond:
+            self.active -= 1
+            held = self.clock() - started_at
+            self.service_seconds = held if self.service_seconds is None else 0.8 * self.service_seconds + 0.2 * held
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "active": self.active,
+                "queue_depth": len(self._waiters),
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "wait_seconds_total": self.wait_seconds_total,
+                "max_wait_seconds": self.max_wait_seconds,
+                "service_seconds": self.service_seconds,
+            }
+
+    def _admit(self, arrived_at):
+        # Called with the lock held
+        now = self.clock()
+        waited = now - arrived_at
+        self.active += 1
+        self.admitted += 1
+        self.wait_seconds_total += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+        return now
+
+    def _expected_wait(self, ahead):
+        # Called with the lock held; None until a service time has been seen
+        if self.service_seconds is None:
+            return None
+        return (ahead // self.max_concurrency + 1) * self.service_seconds
+
+    def _retry_after(self):
+        # Called with the lock held; roughly when the current queue has drained
+        expected = self._expected_wait(len(self._waiters))
+        return max(1, math.ceil(expected)) if expected is not None else 1
+
+
+def client_key(remote_addr, headers, trusted_header=None):
+    """The client a request is rate limited as.
+
+    The peer address, unless ``trusted_header`` names a header set by a
+    proxy in front of the app (e.g. X-Forwarded-For); then its last entry,
+    the one the proxy added, is used. Client-sent headers are not trusted
+    otherwise, since anyone can vary them to dodge their limit.
+    """
+    if trusted_header:
+        forwarded = headers.get(trusted_header)
+        if forwarded and forwarded.split(",")[-1].strip():
+            return forwarded.split(",")[-1].strip()
+    return remote_addr
+
+
+def admission_from_env(environ=os.environ):
+    """Build the controller configured by ADMISSION_MAX_CONCURRENCY, or None when unset.
+
+    ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT_S, RATE_LIMIT_RPS and
+    RATE_LIMIT_BURST tune it; without RATE_LIMIT_RPS clients are not rate limited.
+    Behind a proxy, ADMISSION_CLIENT_HEADER names the header it puts the
+    client address in; see client_key.
+    """
+    max_concurrency = int(environ.get('ADMISSION_MAX_CONCURRENCY') or 0)
+    if max_concurrency <= 0:
+        return None
+    rate = float(environ.get('RATE_LIMIT_RPS') or 0) or None
+    return AdmissionController(
+        max_concurrency=max_concurrency,
+        max_queue=int(environ.get('ADMISSION_MAX_QUEUE', 4 * max_concurrency)),
+        max_wait=float(environ.get('ADMISSION_MAX_WAIT_S', 10)),
+        rate=rate,
+        burst=float(environ['RATE_LIMIT_BURST']) if environ.get('RATE_LIMIT_BURST') else None,
+    )
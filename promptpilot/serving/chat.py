@@ -0,0 +1,87 @@
+import base64
+import json
+import os
+
+# Settings shared by the Flask and ASGI chat apps
+MODEL_NAME = os.environ.get('CHAT_MODEL', 'smollm2')
+PROMPT_NAME = os.environ.get('CHAT_PROMPT', 'movie-critic')
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_BASE_URL', 'http://ollama:11434/v1')
+# Extra completion arguments, e.g. {"temperature": 0.2}; part of the reply cache key
+SAMPLING_PARAMS = json.loads(os.environ.get('CHAT_SAMPLING_PARAMS') or '{}')
+
+# Template variables the chat compiles its system prompt with
+PROMPT_VARIABLES = {"criticLevel": "expert", "movie": "Inception"}
+
+# Largest /prompts page a client can ask for
+MAX_PAGE_SIZE = 1000
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful assistant."
+ERROR_MESSAGE = ("Unexpected error occurred. Please check your request and contact support: "
+                 "https://langfuse.com/support.")
+
+
+def build_messages(prompt, user_input, system_prompt=None, history=()):
+    # Use the already compiled system prompt, compile the latest one, or
+    # fall back to a default. The system prompt always comes first so its
+    # prefix stays cached in Ollama across turns and sessions
+    if system_prompt is None:
+        system_prompt = prompt.compile(**PROMPT_VARIABLES) if prompt else DEFAULT_SYSTEM_PROMPT
+
+    return [
+        {"role": "system", "content": system_prompt},
+        *history,
+        {"role": "user", "content": user_input},
+    ]
+
+
+def requested_session(body):
+    """``(opted_in, session_id)`` from a chat request body.
+
+    Conversations opt in by sending ``session_id``, null to start one.
+    Raises ValueError when it is neither a string nor null.
+    """
+    if "session_id" not in body:
+        return False, None
+    session_id = body["session_id"]
+    if session_id is not None and not isinstance(session_id, str):
+        raise ValueError("session_id must be a string or null.")
+    return True, session_id
+
+
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor.")
+
+
+def prompts_page(prompt_tree, args):
+    """Entries and headers for one /prompts page.
+
+    Query arguments: ``limit`` (page size, all remaining prompts if absent),
+    ``cursor`` (from the previous page's X-Next-Cursor header) and
+    ``fields`` (comma separated; ``last_config`` is only sent when listed).
+    Raises ValueError for bad arguments.
+    """
+    limit = args.get("limit")
+    if limit is not None:
+        if not limit.isdigit():
+            raise ValueError("limit must be a positive integer.")
+        limit = min(int(limit), MAX_PAGE_SIZE)
+    cursor = args.get("cursor")
+    fields = args.get("fields")
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        if "name" not in fields:
+            fields.insert(0, "name")
+    entries, next_after = prompt_tree.list_prompts(
+        after=decode_cursor(cursor) if cursor else None, limit=limit, fields=fields)
+
+    headers = {}
+    if next_after is not None:
+        headers["X-Next-Cursor"] = encode_cursor(next_after)
+    return entries, headers
@@ -0,0 +1,149 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Per-request tracing arguments that do not change the completion
+TRACE_ARGS = ("trace_id", "parent_observation_id")
+
+
+def request_key(kwargs):
+    # Identical completion arguments, in any order, share one upstream call
+    return json.dumps({key: value for key, value in kwargs.items() if key not in TRACE_ARGS},
+                      sort_keys=True, default=str)
+
+
+class ChatDispatcher:
+    """Sits between the chat routes and ``create`` (the completions call).
+
+    Identical requests that are queued or in flight share one upstream call
+    and each caller gets that call's result or exception. With ``max_wait``
+    above zero, the first request of a burst is held up to that many
+    seconds so that up to ``max_batch_size`` requests are released to the
+    workers together, which lets Ollama schedule them into the same batch.
+    At most ``concurrency`` upstream calls run at once, on persistent
+    worker threads. Streaming calls are not dispatched: a stream is read
+    once, token by token, so it cannot be shared between callers.
+    """
+
+    def __init__(self, create, max_wait=0.0, max_batch_size=8, concurrency=4):
+        self.create = create
+        self.max_wait = max_wait
+        self.max_batch_size = max(1, max_batch_size)
+        self.concurrency = concurrency
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.upstream_calls = 0
+        self.errors = 0
+        self._pending = {}  # key -> Future, while queued or in flight
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat-dispatch")
+        self._collector = None
+        self._closed = False
+
+    def complete(self, **kwargs):
+        """Run ``create(**kwargs)`` through the dispatcher and return its result."""
+        key = request_key(kwargs)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ChatDispatcher is closed.")
+            self.requests += 1
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced += 1
+            elif self.max_wait > 0:
+                future = self._pending[key] = Future()
+                self._queue.append((key, kwargs))
+                self._start_collector()
+                self._cond.notify()
+            else:
+                future = self._pending[key] = Future()
+                self.batches += 1
+                self._executor.submit(self._call, key, kwargs)
+        return future.result()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "requests": self.requests,
+                "coalesced": self.coalesced,
+                "batches": self.batches,
+                "upstream_calls": self.upstream_calls,
+                "errors": self.errors,
+                "queued": len(self._queue),
+                "pending": len(self._pending),
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._collector is not None:
+            self._collector.join()
+        self._executor.shutdown(wait=True)
+
+    def _start_collector(self):
+        # Called with the lock held
+        if self._collector is None:
+            self._collector = threading.Thread(target=self._collect, name="chat-dispatch-batcher", daemon=True)
+            self._collector.start()
+
+    def _collect(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # Hold the head of the burst until the batch fills or its wait is up
+                deadline = time.monotonic() + self.max_wait
+                while len(self._queue) < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+                self.batches += 1
+            for key, kwargs in batch:
+                self._executor.submit(self._call, key, kwargs)
+
+    def _call(self, key, kwargs):
+        try:
+            result = self.create(**kwargs)
+            error = None
+        except Exception as e:
+            result, error = None, e
+        with self._cond:
+            self.upstream_calls += 1
+            if error is not None:
+                self.errors += 1
+            # Later identical requests start a fresh call
+            future = self._pending.pop(key)
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+
+def chat_dispatcher_from_env(create, environ=os.environ):
+    """Build the dispatcher configured by CHAT_DISPATCH, or None when off.
+
+    CHAT_DISPATCH_MAX_WAIT_MS, CHAT_DISPATCH_BATCH_SIZE and
+    CHAT_DISPATCH_CONCURRENCY tune it.
+    """
+    if environ.get('CHAT_DISPATCH', '').strip().lower() not in ('1', 'true', 'on', 'yes'):
+        return None
+    return ChatDispatcher(
+        create,
+        max_wait=float(environ.get('CHAT_DISPATCH_MAX_WAIT_MS', 0)) / 1000,
+        max_batch_size=int(environ.get('CHAT_DISPATCH_BATCH_SIZE', 8)),
+        concurrency=int(environ.get('CHAT_DISPATCH_CONCURRENCY', 4)),
+    )
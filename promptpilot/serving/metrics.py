@@ -0,0 +1,280 @@
+"""Minimal Prometheus metrics for the chat app.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus
+text exposition format, plus a per-request StageTimer. Kept dependency
+free and cheap enough to sit on the request path: an observation is a
+dict lookup, a bisect and a few additions under a lock.
+"""
+import bisect
+import math
+import threading
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans a memoized prompt lookup up to a long generation
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        # Labels passed in declaration order, the usual case, need no reordering
+        if tuple(labels) == self.label_names:
+            return tuple(labels.values())
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}.")
+        return tuple(labels[name] for name in self.label_names)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def track(self, **labels):
+        # Counts the block as in progress while it runs
+        return _Tracked(self, self._key(labels))
+
+
+class _Tracked:
+    __slots__ = ("gauge", "key")
+
+    def __init__(self, gauge, key):
+        self.gauge = gauge
+        self.key = key
+
+    def _add(self, amount):
+        with self.gauge._lock:
+            self.gauge._values[self.key] = self.gauge._values.get(self.key, 0) + amount
+
+    def __enter__(self):
+        self._add(1)
+
+    def __exit__(self, *exc_info):
+        self._add(-1)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (not cumulative) counts, then sum and count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def value(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return {"count": entry[2], "sum": entry[1]} if entry else {"count": 0, "sum": 0.0}
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            entries = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self._values.items()]
+        for key, counts, total, count in entries:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", key, cumulative, ("le", _format_value(float(bound)))))
+            samples.append((f"{self.name}_sum", key, total, None))
+            samples.append((f"{self.name}_count", key, count, None))
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, value, extra in self.samples():
+            lines.append(f"{name}{_format_labels(self.label_names, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """The metrics of one app, plus callbacks sampled at scrape time."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, documentation, labels, buckets))
+
+    def add_collector(self, collect):
+        """Register ``collect()``, returning metrics rebuilt on every scrape."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            for metric in collect():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+def stats_gauges(prefix, stats):
+    """Gauges for a component's stats() dict, e.g. for Registry.add_collector.
+
+    Numbers become ``<prefix>_<key>``; nested dicts of numbers become one
+    gauge with a ``kind`` label per entry. Anything else is skipped.
+    """
+    gauges = []
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            counts = {kind: count for kind, count in value.items() if _is_number(count)}
+            if not counts:
+                continue
+            gauge = Gauge(f"{prefix}_{key}", f"{key} by kind", ("kind",))
+            for kind, count in counts.items():
+                gauge.set(count, kind=kind)
+        elif _is_number(value):
+            gauge = Gauge(f"{prefix}_{key}", key.replace("_", " "))
+            gauge.set(value)
+        else:
+            continue
+        gauges.append(gauge)
+    return gauges
+
+
+def table_gauges(prefix, rows, label):
+    """Gauges for ``{row: {field: number}}``, one per field labelled by row.
+
+    Booleans are reported as 0 or 1.
+    """
+    gauges = {}
+    for row, fields in rows.items():
+        for field, value in fields.items():
+            if isinstance(value, bool):
+                value = int(value)
+            elif not _is_number(value):
+                continue
+            if field not in gauges:
+                gauges[field] = Gauge(f"{prefix}_{field}", f"{field.replace('_', ' ')} by {label}", (label,))
+            gauges[field].set(value, **{label: row})
+    return list(gauges.values())
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class StageTimer:
+    """Times the stages of one request into a histogram labelled by stage.
+
+    ``labels`` are the histogram's other labels, e.g. the route.
+    ``timings_ms()`` returns what was measured, for the Langfuse trace.
+    """
+
+    def __init__(self, histogram, clock=time.perf_counter, **labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.clock = clock
+        self.started_at = clock()
+        self.stages = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.histogram.observe(seconds, stage=name, **self.labels)
+
+    def finish(self):
+        self.record("total", self.clock() - self.started_at)
+
+    def timings_ms(self):
+        return {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = self.timer.clock()
+
+    def __exit__(self, *exc_info):
+        self.timer.record(self.name, self.timer.clock() - self.start)
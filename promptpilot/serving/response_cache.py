@@ -0,0 +1,288 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_input(text):
+    # Repeated questions differ in case and spacing more than in wording
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+def response_cache_key(model, prompt, messages, user_input, params=None):
+    """Key a /message reply on everything that shapes it.
+
+    ``prompt`` is the resolved Langfuse prompt (or None for the default
+    system prompt); its name and version go into the key, and so does a
+    hash of the compiled system prompt, so a new version never hits an
+    answer generated for an older one. So does a hash of any earlier turns
+    between the system prompt and the new user message.
+    """
+    system_prompt = next((m["content"] for m in messages if m["role"] == "system"), "")
+    parts = {
+        "model": model,
+        "prompt_name": getattr(prompt, "name", None),
+        "prompt_version": getattr(prompt, "version", None),
+        "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        "input": normalize_input(user_input),
+        "params": params or {},
+    }
+    # Earlier turns of a conversation, when there are any
+    history = messages[1:-1]
+    if history:
+        parts["history"] = hashlib.sha256(json.dumps(history, sort_keys=True).encode("utf-8")).hexdigest()
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU cache of replies with a TTL and a cap on total bytes."""
+
+    def __init__(self, ttl_seconds=3600, max_bytes=64 * 1024 * 1024, clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[2] >= self.ttl_seconds:
+                self._remove(key)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, self.clock())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+    def _remove(self, key):
+        # Called with the lock held
+        value, size, stored_at = self._entries.pop(key)
+        self._bytes -= size
+
+
+RESPONSE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at);
+CREATE TABLE IF NOT EXISTS response_bytes (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO response_bytes SELECT 0, COALESCE(SUM(size), 0) FROM responses;
+CREATE TRIGGER IF NOT EXISTS responses_added AFTER INSERT ON responses BEGIN
+    UPDATE response_bytes SET total = total + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS responses_removed AFTER DELETE ON responses BEGIN
+    UPDATE response_bytes SET total = total - OLD.size;
+END;
+"""
+
+
+class SQLiteResponseCache(ResponseCache):
+    """Reply cache in a SQLite database shared by every worker process.
+
+    Same eviction rules as ResponseCache: entries expire ``ttl_seconds``
+    after they were stored, and the least recently used ones are dropped
+    once the stored replies exceed ``max_bytes``. Hit and miss counters are
+    per process.
+
+    The byte total is kept up to date by triggers, so an insert never sums
+    the table. A hit is a read only: the new use times are written in one
+    batch every ``touch_interval`` seconds and before any eviction, so the
+    LRU order on disk lags by at most that.
+    """
+
+    def __init__(self, db_path='response_cache.db', ttl_seconds=3600, max_bytes=64 * 1024 * 1024,
+                 clock=time.time, timeout=30, touch_interval=1.0):
+        super().__init__(ttl_seconds=ttl_seconds, max_bytes=max_bytes, clock=clock)
+        self.db_path = db_path
+        self.timeout = timeout
+        self.touch_interval = touch_interval
+        self._touched = {}  # key -> used_at not yet written
+        self._touched_at = clock()
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(RESPONSE_SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections are not shareable between threads; keep one each
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        # A broken cache costs a generation, never the request
+        try:
+            return self._get(key)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading response cache: {e}")
+            self._count("misses")
+            return None
+
+    def set(self, key, value):
+        try:
+            self._set(key, value)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing response cache: {e}")
+
+    def _get(self, key):
+        now = self.clock()
+        conn = self._connection()
+        row = conn.execute("SELECT value, stored_at FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] >= self.ttl_seconds:
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._count("expired")
+            row = None
+        if row is None:
+            self._count("misses")
+            return None
+        with self._lock:
+            self.hits += 1
+            self._touched[key] = now
+            due = now - self._touched_at >= self.touch_interval
+        if due:
+            try:
+                self._write_touches(conn)
+            except sqlite3.Error as e:
+                logger.error(f"Error writing response cache use times: {e}")
+        return row[0]
+
+    def _write_touches(self, conn):
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._touched_at = self.clock()
+        if touched:
+            with conn:
+                conn.executemany("UPDATE responses SET used_at = ? WHERE key = ? AND used_at < ?",
+                                 [(used_at, key, used_at) for key, used_at in touched.items()])
+
+    def _set(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = self.clock()
+        conn = self._connection()
+        with conn:
+            # Delete first, so the trigger takes the old size off the total
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            conn.execute("INSERT INTO responses VALUES (?, ?, ?, ?, ?)", (key, value, size, now, now))
+            total = conn.execute("SELECT total FROM response_bytes").fetchone()[0]
+        if total > self.max_bytes:
+            # Evict by up to date use times
+            self._write_touches(conn)
+            with conn:
+                total = conn.execute("SELECT total FROM response_bytes").fetchone()[0]
+                # Walk from the least recently used until enough bytes are freed
+                doomed = []
+                for old_key, old_size in conn.execute("SELECT key, size FROM responses ORDER BY used_at"):
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append((old_key,))
+                    total -= old_size
+                conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+                self._count("evictions", len(doomed))
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self):
+        size, total = self._connection().execute(
+            "SELECT COUNT(*), (SELECT total FROM response_bytes) FROM responses").fetchone()
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "size": size,
+                "bytes": total,
+            }
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            try:
+                self._write_touches(conn)
+            except sqlite3.Error as e:
+                logger.error(f"Error writing response cache use times: {e}")
+            conn.close()
+            self._local.conn = None
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+
+def response_cache_from_env(environ=os.environ):
+    """Build the reply cache configured by RESPONSE_CACHE, or None when off.
+
+    RESPONSE_CACHE is ``memory`` or ``sqlite``; RESPONSE_CACHE_TTL (seconds),
+    RESPONSE_CACHE_MAX_BYTES and RESPONSE_CACHE_PATH (sqlite only) tune it.
+    """
+    backend = environ.get('RESPONSE_CACHE', '').strip().lower()
+    if not backend or backend in ('0', 'off', 'none', 'false'):
+        return None
+    ttl = float(environ.get('RESPONSE_CACHE_TTL', 3600))
+    max_bytes = int(environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    if backend == 'memory':
+        return ResponseCache(ttl_seconds=ttl, max_bytes=max_bytes)
+    if backend == 'sqlite':
+        return SQLiteResponseCache(environ.get('RESPONSE_CACHE_PATH', 'response_cache.db'),
+                                   ttl_seconds=ttl, max_bytes=max_bytes)
+    raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend!r}")
@@ -0,0 +1,274 @@
+"""Spreads chat completions over several Ollama servers.
+
+ModelRouter stands in for an OpenAI client (``router.chat.completions.create``)
+and sends each request to the healthy backend with the fewest requests in
+flight, preferring backends that already have the requested model loaded.
+Backends that fail are ejected and come back once a health check passes.
+"""
+import logging
+import os
+import threading
+import time
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+
+def _model_name(name):
+    # Ollama reports "smollm2:latest" for a model asked for as "smollm2"
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class Backend:
+    def __init__(self, url, client):
+        self.url = url.rstrip("/")
+        self.client = client
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0  # consecutive
+        self.healthy = True
+        self.latency = None  # EWMA of completion latency, seconds
+        self.models = set()  # loaded on the backend, as of the last health check
+
+    @property
+    def root_url(self):
+        # Ollama's own API lives next to its OpenAI compatible /v1
+        return self.url[:-len("/v1")] if self.url.endswith("/v1") else self.url
+
+    def stats(self):
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": round(self.latency * 1000, 3) if self.latency is not None else None,
+            "models": sorted(self.models),
+        }
+
+
+class ModelRouter:
+    """Least-outstanding-requests routing over Ollama backends.
+
+    ``client_factory(url)`` builds the OpenAI client of each backend.
+    After ``eject_after`` consecutive failed calls a backend stops getting
+    requests; every ``health_interval`` seconds each backend's ``/api/ps``
+    is polled, which ejects unreachable backends, reintroduces recovered
+    ones and refreshes the models they have loaded. Requests that cannot
+    reach a backend at all are retried once on another one.
+    """
+
+    def __init__(self, urls, client_factory, health_interval=10.0, eject_after=3, health_timeout=2.0,
+                 clock=time.perf_counter):
+        if not urls:
+            raise ValueError("ModelRouter needs at least one backend URL.")
+        self.backends = [Backend(url, client_factory(url)) for url in urls]
+        self.health_interval = health_interval
+        self.eject_after = eject_after
+        self.health_timeout = health_timeout
+        self.clock = clock
+        self.retried = 0
+        self.unavailable = 0
+        self.chat = _Chat(self)
+        self._next = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def complete(self, **kwargs):
+        """``chat.completions.create(**kwargs)`` on the best backend."""
+        model = kwargs.get("model")
+        tried = []
+        while True:
+            backend = self._acquire(model, exclude=tried)
+            tried.append(backend)
+            started_at = self.clock()
+            try:
+                result = backend.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                self._release(backend, error=e)
+                # Nothing was generated if the backend was unreachable, so
+                # another one can take the request
+                if _is_connection_error(e) and len(tried) < 2 and self._has_candidate(tried):
+                    with self._lock:
+                        self.retried += 1
+                    logger.warning(f"Retrying chat completion after {backend.url} failed: {e}")
+                    continue
+                raise
+            if kwargs.get("stream"):
+                # The backend stays loaded until the stream is consumed
+                return _TrackedStream(result, lambda error=None: self._release(backend, started_at, error))
+            self._release(backend, started_at)
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "retried": self.retried,
+                "unavailable": self.unavailable,
+                "backends": {backend.url: backend.stats() for backend in self.backends},
+            }
+
+    def check_health(self):
+        """Poll every backend once; ejects and reintroduces as needed."""
+        for backend in self.backends:
+            try:
+                response = httpx.get(f"{backend.root_url}/api/ps", timeout=self.health_timeout)
+                response.raise_for_status()
+                models = {_model_name(model.get("name") or model.get("model", ""))
+                          for model in response.json().get("models", [])}
+            except Exception as e:
+                with self._lock:
+                    if backend.healthy:
+                        logger.warning(f"Ejecting Ollama backend {backend.url}: health check failed: {e}")
+                    backend.healthy = False
+                continue
+            with self._lock:
+                if not backend.healthy:
+                    logger.info(f"Reintroducing Ollama backend {backend.url}")
+                backend.healthy = True
+                backend.failures = 0
+                backend.models = models
+
+    def start(self):
+        """Run check_health every health_interval seconds on a daemon thread."""
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, name="model-router-health",
+                                                   daemon=True)
+            self._health_thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+
+    def _health_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Error checking Ollama backends: {e}")
+            self._stop.wait(self.health_interval)
+
+    def _has_candidate(self, exclude):
+        with self._lock:
+            return any(backend.healthy and backend not in exclude for backend in self.backends)
+
+    def _acquire(self, model, exclude=()):
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.healthy and backend not in exclude]
+            if not candidates:
+                # With every backend ejected, try them anyway rather than fail
+                # outright; a success brings the backend back
+                candidates = [backend for backend in self.backends if backend not in exclude]
+            if not candidates:
+                self.unavailable += 1
+                raise NoBackendAvailable("No Ollama backend is available.")
+            if model is not None:
+                loaded = [backend for backend in candidates if _model_name(model) in backend.models]
+                # Loading a model takes seconds; only spill over to a cold
+                # backend once the warm ones are busier than it
+                if loaded and min(b.outstanding for b in loaded) <= min(b.outstanding for b in candidates):
+                    candidates = loaded
+            # Rotate the start so ties go round robin and idle backends share work
+            self._next = (self._next + 1) % len(candidates)
+            backend = min(candidates[self._next:] + candidates[:self._next], key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def _release(self, backend, started_at=None, error=None):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is not None:
+                backend.errors += 1
+                backend.failures += 1
+                if backend.healthy and backend.failures >= self.eject_after:
+                    backend.healthy = False
+                    logger.warning(f"Ejecting Ollama backend {backend.url} after {backend.failures} failures: "
+                                   f"{error}")
+                return
+            backend.failures = 0
+            if not backend.healthy:
+                logger.info(f"Reintroducing Ollama backend {backend.url}")
+                backend.healthy = True
+            if started_at is not None:
+                elapsed = self.clock() - started_at
+                backend.latency = elapsed if backend.latency is None else 0.8 * backend.latency + 0.2 * elapsed
+
+
+def _is_connection_error(error):
+    return isinstance(error, (openai.APIConnectionError, httpx.TransportError)) and not isinstance(
+        error, openai.APITimeoutError)
+
+
+class _Chat:
+    def __init__(self, router):
+        self.completions = _Completions(router)
+
+
+class _Completions:
+    def __init__(self, router):
+        self.create = router.complete
+
+
+class _TrackedStream:
+    """A completion stream that releases its backend once consumed or closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                yield chunk
+        except Exception as e:
+            self._done(e)
+            raise
+        self._done()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def close(self):
+        try:
+            close = getattr(self._stream, "close", None)
+            if callable(close):
+                close()
+        finally:
+            self._done()
+
+    def _done(self, error=None):
+        release, self._release = self._release, None
+        if release is not None:
+            release(error)
+
+
+def router_urls(environ=os.environ):
+    """Backend URLs from OLLAMA_BASE_URLS (comma separated) or OLLAMA_BASE_URL."""
+    urls = [url.strip() for url in environ.get('OLLAMA_BASE_URLS', '').split(',') if url.strip()]
+    return urls or [environ.get('OLLAMA_BASE_URL', 'http://ollama:11434/v1')]
+
+
+def model_router_from_env(client_factory, environ=os.environ):
+    """A started ModelRouter when OLLAMA_BASE_URLS lists several backends, else None.
+
+    OLLAMA_HEALTH_INTERVAL_S and OLLAMA_EJECT_AFTER tune it.
+    """
+    urls = router_urls(environ)
+    if len(urls) < 2:
+        return None
+    return ModelRouter(
+        urls,
+        client_factory,
+        health_interval=float(environ.get('OLLAMA_HEALTH_INTERVAL_S', 10)),
+        eject_after=int(environ.get('OLLAMA_EJECT_AFTER', 3)),
+    ).start()
@@ -0,0 +1,433 @@
+"""Server-side conversation memory for the chat routes.
+
+A session holds the turns of one conversation and hands them back as the
+messages to send between the system prompt and the new user message. The
+history is kept under a token budget: once over it, the oldest turns are
+dropped down to half the budget in one go, so the prompt prefix Ollama can
+reuse stays the same for several turns in between. Dropped turns can be
+folded into a running summary in the background. Idle sessions expire and
+the least recently used are evicted past ``max_sessions``.
+
+SessionStore keeps them in process memory, so it only works for a single
+worker process; SQLiteSessionStore keeps them in a database file every
+worker shares.
+"""
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTIONS = ("Summarize the conversation below in a few sentences. Keep the names, facts and "
+                        "preferences needed to continue it. Reply with the summary only.")
+
+
+def estimate_tokens(text):
+    # About four characters per token for English, plus the role framing;
+    # close enough for a budget and needs no tokenizer
+    return len(text) // 4 + 4
+
+
+def llm_summarizer(create, model):
+    """A ``summarize(summary, turns)`` that asks the chat model itself."""
+    def summarize(summary, turns):
+        text = "\n".join(f"{role}: {content}" for role, content in turns)
+        if summary:
+            text = f"Summary so far: {summary}\n{text}"
+        response = create(
+            model=model,
+            messages=[{"role": "system", "content": SUMMARY_INSTRUCTIONS}, {"role": "user", "content": text}],
+            temperature=0,
+        )
+        return response.choices[0].message.content
+    return summarize
+
+
+class Session:
+    __slots__ = ("id", "turns", "tokens", "summary", "pending", "summarizing", "last_used")
+
+    def __init__(self, session_id, now):
+        self.id = session_id
+        self.turns = deque()  # (role, content, tokens)
+        self.tokens = 0
+        self.summary = None
+        self.pending = []  # dropped turns waiting to be summarized
+        self.summarizing = False
+        self.last_used = now
+
+
+class SessionStore:
+    """Conversations by session id, in memory.
+
+    ``max_history_tokens`` bounds what ``history`` returns (summary
+    included); sessions idle for ``idle_ttl`` seconds expire. With a
+    ``summarize(summary, turns)`` callable, dropped turns are summarized on
+    a background thread instead of being forgotten.
+    """
+
+    def __init__(self, max_history_tokens=1500, idle_ttl=1800, max_sessions=10000, summarize=None,
+                 clock=time.monotonic):
+        self.max_history_tokens = max_history_tokens
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.summarize = summarize
+        self.clock = clock
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+        self.truncated_turns = 0
+        self.summaries = 0
+        self.summary_errors = 0
+        self._sessions = OrderedDict()  # id -> Session, least recently used first
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def resume(self, session_id=None):
+        """The id to continue: ``session_id`` if it is live, else a new session's."""
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(uuid.uuid4().hex, now)
+                self._sessions[session.id] = session
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._touch(session, now)
+            return session.id
+
+    def history(self, session_id):
+        """Messages to send before the new user message: summary, then turns."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            messages = []
+            if session.summary:
+                messages.append({"role": "system", "content": f"Earlier in this conversation: {session.summary}"})
+            messages.extend({"role": role, "content": content} for role, content, _ in session.turns)
+            return messages
+
+    def record(self, session_id, user_input, reply):
+        """Append one exchange and enforce the token budget."""
+        now = self.clock()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            self._touch(session, now)
+            for role, content in (("user", user_input), ("assistant", reply)):
+                tokens = estimate_tokens(content)
+                session.turns.append((role, content, tokens))
+                session.tokens += tokens
+            dropped = self._truncate(session)
+            if dropped and self.summarize is not None:
+                session.pending.extend(dropped)
+                if not session.summarizing:
+                    session.summarizing = True
+                    self._submit(session)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(len(session.turns) for session in self._sessions.values()),
+                "created": self.created,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "truncated_turns": self.truncated_turns,
+                "summaries": self.summaries,
+                "summary_errors": self.summary_errors,
+            }
+
+    def _touch(self, session, now):
+        session.last_used = now
+        self._sessions.move_to_end(session.id)
+
+    def _expire(self, now):
+        # Least recently used first, so expired sessions are all at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used < self.idle_ttl:
+                break
+            del self._sessions[session.id]
+            self.expired += 1
+
+    def _truncate(self, session):
+        budget = self.max_history_tokens - (estimate_tokens(session.summary) if session.summary else 0)
+        if session.tokens <= budget:
+            return []
+        # Drop whole exchanges down to half the budget, keeping the latest one
+        dropped = []
+        while session.tokens > budget // 2 and len(session.turns) > 2:
+            for _ in range(2):
+                role, content, tokens = session.turns.popleft()
+                session.tokens -= tokens
+                dropped.append((role, content))
+        self.truncated_turns += len(dropped)
+        return dropped
+
+    def _submit(self, session):
+        # Called with the lock held
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-summary")
+        self._executor.submit(self._summarize, session)
+
+    def _summarize(self, session):
+        while True:
+            with self._lock:
+                turns, session.pending = session.pending, []
+                summary = session.summary
+                if not turns:
+                    session.summarizing = False
+                    return
+            try:
+                summary = self.summarize(summary, turns)
+            except Exception as e:
+                logger.error(f"Error summarizing session {session.id}: {e}")
+                with self._lock:
+                    self.summary_errors += 1
+                continue
+            with self._lock:
+                session.summary = summary
+                self.summaries += 1
+                # A longer summary leaves less room for turns
+                session.pending.extend(self._truncate(session))
+
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    summary TEXT,
+    pending TEXT NOT NULL DEFAULT '[]',
+    summarizing INTEGER NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+
+class SQLiteSessionStore(SessionStore):
+    """Conversations in a SQLite database shared by every worker process.
+
+    Same budget, expiry and eviction as SessionStore, so a conversation can
+    continue on any worker. Each call is one transaction; the counters in
+    ``stats`` are per process, the session and turn totals are not.
+    """
+
+    def __init__(self, db_path='chat_sessions.db', max_history_tokens=1500, idle_ttl=1800, max_sessions=10000,
+                 summarize=None, clock=time.time, timeout=30):
+        super().__init__(max_history_tokens=max_history_tokens, idle_ttl=idle_ttl, max_sessions=max_sessions,
+                         summarize=summarize, clock=clock)
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connection().executescript(SESSION_SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections are not shareable between threads; keep one each
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # Taken for writing up front, so concurrent workers queue instead of
+        # failing to upgrade a read lock
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def resume(self, session_id=None):
+        now = self.clock()
+        with self._lock, self._transaction() as conn:
+            expired = conn.execute("SELECT id FROM sessions WHERE last_used <= ?", (now - self.idle_ttl,)).fetchall()
+            self._delete(conn, expired)
+            self.expired += len(expired)
+            if session_id and conn.execute("UPDATE sessions SET last_used = ? WHERE id = ?",
+                                           (now, session_id)).rowcount:
+                return session_id
+            session_id = uuid.uuid4().hex
+            conn.execute("INSERT INTO sessions (id, last_used) VALUES (?, ?)", (session_id, now))
+            self.created += 1
+            evicted = conn.execute("SELECT id FROM sessions WHERE id != ? ORDER BY last_used DESC LIMIT -1 OFFSET ?",
+                                   (session_id, self.max_sessions - 1)).fetchall()
+            self._delete(conn, evicted)
+            self.evictions += len(evicted)
+            return session_id
+
+    def history(self, session_id):
+        conn = self._connection()
+        row = conn.execute("SELECT summary FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            return []
+        messages = []
+        if row[0]:
+            messages.append({"role": "system", "content": f"Earlier in this conversation: {row[0]}"})
+        messages.extend({"role": role, "content": content} for role, content in conn.execute(
+            "SELECT role, content FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)))
+        return messages
+
+    def record(self, session_id, user_input, reply):
+        now = self.clock()
+        with self._lock, self._transaction() as conn:
+            loaded = self._load(conn, session_id)
+            if loaded is None:
+                return
+            session, first_seq = loaded
+            kept = len(session.turns)
+            session.last_used = now
+            for role, content in (("user", user_input), ("assistant", reply)):
+                tokens = estimate_tokens(content)
+                session.turns.append((role, content, tokens))
+                session.tokens += tokens
+            dropped = self._truncate(session)
+            conn.executemany("INSERT INTO turns VALUES (?, ?, ?, ?, ?)",
+                             [(session_id, first_seq + kept + i, role, content, tokens)
+                              for i, (role, content, tokens) in enumerate(list(session.turns)[-2:])])
+            conn.execute("DELETE FROM turns WHERE session_id = ? AND seq < ?", (session_id, first_seq + len(dropped)))
+            submit = False
+            if dropped and self.summarize is not None:
+                session.pending.extend(dropped)
+                submit = not session.summarizing
+                session.summarizing = True
+            self._save(conn, session)
+            if submit:
+                self._submit(session)
+
+    def stats(self):
+        conn = self._connection()
+        sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        turns = conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0]
+        with self._lock:
+            return {
+                "sessions": sessions,
+                "turns": turns,
+                "created": self.created,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "truncated_turns": self.truncated_turns,
+                "summaries": self.summaries,
+                "summary_errors": self.summary_errors,
+            }
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _load(self, conn, session_id):
+        # The session as a Session and the seq of its first turn, or None
+        row = conn.execute("SELECT summary, pending, summarizing, last_used FROM sessions WHERE id = ?",
+                           (session_id,)).fetchone()
+        if row is None:
+            return None
+        session = Session(session_id, row[3])
+        session.summary = row[0]
+        session.pending = [tuple(turn) for turn in json.loads(row[1])]
+        session.summarizing = bool(row[2])
+        first_seq = None
+        for seq, role, content, tokens in conn.execute(
+                "SELECT seq, role, content, tokens FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)):
+            first_seq = seq if first_seq is None else first_seq
+            session.turns.append((role, content, tokens))
+            session.tokens += tokens
+        return session, first_seq or 0
+
+    def _save(self, conn, session):
+        conn.execute("UPDATE sessions SET summary = ?, pending = ?, summarizing = ?, last_used = ? WHERE id = ?",
+                     (session.summary, json.dumps(session.pending), int(session.summarizing), session.last_used,
+                      session.id))
+
+    @staticmethod
+    def _delete(conn, rows):
+        conn.executemany("DELETE FROM turns WHERE session_id = ?", rows)
+        conn.executemany("DELETE FROM sessions WHERE id = ?", rows)
+
+    def _summarize(self, session):
+        session_id = session.id
+        while True:
+            with self._lock, self._transaction() as conn:
+                loaded = self._load(conn, session_id)
+                if loaded is None:
+                    return
+                session = loaded[0]
+                turns, session.pending = session.pending, []
+                summary = session.summary
+                session.summarizing = bool(turns)
+                self._save(conn, session)
+                if not turns:
+                    return
+            try:
+                summary = self.summarize(summary, turns)
+            except Exception as e:
+                logger.error(f"Error summarizing session {session_id}: {e}")
+                with self._lock:
+                    self.summary_errors += 1
+                continue
+            with self._lock, self._transaction() as conn:
+                loaded = self._load(conn, session_id)
+                if loaded is None:
+                    return
+                session, first_seq = loaded
+                session.summary = summary
+                self.summaries += 1
+                # A longer summary leaves less room for turns
+                dropped = self._truncate(session)
+                session.pending.extend(dropped)
+                conn.execute("DELETE FROM turns WHERE session_id = ? AND seq < ?",
+                             (session_id, first_seq + len(dropped)))
+                self._save(conn, session)
+
+
+def session_store_from_env(summarize=None, environ=os.environ):
+    """Build the session store, or None when CHAT_SESSIONS is off.
+
+    CHAT_SESSIONS=sqlite keeps the sessions in CHAT_SESSION_PATH
+    (chat_sessions.db), shared by every worker process; any other value
+    keeps them in memory, which needs a single worker or sticky routing.
+    CHAT_SESSION_MAX_TOKENS, CHAT_SESSION_IDLE_S and CHAT_SESSION_MAX tune
+    it; CHAT_SESSION_SUMMARIZE=on folds dropped turns into a summary with
+    ``summarize``.
+    """
+    backend = environ.get('CHAT_SESSIONS', 'on').strip().lower()
+    if backend in ('0', 'off', 'false', 'no'):
+        return None
+    summarizing = environ.get('CHAT_SESSION_SUMMARIZE', '').strip().lower() in ('1', 'true', 'on', 'yes')
+    options = dict(
+        max_history_tokens=int(environ.get('CHAT_SESSION_MAX_TOKENS', 1500)),
+        idle_ttl=float(environ.get('CHAT_SESSION_IDLE_S', 1800)),
+        max_sessions=int(environ.get('CHAT_SESSION_MAX', 10000)),
+        summarize=summarize if summarizing else None,
+    )
+    if backend == 'sqlite':
+        return SQLiteSessionStore(environ.get('CHAT_SESSION_PATH', 'chat_sessions.db'), **options)
+    return SessionStore(**options)
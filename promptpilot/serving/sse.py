@@ -0,0 +1,198 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(event, data):
+    # One Server-Sent Events frame with a JSON payload
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class CompletionStream:
+    """Relays a streamed chat completion as Server-Sent Events.
+
+    Iterating yields one ``token`` event per content delta, then exactly one
+    terminal event: ``done`` with the full response and timings, or ``error``
+    with the text generated so far if the upstream stream fails midway. If
+    the client goes away the upstream stream is closed so generation stops.
+    Either way ``on_finish`` is called once with this object, whose
+    ``status`` is then 'completed', 'error' or 'cancelled'.
+
+    ``started_at`` should be taken before the upstream request was sent so
+    that time-to-first-token includes connecting and queueing.
+    """
+
+    def __init__(self, stream, on_finish=None, started_at=None, clock=time.perf_counter):
+        self.stream = stream
+        self.on_finish = on_finish
+        self.clock = clock
+        self.started_at = clock() if started_at is None else started_at
+        self.status = 'pending'
+        self.error = None
+        self.text = ''
+        self.time_to_first_token = None
+        self.total_time = None
+
+    def timings(self):
+        return {
+            "ttft_ms": round(self.time_to_first_token * 1000, 1) if self.time_to_first_token is not None else None,
+            "total_ms": round(self.total_time * 1000, 1) if self.total_time is not None else None,
+        }
+
+    def __iter__(self):
+        parts = []
+        chunks = iter(self.stream)
+        self.status = 'streaming'
+        try:
+            for chunk in chunks:
+                token = self._receive(chunk, parts)
+                if token:
+                    yield sse_event("token", {"token": token})
+            yield self._complete(parts)
+        except GeneratorExit:
+            # The client disconnected; nothing more can be sent
+            self._cancel(parts)
+            raise
+        except Exception as e:
+            yield self._fail(parts, e)
+        finally:
+            if self.status != 'completed':
+                _close(chunks)
+                _close(self.stream)
+            self._record()
+
+    def _receive(self, chunk, parts):
+        token = chunk.choices[0].delta.content if chunk.choices else None
+        if token:
+            if self.time_to_first_token is None:
+                self.time_to_first_token = self.clock() - self.started_at
+            parts.append(token)
+        return token
+
+    def _complete(self, parts):
+        self._finish(parts, 'completed')
+        return sse_event("done", dict(self.timings(), response=self.text))
+
+    def _cancel(self, parts):
+        if self.status == 'streaming':
+            self._finish(parts, 'cancelled')
+
+    def _fail(self, parts, error):
+        logger.error(f"Upstream error after {len(parts)} streamed tokens: {error}", exc_info=True)
+        self.error = str(error)
+        self._finish(parts, 'error')
+        return sse_event("error", dict(self.timings(), response=self.text,
+                                       error="The response was interrupted. Please try again."))
+
+    def _finish(self, parts, status):
+        self.text = ''.join(parts)
+        self.total_time = self.clock() - self.started_at
+        self.status = status
+
+    def _record(self):
+        if self.on_finish is not None:
+            try:
+                self.on_finish(self)
+            except Exception as e:
+                logger.error(f"Error recording streamed response: {e}", exc_info=True)
+
+
+class AsyncCompletionStream(CompletionStream):
+    """CompletionStream for an async upstream stream, iterated with ``async for``.
+
+    Cancellation of the serving task counts as a client disconnect.
+    """
+
+    async def __aiter__(self):
+        parts = []
+        self.status = 'streaming'
+        try:
+            async for chunk in self.stream:
+                token = self._receive(chunk, parts)
+                if token:
+                    yield sse_event("token", {"token": token})
+            yield self._complete(parts)
+        except (GeneratorExit, asyncio.CancelledError):
+            self._cancel(parts)
+            raise
+        except Exception as e:
+            yield self._fail(parts, e)
+        finally:
+            if self.status != 'completed':
+                await _aclose(self.stream)
+            self._record()
+
+    def events(self):
+        """The events, as an async iterator for a server that closes it.
+
+        Closing it also finishes a stream that was never iterated, e.g.
+        when the client left before the first event: the upstream stream is
+        closed and ``on_finish`` sees status 'cancelled'. Quart closes the
+        bodies it sends.
+        """
+        return _Events(self)
+
+    async def _abandon(self):
+        self._finish([], 'cancelled')
+        await _aclose(self.stream)
+        self._record()
+
+
+class _Events:
+    def __init__(self, stream):
+        self.stream = stream
+        self._events = stream.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self._events.__anext__()
+
+    async def aclose(self):
+        await self._events.aclose()
+        if self.stream.status == 'pending':
+            await self.stream._abandon()
+
+
+class CachedStream:
+    """A cached reply as a one-chunk upstream stream, sync or async."""
+
+    def __init__(self, text):
+        self.chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])]
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def _close(stream):
+    # OpenAI streams close their HTTP response; Langfuse-wrapped ones hold it
+    # in .response, and generators finalize their tracing when closed
+    for target in (stream, getattr(stream, 'response', None)):
+        close = getattr(target, 'close', None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+async def _aclose(stream):
+    for target in (stream, getattr(stream, 'response', None)):
+        close = getattr(target, 'aclose', None) or getattr(target, 'close', None)
+        if callable(close):
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                pass
@@ -0,0 +1,410 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, asynccontextmanager
+import functools
+import logging
+import os
+from urllib.parse import quote
+
+import httpx
+from langfuse.api.core.pydantic_utilities import pydantic_v1
+from langfuse.api.resources.prompts.types import Prompt, Prompt_Chat, PromptMetaListResponse
+from langfuse.model import ChatPromptClient, TextPromptClient
+
+from promptpilot.versioning.tree import PromptTree
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLangfuseClient:
+    """Asyncio client for the Langfuse prompts API.
+
+    All calls go through one ``httpx.AsyncClient``, so connections are pooled
+    and kept alive across requests. Credentials default to the same
+    LANGFUSE_* environment variables as the Langfuse SDK.
+    """
+
+    def __init__(self, public_key=None, secret_key=None, host=None, timeout=10,
+                 max_connections=20, transport=None):
+        self.http = httpx.AsyncClient(
+            base_url=host or os.environ.get('LANGFUSE_HOST', 'https://cloud.langfuse.com'),
+            auth=(public_key or os.environ.get('LANGFUSE_PUBLIC_KEY', ''),
+                  secret_key or os.environ.get('LANGFUSE_SECRET_KEY', '')),
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+
+    async def list_prompts(self, page_size=100):
+        # Walk every page; the sync client only ever looked at the first one
+        prompts = []
+        page = 1
+        while True:
+            response = await self.http.get("/api/public/v2/prompts",
+                                           params={"page": page, "limit": page_size})
+            response.raise_for_status()
+            listing = pydantic_v1.parse_obj_as(PromptMetaListResponse, response.json())
+            prompts.extend(listing.data)
+            if page >= listing.meta.total_pages:
+                return prompts
+            page += 1
+
+    async def get_prompt(self, name, version=None, label=None):
+        params = {key: value for key, value in (("version", version), ("label", label)) if value is not None}
+        response = await self.http.get(f"/api/public/v2/prompts/{quote(name, safe='')}", params=params)
+        response.raise_for_status()
+        prompt = pydantic_v1.parse_obj_as(Prompt, response.json())
+        if isinstance(prompt, Prompt_Chat):
+            return ChatPromptClient(prompt)
+        return TextPromptClient(prompt)
+
+    async def create_prompt(self, name, prompt, config=None, labels=None, tags=None, type="text"):
+        response = await self.http.post("/api/public/v2/prompts", json={
+            "name": name,
+            "prompt": prompt,
+            "config": config or {},
+            "labels": labels or [],
+            "tags": tags or [],
+            "type": type,
+        })
+        response.raise_for_status()
+        return pydantic_v1.parse_obj_as(Prompt, response.json())
+
+    async def update_prompt_labels(self, name, version, labels):
+        response = await self.http.patch(f"/api/public/v2/prompts/{quote(name, safe='')}/versions/{version}",
+                                         json={"newLabels": labels})
+        response.raise_for_status()
+        return pydantic_v1.parse_obj_as(Prompt, response.json())
+
+    async def aclose(self):
+        await self.http.aclose()
+
+
+class AsyncPromptTree:
+    """PromptTree for asyncio code: the same local state, non-blocking I/O.
+
+    Storage, indexes and the prompt cache are those of a PromptTree that never
+    touches the network itself. Langfuse calls go through an async client
+    (AsyncLangfuseClient or anything with the same coroutines), at most
+    ``max_concurrency`` at a time. Identical concurrent fetches and syncs share
+    one call; cancelling a caller only cancels that call once nobody else is
+    waiting for it.
+    """
+
+    def __init__(self, langfuse_client, file_path='prompt_history.json', max_concurrency=8,
+                 fetch_timeout_seconds=10, max_retries=2, **options):
+        self.langfuse_client = langfuse_client
+        self.local = PromptTree(langfuse_client, file_path, max_workers=max_concurrency,
+                                fetch_timeout_seconds=fetch_timeout_seconds, max_retries=max_retries,
+                                sync_on_init='never', **options)
+        self.max_concurrency = max_concurrency
+        self._in_flight = {}
+        self._refreshes = set()
+        self._semaphore = None
+        self._write_lock = None
+        # The tree lock and, in shared mode, the file lock belong to the thread
+        # that took them and may block; writes take, use and release them on
+        # this one thread
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prompt-tree-writer")
+        self._held = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if hasattr(self.langfuse_client, 'aclose'):
+            await self.langfuse_client.aclose()
+        self._writer.shutdown(wait=False)
+
+    # Local reads never block on the network
+
+    @property
+    def tree(self):
+        return self.local.tree
+
+    @property
+    def prompt_cache(self):
+        return self.local.prompt_cache
+
+    def sync_status(self):
+        return self.local.sync_status()
+
+    def get_prompt_by_id(self, prompt_id):
+        return self.local.get_prompt_by_id(prompt_id)
+
+    def get_next_version(self, name):
+        return self.local.get_next_version(name)
+
+    def get_children(self, prompt_id):
+        return self.local.get_children(prompt_id)
+
+    def get_ancestors(self, prompt_id):
+        return self.local.get_ancestors(prompt_id)
+
+    def get_descendants(self, prompt_id):
+        return self.local.get_descendants(prompt_id)
+
+    def get_subtree(self, prompt_id):
+        return self.local.get_subtree(prompt_id)
+
+    def get_path(self, from_id, to_id):
+        return self.local.get_path(from_id, to_id)
+
+    @property
+    def revision_tag(self):
+        return self.local.revision_tag
+
+    def list_prompts(self, after=None, limit=None, fields=None):
+        return self.local.list_prompts(after, limit, fields)
+
+    # Network operations
+
+    async def sync_with_langfuse(self, incremental=None):
+        return await self._single_flight(("sync", incremental), lambda: self._sync(incremental))
+
+    async def sync_until_ready(self, incremental=None):
+        # Retry a failed sync with the same backoff as PromptTree's background sync
+        delay = self.local.sync_retry_seconds
+        while not await self.sync_with_langfuse(incremental):
+            logger.warning(f"Retrying the prompt sync in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.local.sync_retry_max_seconds)
+
+    async def _sync(self, incremental):
+        local = self.local
+        if incremental is None:
+            incremental = local.incremental_sync
+        async with self._lock():
+            local.sync_state = 'syncing'
+            synced = False
+            try:
+                # Same steps as PromptTree._sync: fetch without the file lock,
+                # then follow, rebuild and write under it
+                for attempt in range(local.SYNC_ATTEMPTS):
+                    await asyncio.to_thread(local._follow, force=True)
+                    mark = local._shared_mark()
+                    try:
+                        langfuse_prompts = await self.langfuse_client.list_prompts()
+                    except Exception as e:
+                        logger.error(f"Error fetching prompts from Langfuse: {e}")
+                        local.last_sync_error = str(e)
+                        return False
+
+                    local_versions, keys = local._plan_sync(langfuse_prompts, incremental)
+                    details = await asyncio.gather(*(self._fetch_detail(name, version) for name, version in keys))
+                    # Rebuilding and writing the tree blocks; keep it off the event loop
+                    async with self._writing():
+                        if local._shared_mark() != mark and attempt + 1 < local.SYNC_ATTEMPTS:
+                            continue
+                        await self._in_writer(local._apply_sync, langfuse_prompts, incremental, local_versions,
+                                              dict(zip(keys, details)))
+                    synced = True
+                    break
+            except Exception as e:
+                logger.error(f"Error syncing prompts with Langfuse: {e}", exc_info=True)
+                local.last_sync_error = str(e)
+            finally:
+                # Also when cancelled, so the state never stays 'syncing'
+                local._finish_sync(synced)
+            return synced
+
+    async def get_latest_prompt(self, name):
+        # Reading the change feed and reloading are file I/O; only leave the
+        # loop for them once every refresh_interval
+        if self.local._follow_due():
+            await asyncio.to_thread(self.local._follow)
+        cache = self.local.prompt_cache
+        found = cache.lookup(name)
+        if found is not None:
+            value, stale = found
+            if stale:
+                # Serve the stale client now and reload it off the request path;
+                # the loop only keeps weak references to tasks
+                task = asyncio.ensure_future(self._refresh_latest(name))
+                self._refreshes.add(task)
+                task.add_done_callback(self._refreshes.discard)
+            return value
+        generation = cache.generation
+        try:
+            prompt_client = await self._single_flight(("latest", name), lambda: self._fetch_latest_prompt(name))
+        except Exception as e:
+            logger.error(f"Error fetching latest prompt '{name}': {e}")
+            return None
+        cache.store(name, prompt_client, generation)
+        return prompt_client
+
+    async def get_compiled_prompt(self, name, **variables):
+        # See PromptTree.get_compiled_prompt; compiled text is shared with self.local
+        prompt_client = await self.get_latest_prompt(name)
+        if prompt_client is None:
+            return None, None
+        return prompt_client, self.local.compile_prompt(name, prompt_client, **variables)
+
+    def compile_prompt(self, name, prompt_client, **variables):
+        return self.local.compile_prompt(name, prompt_client, **variables)
+
+    async def _refresh_latest(self, name):
+        cache = self.local.prompt_cache
+        generation = cache.generation
+        try:
+            prompt_client = await self._single_flight(("latest", name), lambda: self._fetch_latest_prompt(name))
+        except Exception as e:
+            logger.error(f"Error refreshing cached prompt '{name}': {e}")
+            cache.record_refresh(error=e)
+            return
+        cache.record_refresh()
+        cache.store(name, prompt_client, generation)
+
+    async def _fetch_latest_prompt(self, name):
+        latest_prompt_info = self.local._served_prompt(name)
+        if latest_prompt_info is None:
+            return None
+        return await self._fetch_prompt(name, latest_prompt_info['version'])
+
+    async def create_prompt(self, name, content, config, parent_id=None):
+        # Like PromptTree.create_prompt, numbering, the push and the local
+        # update happen under the write locks, so no other process can hand
+        # out the same version meanwhile
+        async with self._lock(), self._writing():
+            prompt_info = self.local._prepare_prompt(name, content, parent_id)
+            duplicate = self.local._find_duplicate(prompt_info)
+            if duplicate:
+                await self._alias_prompt(duplicate)
+                return duplicate
+            try:
+                async with self._slots():
+                    await self.langfuse_client.create_prompt(
+                        **PromptTree._prompt_payload(name, content, config, parent_id))
+            except Exception as e:
+                logger.error(f"Error creating prompt '{name}': {e}")
+                raise
+            await self._in_writer(self.local._add_nodes, [prompt_info])
+            return prompt_info
+
+    async def create_prompts(self, items):
+        async with self._lock(), self._writing():
+            results, queues, duplicates = self.local._plan_prompts(items)
+
+            async def push_versions(queue):
+                for i, prompt_info in queue:
+                    item = items[i]
+                    try:
+                        async with self._slots():
+                            await self.langfuse_client.create_prompt(**PromptTree._prompt_payload(
+                                item["name"], item["content"], item.get("config") or {}, item.get("parent_id")))
+                    except Exception as e:
+                        logger.error(f"Error creating prompt '{item['name']}': {e}")
+                        PromptTree._skip_rest(results, queue, i, e)
+                        return
+                    results[i]["prompt"] = prompt_info
+
+            await asyncio.gather(*(push_versions(queue) for queue in queues))
+            await self._in_writer(self.local._record_created, results)
+            for i, original, alias in duplicates:
+                if alias:
+                    try:
+                        await self._alias_prompt(original)
+                    except Exception as e:
+                        results[i]["error"] = str(e)
+                        continue
+                PromptTree._resolve_duplicate(results, i, original)
+            return results
+
+    async def _alias_prompt(self, prompt_info):
+        if self.local.dedupe != 'alias':
+            return
+        try:
+            await self.langfuse_client.update_prompt_labels(prompt_info["name"], prompt_info["version"],
+                                                            ["production"])
+        except Exception as e:
+            logger.error(f"Error labelling prompt '{prompt_info['id']}' as production: {e}")
+            raise
+        await self._in_writer(self.local._record_alias, prompt_info)
+
+    # Helpers
+
+    async def _fetch_prompt(self, name, version):
+        # Per-call timeout with the same retry budget as the blocking tree
+        for attempt in range(self.local.max_retries + 1):
+            try:
+                async with self._slots():
+                    return await asyncio.wait_for(self.langfuse_client.get_prompt(name=name, version=version),
+                                                  self.local.fetch_timeout_seconds)
+            except Exception:
+                if attempt == self.local.max_retries:
+                    raise
+
+    async def _fetch_detail(self, name, version):
+        try:
+            prompt_client = await self._single_flight(("prompt", name, version),
+                                                      lambda: self._fetch_prompt(name, version))
+            return {"parent_id": prompt_client.config.get("parent_id"), "content": prompt_client.prompt}
+        except Exception as e:
+            logger.error(f"Error fetching prompt '{name}' version {version}: {e}")
+            return None
+
+    async def _single_flight(self, key, factory):
+        entry = self._in_flight.get(key)
+        if entry is None:
+            entry = {"task": asyncio.ensure_future(factory()), "waiters": 0}
+            self._in_flight[key] = entry
+            entry["task"].add_done_callback(lambda _: self._forget(key, entry))
+        entry["waiters"] += 1
+        try:
+            # Shielded so one caller's cancellation does not fail the others
+            return await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+            if entry["waiters"] == 1 and not entry["task"].done():
+                entry["task"].cancel()
+            raise
+        finally:
+            entry["waiters"] -= 1
+
+    def _forget(self, key, entry):
+        if self._in_flight.get(key) is entry:
+            del self._in_flight[key]
+
+    def _slots(self):
+        # Created lazily so they bind to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _lock(self):
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        return self._write_lock
+
+    @asynccontextmanager
+    async def _writing(self):
+        # What PromptTree's writers hold: the tree lock and, in shared mode,
+        # the file lock, entered after reloading the latest shared state.
+        # Entered with self._lock() held, so nothing else queues on the writer
+        try:
+            await self._in_writer(self._enter_writing)
+        except asyncio.CancelledError:
+            # The writer still takes the locks; hand them back after it
+            self._writer.submit(self._exit_writing)
+            raise
+        try:
+            yield
+        finally:
+            await self._in_writer(self._exit_writing)
+
+    def _enter_writing(self):
+        with ExitStack() as stack:
+            stack.enter_context(self.local._lock)
+            stack.enter_context(self.local._writing())
+            self._held = stack.pop_all()
+
+    def _exit_writing(self):
+        held, self._held = self._held, None
+        if held is not None:
+            held.close()
+
+    def _in_writer(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self._writer, functools.partial(fn, *args))
@@ -0,0 +1,147 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCache:
+    """Size-bounded LRU cache with a TTL and stale-while-revalidate refresh.
+
+    Entries younger than ``ttl_seconds`` are served as-is. Older entries are
+    still served for up to ``stale_ttl_seconds`` while a background refresh
+    reloads them; past that they count as misses and are loaded inline.
+    """
+
+    def __init__(self, ttl_seconds=60, max_size=128, stale_ttl_seconds=300, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, loaded_at)
+        self._refreshing = set()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def get(self, key, loader):
+        if self.max_size <= 0:
+            return loader()
+
+        with self._lock:
+            found = self._lookup(key)
+            if found is not None:
+                value, stale = found
+                if stale:
+                    self._schedule_refresh(key, loader)
+                return value
+            generation = self._generation
+
+        value = loader()
+        self._store(key, value, generation)
+        return value
+
+    def lookup(self, key):
+        """Return ``(value, stale)`` for a servable entry or None on a miss.
+
+        For callers that load and refresh entries themselves (see ``store``).
+        """
+        with self._lock:
+            return self._lookup(key)
+
+    @property
+    def generation(self):
+        # Pass to store() so loads that straddle an invalidation are dropped
+        return self._generation
+
+    def store(self, key, value, generation):
+        self._store(key, value, generation)
+
+    def record_refresh(self, error=None):
+        with self._lock:
+            if error is None:
+                self.refreshes += 1
+            else:
+                self.refresh_errors += 1
+
+    def _lookup(self, key):
+        # Called with the lock held
+        if self.max_size <= 0:
+            return None
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, loaded_at = entry
+            age = self.clock() - loaded_at
+            if age < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value, False
+            if age < self.ttl_seconds + self.stale_ttl_seconds:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                return value, True
+        self.misses += 1
+        return None
+
+    def invalidate(self, key=None):
+        with self._lock:
+            # Bumping the generation drops the result of any refresh in flight
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
+
+    def _store(self, key, value, generation):
+        if value is None:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (value, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _schedule_refresh(self, key, loader):
+        # Called with the lock held; at most one refresh per key at a time
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prompt-cache")
+        self._executor.submit(self._refresh, key, loader, self._generation)
+
+    def _refresh(self, key, loader, generation):
+        try:
+            value = loader()
+        except Exception as e:
+            logger.error(f"Error refreshing cached prompt {key!r}: {e}")
+            self.record_refresh(error=e)
+            return
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+        self.record_refresh()
+        self._store(key, value, generation)
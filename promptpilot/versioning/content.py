@@ -0,0 +1,26 @@
+import difflib
+import hashlib
+import json
+
+
+def _as_text(content):
+    # Chat prompts are lists of messages; compare them as canonical JSON
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, indent=2, sort_keys=True)
+
+
+def content_hash(content):
+    """SHA-256 fingerprint of a prompt's content."""
+    return hashlib.sha256(_as_text(content).encode('utf-8')).hexdigest()
+
+
+def diff_contents(old, new, from_label='a', to_label='b', context=3):
+    """Unified diff between two prompt contents; empty when they are equal."""
+    return ''.join(difflib.unified_diff(
+        _as_text(old).splitlines(keepends=True),
+        _as_text(new).splitlines(keepends=True),
+        fromfile=from_label,
+        tofile=to_label,
+        n=context,
+    ))
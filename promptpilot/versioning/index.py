@@ -0,0 +1,131 @@
+from collections import deque
+
+
+class TreeIndex:
+    """In-memory lookup tables over the nodes of a PromptTree.
+
+    Keeps id -> node, name -> latest node, (name, content hash) -> node and
+    parent -> children adjacency so that lookups and lineage queries do not
+    scan the whole history.
+    """
+
+    def __init__(self, tree=None):
+        self.prompts = {}
+        self.by_id = {}
+        self.latest = {}
+        self.by_content = {}
+        self.children = {}
+        if tree is not None:
+            self.rebuild(tree)
+
+    def rebuild(self, tree):
+        # Per-name node lists are shared with the tree, not copied
+        self.prompts = tree["prompts"]
+        self.by_id = {}
+        self.latest = {}
+        self.by_content = {}
+        self.children = {}
+        for nodes in self.prompts.values():
+            for node in nodes:
+                self.add(node)
+
+    def add(self, node):
+        self.by_id[node["id"]] = node
+        latest = self.latest.get(node["name"])
+        if latest is None or node["version"] > latest["version"]:
+            self.latest[node["name"]] = node
+        if node.get("content_hash"):
+            self.by_content[(node["name"], node["content_hash"])] = node
+        if node["parent_id"]:
+            self.children.setdefault(node["parent_id"], []).append(node["id"])
+
+    def get(self, prompt_id):
+        return self.by_id.get(prompt_id)
+
+    def get_latest(self, name):
+        return self.latest.get(name)
+
+    def find_content(self, name, content_hash):
+        return self.by_content.get((name, content_hash))
+
+    def nodes(self, name):
+        return self.prompts.get(name, [])
+
+    def count(self):
+        return len(self.by_id)
+
+    def versions_by_name(self):
+        return {name: sorted(node["version"] for node in nodes) for name, nodes in self.prompts.items() if nodes}
+
+    def next_version(self, name):
+        latest = self.latest.get(name)
+        return latest["version"] + 1 if latest else 1
+
+    def get_children(self, prompt_id):
+        return [self.by_id[child_id] for child_id in self.children.get(prompt_id, [])]
+
+    def ancestors(self, prompt_id):
+        # Walk parent links up to the root, nearest ancestor first
+        ancestors = []
+        seen = {prompt_id}
+        node = self.by_id.get(prompt_id)
+        while node and node["parent_id"] and node["parent_id"] not in seen:
+            seen.add(node["parent_id"])
+            node = self.by_id.get(node["parent_id"])
+            if node is None:
+                break
+            ancestors.append(node)
+        return ancestors
+
+    def descendants(self, prompt_id):
+        # Breadth-first, so closer generations come first
+        descendants = []
+        seen = {prompt_id}
+        queue = deque(self.children.get(prompt_id, []))
+        while queue:
+            child_id = queue.popleft()
+            if child_id in seen:
+                continue
+            seen.add(child_id)
+            descendants.append(self.by_id[child_id])
+            queue.extend(self.children.get(child_id, []))
+        return descendants
+
+    def subtree(self, prompt_id):
+        node = self.by_id.get(prompt_id)
+        if node is None:
+            return None
+        root = {"node": node, "children": []}
+        seen = {prompt_id}
+        stack = [root]
+        while stack:
+            current = stack.pop()
+            for child_id in self.children.get(current["node"]["id"], []):
+                if child_id in seen:
+                    continue
+                seen.add(child_id)
+                entry = {"node": self.by_id[child_id], "children": []}
+                current["children"].append(entry)
+                stack.append(entry)
+        return root
+
+    def path(self, from_id, to_id):
+        return lineage_path(self, from_id, to_id)
+
+
+def lineage_path(index, from_id, to_id):
+    """Nodes from ``from_id`` to ``to_id`` through their lowest common ancestor.
+
+    Works on anything with ``get`` and ``ancestors``; None if not connected.
+    """
+    start, end = index.get(from_id), index.get(to_id)
+    if start is None or end is None:
+        return None
+    up = [start] + index.ancestors(from_id)
+    positions = {node["id"]: i for i, node in enumerate(up)}
+    down = []
+    for node in [end] + index.ancestors(to_id):
+        if node["id"] in positions:
+            return up[:positions[node["id"]] + 1] + list(reversed(down))
+        down.append(node)
+    return None
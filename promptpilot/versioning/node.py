@@ -0,0 +1,168 @@
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+import sys
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Key order of a node in the JSON history file
+FIELDS = ("id", "name", "version", "parent_id", "created_at", "content_hash", "content")
+
+# Marks keys a node was loaded without, so they stay absent when saved
+ABSENT = object()
+
+
+def epoch_micros(value):
+    """Microseconds since the epoch for a UTC ``datetime.isoformat()`` string.
+
+    None for anything else (other offsets, other spellings, ''), which could
+    not be rendered back character for character.
+    """
+    if not isinstance(value, str) or len(value) not in (25, 32) or value[-6:] != '+00:00':
+        return None
+    # The separators of YYYY-MM-DDTHH:MM:SS
+    if value[4:17:3] != '--T::':
+        return None
+    if len(value) == 32 and value[19] != '.':
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # isoformat() drops an all-zero fraction
+    if len(value) == 32 and not moment.microsecond:
+        return None
+    delta = moment - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def pack_hash(value):
+    # A lowercase hex sha256 digest as its 32 raw bytes; anything else as is
+    if isinstance(value, str) and len(value) == 64:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            return value
+        # Upper or mixed case would not survive hex() unchanged
+        if len(raw) == 32 and (value.islower() or value.isdigit()):
+            return raw
+    return value
+
+
+class PromptNode(Mapping):
+    """One prompt version, read like the node dict it replaces.
+
+    Slotted, with the name interned, ``created_at`` held as integer
+    microseconds since the epoch and the content hash as raw bytes. Values
+    that would not convert back to the exact same string are kept as they
+    are, so ``to_dict()`` always reproduces the JSON the node was loaded from.
+    """
+
+    __slots__ = ("id", "name", "version", "parent_id", "_created", "_hash", "_content", "_extra")
+
+    def __init__(self, id, name, version, parent_id=None, created_at='', content_hash=ABSENT,
+                 content=ABSENT, **extra):
+        self.id = id
+        self.name = sys.intern(name)
+        self.version = version
+        self.parent_id = parent_id
+        # Set directly rather than through the properties: this runs per node on load
+        micros = epoch_micros(created_at)
+        self._created = created_at if micros is None else micros
+        self._hash = pack_hash(content_hash)
+        self._content = content
+        # Keys this class does not know about survive a load/save round trip
+        self._extra = extra or None
+
+    @classmethod
+    def from_dict(cls, node):
+        return cls(**node)
+
+    @property
+    def created_at(self):
+        if isinstance(self._created, int):
+            return (EPOCH + timedelta(microseconds=self._created)).isoformat()
+        return self._created
+
+    @created_at.setter
+    def created_at(self, value):
+        micros = epoch_micros(value)
+        self._created = value if micros is None else micros
+
+    @property
+    def content_hash(self):
+        if isinstance(self._hash, bytes):
+            return self._hash.hex()
+        return None if self._hash is ABSENT else self._hash
+
+    @content_hash.setter
+    def content_hash(self, value):
+        self._hash = pack_hash(value)
+
+    @property
+    def content(self):
+        return None if self._content is ABSENT else self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+
+    def to_dict(self):
+        node = {"id": self.id, "name": self.name, "version": self.version,
+                "parent_id": self.parent_id, "created_at": self.created_at}
+        # Nodes saved before content hashing have neither key
+        if self._hash is not ABSENT:
+            node["content_hash"] = self.content_hash
+        if self._content is not ABSENT:
+            node["content"] = self._content
+        if self._extra:
+            node.update(self._extra)
+        return node
+
+    def __getitem__(self, key):
+        if key in FIELDS:
+            if (key == "content" and self._content is ABSENT
+                    or key == "content_hash" and self._hash is ABSENT):
+                raise KeyError(key)
+            return getattr(self, key)
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in FIELDS:
+            setattr(self, key, value)
+        else:
+            self._extra = dict(self._extra or (), **{key: value})
+
+    def __iter__(self):
+        return iter(self.to_dict())
+
+    def __len__(self):
+        return len(self.to_dict())
+
+    def __repr__(self):
+        return f"PromptNode({self.to_dict()!r})"
+
+
+def compact_tree(tree):
+    """Convert every node of a loaded tree to a PromptNode, in place.
+
+    Parent links are pointed at the parent's own id string so a node's
+    parent_id costs no extra memory.
+    """
+    for name, nodes in tree["prompts"].items():
+        tree["prompts"][name] = [node if isinstance(node, PromptNode) else PromptNode.from_dict(node)
+                                 for node in nodes]
+    ids = {node.id: node.id for nodes in tree["prompts"].values() for node in nodes}
+    for nodes in tree["prompts"].values():
+        for node in nodes:
+            if node.parent_id:
+                node.parent_id = ids.get(node.parent_id, node.parent_id)
+    return tree
+
+
+def node_json(value):
+    # ``default`` hook for json.dump: PromptNodes serialize as plain node dicts
+    if isinstance(value, PromptNode):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,93 @@
+"""Coordination between processes that serve the same prompt history.
+
+FileLock is an advisory inter-process lock (flock) and ChangeFeed a small
+JSON file that writers replace after every change, so other processes
+notice by re-reading it. PromptTree uses both in shared mode.
+"""
+import json
+import os
+import threading
+import uuid
+
+from promptpilot.versioning.storage import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; locking is then process-local only
+    fcntl = None
+
+
+class FileLock:
+    """Exclusive lock on ``path`` held across processes.
+
+    Reentrant within one instance. Separate instances, even in the same
+    process, exclude each other, like separate processes do.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    @property
+    def held(self):
+        return self._depth > 0
+
+    def acquire(self, blocking=True):
+        if not self._lock.acquire(blocking):
+            return False
+        if self._depth == 0:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                self._lock.release()
+                if blocking:
+                    raise
+                return False
+            self._fd = fd
+        self._depth += 1
+        return True
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            # Closing the descriptor drops the flock
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ChangeFeed:
+    """The latest change announced by any process, as a small JSON file.
+
+    ``publish`` replaces the file atomically with a fresh ``token``, so
+    readers never see it half written and tell changes apart by comparing
+    tokens (stat() alone is unreliable: inodes are reused and mtimes can be
+    coarse).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def publish(self, state):
+        state = dict(state, token=uuid.uuid4().hex, pid=os.getpid())
+        write_atomic(self.path, json.dumps(state))
+        return state
@@ -0,0 +1,196 @@
+import json
+import logging
+import sqlite3
+import threading
+
+from promptpilot.versioning.index import lineage_path
+from promptpilot.versioning.storage import TreeStorage
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ("id", "name", "version", "parent_id", "created_at", "content_hash", "content")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prompts (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    parent_id TEXT,
+    created_at TEXT,
+    content_hash TEXT,
+    content TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS prompts_name_version ON prompts (name, version);
+CREATE INDEX IF NOT EXISTS prompts_parent_id ON prompts (parent_id);
+CREATE INDEX IF NOT EXISTS prompts_name_content_hash ON prompts (name, content_hash);
+"""
+
+INSERT = f"INSERT OR REPLACE INTO prompts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# Columns added after the first schema, for databases created before them
+MIGRATIONS = (
+    ("content_hash", "ALTER TABLE prompts ADD COLUMN content_hash TEXT"),
+    ("content", "ALTER TABLE prompts ADD COLUMN content TEXT"),
+)
+
+
+class SQLiteStorage(TreeStorage):
+    """Prompt history in a SQLite database shared by any number of processes.
+
+    The database runs in WAL mode so readers never block the writer. Lookups
+    and lineage queries run in SQL against the id, (name, version) and
+    parent_id indexes, so PromptTree never loads the full history.
+    """
+
+    indexed = True
+
+    def __init__(self, db_path='prompt_history.db', timeout=30):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as conn:
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(prompts)")}
+            if existing:
+                for column, statement in MIGRATIONS:
+                    if column not in existing:
+                        conn.execute(statement)
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        # sqlite3 connections are not shareable between threads; keep one each
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _query(self, sql, params=()):
+        return [self._node(row) for row in self._connection().execute(sql, params)]
+
+    @staticmethod
+    def _node(row):
+        node = {column: row[column] for column in COLUMNS}
+        # Content is stored JSON-encoded so text and chat prompts round-trip
+        if node["content"] is not None:
+            node["content"] = json.loads(node["content"])
+        return node
+
+    @staticmethod
+    def _row(node):
+        row = [node.get(column) for column in COLUMNS]
+        if row[-1] is not None:
+            row[-1] = json.dumps(row[-1])
+        return row
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # Storage
+
+    def load(self):
+        tree = {"prompts": {}}
+        for node in self._query("SELECT * FROM prompts ORDER BY rowid"):
+            tree["prompts"].setdefault(node["name"], []).append(node)
+        return tree
+
+    def save(self, tree):
+        rows = [self._row(node) for nodes in tree["prompts"].values() for node in nodes]
+        with self._connection() as conn:
+            conn.execute("DELETE FROM prompts")
+            conn.executemany(INSERT, rows)
+
+    def append(self, tree, nodes):
+        rows = [self._row(node) for node in nodes]
+        with self._connection() as conn:
+            conn.executemany(INSERT, rows)
+
+    # Queries, same interface as TreeIndex
+
+    def get(self, prompt_id):
+        rows = self._query("SELECT * FROM prompts WHERE id = ?", (prompt_id,))
+        return rows[0] if rows else None
+
+    def get_latest(self, name):
+        rows = self._query("SELECT * FROM prompts WHERE name = ? ORDER BY version DESC LIMIT 1", (name,))
+        return rows[0] if rows else None
+
+    def find_content(self, name, content_hash):
+        rows = self._query("SELECT * FROM prompts WHERE name = ? AND content_hash = ? ORDER BY version DESC LIMIT 1",
+                           (name, content_hash))
+        return rows[0] if rows else None
+
+    def nodes(self, name):
+        return self._query("SELECT * FROM prompts WHERE name = ? ORDER BY version", (name,))
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM prompts").fetchone()[0]
+
+    def versions_by_name(self):
+        versions = {}
+        for name, version in self._connection().execute("SELECT name, version FROM prompts ORDER BY name, version"):
+            versions.setdefault(name, []).append(version)
+        return versions
+
+    def next_version(self, name):
+        row = self._connection().execute(
+            "SELECT MAX(version) FROM prompts WHERE name = ?", (name,)).fetchone()
+        return (row[0] or 0) + 1
+
+    def get_children(self, prompt_id):
+        return self._query("SELECT * FROM prompts WHERE parent_id = ? ORDER BY rowid", (prompt_id,))
+
+    def ancestors(self, prompt_id):
+        # Depth is capped by the row count so a corrupt cycle still terminates
+        return self._query("""
+            WITH RECURSIVE chain(id, depth) AS (
+                SELECT parent_id, 1 FROM prompts WHERE id = :id AND parent_id IS NOT NULL
+                UNION
+                SELECT p.parent_id, chain.depth + 1 FROM prompts p JOIN chain ON p.id = chain.id
+                WHERE p.parent_id IS NOT NULL AND chain.depth < (SELECT COUNT(*) FROM prompts)
+            )
+            SELECT p.* FROM chain JOIN prompts p ON p.id = chain.id
+            WHERE p.id != :id
+            GROUP BY p.id ORDER BY MIN(chain.depth)
+        """, {"id": prompt_id})
+
+    def descendants(self, prompt_id):
+        return [row for row, _ in self._descendants_with_depth(prompt_id)]
+
+    def _descendants_with_depth(self, prompt_id):
+        rows = self._connection().execute("""
+            WITH RECURSIVE below(id, depth) AS (
+                SELECT id, 1 FROM prompts WHERE parent_id = :id
+                UNION
+                SELECT p.id, below.depth + 1 FROM prompts p JOIN below ON p.parent_id = below.id
+                WHERE below.depth < (SELECT COUNT(*) FROM prompts)
+            )
+            SELECT p.*, MIN(below.depth) AS depth FROM below JOIN prompts p ON p.id = below.id
+            WHERE p.id != :id
+            GROUP BY p.id ORDER BY depth, p.rowid
+        """, {"id": prompt_id})
+        return [(self._node(row), row["depth"]) for row in rows]
+
+    def subtree(self, prompt_id):
+        node = self.get(prompt_id)
+        if node is None:
+            return None
+        root = {"node": node, "children": []}
+        entries = {prompt_id: root}
+        # Rows arrive ordered by depth, so every parent is placed before its children
+        for child, _ in self._descendants_with_depth(prompt_id):
+            parent = entries.get(child["parent_id"])
+            if parent is None or child["id"] in entries:
+                continue
+            entry = {"node": child, "children": []}
+            parent["children"].append(entry)
+            entries[child["id"]] = entry
+        return root
+
+    def path(self, from_id, to_id):
+        return lineage_path(self, from_id, to_id)
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import tempfile
+
+from promptpilot.versioning.node import node_json
+
+logger = logging.getLogger(__name__)
+
+
+def write_atomic(path, text, fsync=False):
+    # Write to a temp file and rename it over path, so readers in other
+    # processes see either the old or the new content, never a partial file
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class TreeStorage:
+    """Where a PromptTree persists its nodes.
+
+    ``load`` returns the whole tree, ``save`` replaces it and ``append`` records
+    nodes just added to ``tree``. Stores with ``indexed = True`` also answer the
+    TreeIndex queries themselves, so PromptTree does not keep the tree in memory.
+    """
+
+    indexed = False
+
+    def load(self):
+        raise NotImplementedError
+
+    def save(self, tree):
+        raise NotImplementedError
+
+    def append(self, tree, nodes):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonFileStorage(TreeStorage):
+    """The whole tree as one pretty-printed JSON file, replaced on every change."""
+
+    def __init__(self, file_path='prompt_history.json'):
+        self.file_path = file_path
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            # Initialize with an empty dictionary of prompts
+            return {"prompts": {}}
+
+    def save(self, tree):
+        write_atomic(self.file_path, json.dumps(tree, indent=2, default=node_json))
+
+    def append(self, tree, nodes):
+        # No incremental format: appending means rewriting the whole file
+        self.save(tree)
+
+
+class JournalStorage(TreeStorage):
+    """A JSON snapshot plus an append-only journal of nodes added since.
+
+    Each append writes one JSON line per node to ``<file_path>.journal`` and
+    fsyncs it. Loading replays the journal on top of the snapshot and cuts a
+    torn last line off the file. Once ``compact_every`` nodes have been
+    journaled the tree is written to a new snapshot (temp file + rename) and
+    the journal is reset.
+    """
+
+    def __init__(self, file_path='prompt_history.json', compact_every=1000):
+        self.file_path = file_path
+        self.journal_path = file_path + '.journal'
+        self.compact_every = compact_every
+        self.journaled = 0
+        self._journal = None
+
+    def load(self):
+        try:
+            with open(self.file_path, 'r') as f:
+                tree = json.load(f)
+        except FileNotFoundError:
+            tree = {"prompts": {}}
+
+        self.journaled = 0
+        try:
+            with open(self.journal_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return tree
+        if data and not data.endswith(b'\n'):
+            # A torn last line: cut it off so the next append starts on a
+            # line of its own instead of being glued onto it
+            complete = data.rfind(b'\n') + 1
+            logger.warning(f"Dropping torn last line of {self.journal_path}")
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(complete)
+                os.fsync(f.fileno())
+            data = data[:complete]
+        lines = data.decode('utf-8').splitlines()
+
+        # Entries may already be in the snapshot if compaction was interrupted
+        seen = {node["id"] for nodes in tree["prompts"].values() for node in nodes}
+        for line_no, line in enumerate(lines, start=1):
+            try:
+                node = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable journal line {line_no} in {self.journal_path}")
+                continue
+            self.journaled += 1
+            if node["id"] in seen:
+                continue
+            seen.add(node["id"])
+            tree["prompts"].setdefault(node["name"], []).append(node)
+        return tree
+
+    def save(self, tree):
+        self.close()
+        write_atomic(self.file_path, json.dumps(tree, separators=(',', ':'), default=node_json), fsync=True)
+        # The snapshot now holds everything; start a fresh journal
+        with open(self.journal_path, 'w') as f:
+            os.fsync(f.fileno())
+        self.journaled = 0
+
+    def append(self, tree, nodes):
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(''.join(json.dumps(node, separators=(',', ':'), default=node_json) + '\n' for node in nodes))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self.journaled += len(nodes)
+        if self.journaled >= self.compact_every:
+            self.save(tree)
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
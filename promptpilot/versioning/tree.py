@@ -1,157 +1,843 @@
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
 import json
+import os
 from langfuse.model import TextPromptClient, ChatPromptClient
 from langfuse.api.resources.prompts.types import Prompt_Text, Prompt_Chat
 import logging
+import threading
+import time
+import uuid
+from promptpilot.versioning.cache import PromptCache
+from promptpilot.versioning.content import content_hash, diff_contents
+from promptpilot.versioning.index import TreeIndex
+from promptpilot.versioning.node import PromptNode, compact_tree
+from promptpilot.versioning.shared import ChangeFeed, FileLock
+from promptpilot.versioning.storage import JsonFileStorage, write_atomic
 
 logger = logging.getLogger(__name__)
 
+# Fields of a list_prompts entry; last_config can be large, so it is opt-in
+LISTING_FIELDS = ("name", "versions", "latest_version", "labels", "tags", "last_updated_at", "last_config")
+DEFAULT_LISTING_FIELDS = LISTING_FIELDS[:-1]
+
 class PromptTree:
-    def __init__(self, langfuse_client, file_path='prompt_history.json'):
+    def __init__(self, langfuse_client, file_path='prompt_history.json',
+                 max_workers=8, fetch_timeout_seconds=10, max_retries=2,
+                 incremental_sync=False, prompt_cache_ttl=60, prompt_cache_size=128,
+                 storage=None, sync_on_init='blocking', dedupe=None,
+                 compact_nodes=False, shared=False, refresh_interval=1.0,
+                 sync_retry_seconds=1.0, sync_retry_max_seconds=60.0):
         self.file_path = file_path
+        # Where the tree is persisted; defaults to rewriting file_path as JSON
+        self.storage = storage or JsonFileStorage(file_path)
+        # Last seen Langfuse state per prompt name, kept next to the tree file
+        self.watermark_path = os.path.splitext(file_path)[0] + '.watermark.json'
         self.langfuse_client = langfuse_client
-        self.tree = self.load_tree()
-        self.sync_with_langfuse()
+        # Bounds for the per-version fetches issued by sync_with_langfuse
+        self.max_workers = max_workers
+        self.fetch_timeout_seconds = fetch_timeout_seconds
+        self.max_retries = max_retries
+        self.incremental_sync = incremental_sync
+        # What create_prompt does with content identical to an existing version
+        # of the same name: None pushes anyway, 'skip' returns the existing
+        # node, 'alias' also moves the production label onto it, and that
+        # version is served until a newer one is created
+        if dedupe not in (None, 'skip', 'alias'):
+            raise ValueError(f"Unknown dedupe mode '{dedupe}'.")
+        self.dedupe = dedupe
+        # Hold nodes as slotted PromptNodes instead of dicts; same JSON on disk
+        self.compact_nodes = compact_nodes
+        # Resolved prompt clients served by get_latest_prompt; size 0 disables it
+        self.prompt_cache = PromptCache(ttl_seconds=prompt_cache_ttl, max_size=prompt_cache_size)
+        # Compiled text per name, keyed by (version, variables); see get_compiled_prompt
+        self._compiled = {}
+        # Bumped on every change to the local state; list_prompts and its
+        # ETag are derived from it
+        self.revision = 0
+        self._revision_prefix = uuid.uuid4().hex[:12]
+        self._listing = None
+        # Labels, tags and config per name as last listed by Langfuse
+        watermark = self.load_watermark()
+        self._listing_meta = watermark["prompts"]
+        # Versions the production label was moved back to in alias mode, per
+        # name: {"version": served, "latest": newest version at the time}
+        self._aliases = watermark.get("aliases", {})
+        # Serializes writers (syncs and creations); readers never take it
+        self._lock = threading.RLock()
+        # Sync state: pending -> syncing -> ready | failed
+        self.sync_state = 'pending'
+        self.last_synced_at = None
+        self.last_sync_error = None
+        self.ready = threading.Event()
+        self._sync_thread = None
+        # A failed background sync is retried after sync_retry_seconds,
+        # doubling up to sync_retry_max_seconds, until one succeeds
+        self.sync_retry_seconds = sync_retry_seconds
+        self.sync_retry_max_seconds = sync_retry_max_seconds
+        # Shared mode is for several processes serving the same files: writers
+        # take a file lock and announce their changes, and readers reload what
+        # other processes changed (checked every refresh_interval seconds)
+        self.shared = shared or sync_on_init == 'leader'
+        self.refresh_interval = refresh_interval
+        self.is_leader = False
+        self._follows_leader = sync_on_init == 'leader'
+        if self.shared:
+            base = os.path.splitext(file_path)[0]
+            self._file_lock = FileLock(base + '.lock')
+            self._leader_lock = FileLock(base + '.leader')
+            self._changes = ChangeFeed(base + '.changes.json')
+            # None so the first check mirrors the leader's sync state
+            self._seen_change = None
+            # Token of the change the local state reflects, once loaded
+            self._state_token = None
+            self._next_follow = 0.0
+        if self.storage.indexed:
+            # The store answers queries itself; nothing is held in memory
+            self._tree = None
+            self.index = self.storage
+        else:
+            self.tree = self.load_tree()
+
+        # 'blocking' syncs before returning, 'background' serves the local
+        # snapshot while a thread syncs, 'leader' does that in only one of the
+        # processes sharing the files, 'never' leaves it to the caller
+        if sync_on_init == 'blocking':
+            self.sync_with_langfuse()
+        elif sync_on_init == 'background':
+            self.start_background_sync()
+        elif sync_on_init == 'leader':
+            if not self._claim_leadership():
+                self._follow(force=True)
+        elif sync_on_init != 'never':
+            raise ValueError(f"Unknown sync_on_init mode '{sync_on_init}'.")
+
+    @property
+    def tree(self):
+        # Indexed stores are materialized on demand, for inspection only
+        if self.storage.indexed:
+            return self.storage.load()
+        return self._tree
+
+    @tree.setter
+    def tree(self, tree):
+        # Every wholesale replacement of the tree goes through the index
+        if self.storage.indexed:
+            self.storage.save(tree)
+        else:
+            # Build the index first so readers never see a half-swapped tree
+            index = TreeIndex(tree)
+            self._tree = tree
+            self.index = index
+        self._invalidate()
+
+    def start_background_sync(self, incremental=None):
+        if self._sync_thread is not None and self._sync_thread.is_alive():
+            return self._sync_thread
+        self._sync_thread = threading.Thread(
+            target=self._sync_until_ready,
+            kwargs={"incremental": incremental},
+            name="prompt-tree-sync",
+            daemon=True,
+        )
+        self._sync_thread.start()
+        return self._sync_thread
+
+    def _sync_until_ready(self, incremental=None):
+        delay = self.sync_retry_seconds
+        while True:
+            self.sync_with_langfuse(incremental)
+            if self.sync_state != 'failed':
+                return
+            logger.warning(f"Retrying the prompt sync in {delay:.1f}s")
+            time.sleep(delay)
+            delay = min(delay * 2, self.sync_retry_max_seconds)
+
+    def wait_for_sync(self, timeout=None):
+        if not self.shared:
+            return self.ready.wait(timeout)
+        # Followers learn about the leader's syncs by polling the change feed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.ready.is_set():
+            self._follow()
+            remaining = self.refresh_interval if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.ready.wait(max(0.01, min(self.refresh_interval, remaining)))
+        return self.ready.is_set()
+
+    def sync_status(self):
+        self._follow()
+        return {
+            "state": self.sync_state,
+            "ready": self.ready.is_set(),
+            "last_synced_at": self.last_synced_at,
+            "last_error": self.last_sync_error,
+        }
+
+    def _claim_leadership(self, wait=True):
+        # Whoever holds the leader lock syncs for every process. It is taken
+        # under the write lock, so followers never mirror a state from before
+        if not self._file_lock.acquire(blocking=wait):
+            return False
+        try:
+            if not self._leader_lock.acquire(blocking=False):
+                return False
+            self.is_leader = True
+            self.sync_state = 'syncing'
+            self._publish()
+        finally:
+            self._file_lock.release()
+        logger.info(f"Process {os.getpid()} syncs prompts with Langfuse for {self.file_path}")
+        self.start_background_sync()
+        return True
+
+    @contextmanager
+    def _writing(self):
+        # Entered with self._lock held. In shared mode writers also hold the
+        # file lock, start from the latest shared state and announce the change
+        if not self.shared:
+            yield
+            return
+        with self._file_lock:
+            self._follow(force=True)
+            try:
+                yield
+            finally:
+                self._publish()
+
+    def _publish(self):
+        change = self._changes.publish({
+            "sync_state": self.sync_state,
+            "last_synced_at": self.last_synced_at,
+            "last_error": self.last_sync_error,
+        })
+        self._seen_change = self._state_token = change["token"]
+
+    def _follow_due(self):
+        # Whether _follow would look at the change feed now
+        return self.shared and time.monotonic() >= self._next_follow
+
+    def _follow(self, force=False):
+        # Reload what another process changed; cheap enough for every read
+        if not self.shared or not (force or self._follow_due()):
+            return
+        self._next_follow = time.monotonic() + self.refresh_interval
+        if self._follows_leader and not self.is_leader and not force:
+            # Take over the syncs if the leader process has gone
+            self._claim_leadership(wait=False)
+        change = self._changes.read()
+        if change.get("token") == self._seen_change:
+            return
+        # A local writer is busy otherwise; it follows before writing anyway
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._seen_change = change.get("token")
+            if self.storage.indexed:
+                self._invalidate()
+            else:
+                self.tree = self.load_tree()
+            watermark = self.load_watermark()
+            self._listing_meta = watermark["prompts"]
+            self._aliases = watermark.get("aliases", {})
+            self._state_token = self._seen_change
+            if self._follows_leader and not self.is_leader:
+                self.sync_state = change.get("sync_state", self.sync_state)
+                self.last_synced_at = change.get("last_synced_at")
+                self.last_sync_error = change.get("last_error")
+                if self.sync_state == 'ready':
+                    self.ready.set()
+        finally:
+            self._lock.release()
 
     def load_tree(self):
+        tree = self.storage.load()
+        if self.compact_nodes:
+            compact_tree(tree)
+        return tree
+
+    def save_tree(self):
+        # Indexed stores are written through as the tree changes
+        if not self.storage.indexed:
+            self.storage.save(self.tree)
+
+    def _add_nodes(self, nodes):
+        # Record freshly created nodes in the tree, index, cache and storage
+        if not self.storage.indexed:
+            for node in nodes:
+                self._tree["prompts"].setdefault(node["name"], []).append(node)
+                self.index.add(node)
+        self.storage.append(self._tree, nodes)
+        names = {node["name"] for node in nodes}
+        # A new version takes the production label back from an alias
+        if names & set(self._aliases):
+            self._aliases = {name: alias for name, alias in self._aliases.items() if name not in names}
+            self._save_aliases()
+        for name in names:
+            self._invalidate(name)
+
+    def _invalidate(self, name=None):
+        # Drop resolved and compiled prompts for one name, or for all of them
+        self.revision += 1
+        self.prompt_cache.invalidate(name)
+        if name is None:
+            self._compiled = {}
+        else:
+            self._compiled.pop(name, None)
+
+    def load_watermark(self):
         try:
-            with open(self.file_path, 'r') as f:
+            with open(self.watermark_path, 'r') as f:
                 return json.load(f)
-        except FileNotFoundError:
-            # Initialize with an empty dictionary of prompts
-            return {"prompts": {}}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"synced_at": None, "prompts": {}}
 
-    def save_tree(self):
-        with open(self.file_path, 'w') as f:
-            json.dump(self.tree, f, indent=2)
+    def save_watermark(self, langfuse_prompts):
+        # Aliases survive a sync unless a newer version showed up since
+        newest = {p.name: max(p.versions, default=0) for p in langfuse_prompts}
+        self._aliases = {name: alias for name, alias in self._aliases.items()
+                         if newest.get(name, 0) <= alias["latest"]}
+        watermark = {
+            "synced_at": datetime.now(timezone.utc).isoformat(),
+            "prompts": {
+                p.name: {
+                    "versions": list(p.versions),
+                    "last_updated_at": p.last_updated_at.isoformat() if p.last_updated_at else '',
+                    "labels": list(p.labels or []),
+                    "tags": list(p.tags or []),
+                    "last_config": p.last_config,
+                }
+                for p in langfuse_prompts
+            },
+            "aliases": self._aliases,
+        }
+        write_atomic(self.watermark_path, json.dumps(watermark))
+        self._listing_meta = watermark["prompts"]
+        self.revision += 1
+
+    def _save_aliases(self):
+        write_atomic(self.watermark_path, json.dumps(dict(self.load_watermark(), aliases=self._aliases)))
+
+    def _record_alias(self, prompt_info):
+        # Serve the version the production label was just moved to
+        name = prompt_info["name"]
+        latest = self.index.get_latest(name)
+        self._aliases = dict(self._aliases, **{name: {
+            "version": prompt_info["version"],
+            "latest": max(prompt_info["version"], latest["version"] if latest else 0),
+        }})
+        self._save_aliases()
+        self._invalidate(name)
+
+    def _served_prompt(self, name):
+        # The node get_latest_prompt serves: the aliased version, if any,
+        # otherwise the newest one
+        alias = self._aliases.get(name)
+        if alias is not None:
+            prompt_info = self.index.get(f"{name}_v{alias['version']}")
+            if prompt_info is not None:
+                return prompt_info
+        return self.index.get_latest(name)
+
+    @property
+    def revision_tag(self):
+        # Opaque ETag value. Processes sharing the files tag their state with
+        # the change-feed token that announced it, so any of them can answer
+        # a revalidation; otherwise the prefix keeps restarts apart
+        self._follow()
+        if self.shared and self._state_token is not None:
+            return self._state_token
+        return f"{self._revision_prefix}-{self.revision}"
+
+    def list_prompts(self, after=None, limit=None, fields=None):
+        """Summaries of the local prompts, sorted by name, for /prompts.
+
+        Returns ``(entries, next_after)``: up to ``limit`` entries for names
+        after ``after``, and the value of ``after`` for the following page
+        (None on the last one). ``fields`` picks the keys of each entry and
+        defaults to all but ``last_config``. Served from a snapshot rebuilt
+        only when ``revision`` changes.
+        """
+        fields = DEFAULT_LISTING_FIELDS if fields is None else tuple(fields)
+        unknown = set(fields) - set(LISTING_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown prompt fields: {', '.join(sorted(unknown))}.")
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1.")
+        self._follow()
+        names, entries = self._listing_snapshot()
+        start = bisect.bisect_right(names, after) if after is not None else 0
+        end = len(names) if limit is None else min(len(names), start + limit)
+        page = [{field: entry[field] for field in fields} for entry in entries[start:end]]
+        return page, (names[end - 1] if end < len(names) else None)
+
+    def _listing_snapshot(self):
+        listing = self._listing
+        revision = self.revision
+        if listing is not None and listing[0] == revision:
+            return listing[1]
+        versions = self.index.versions_by_name()
+        names = sorted(versions)
+        entries = []
+        for name in names:
+            meta = self._listing_meta.get(name, {})
+            entries.append({
+                "name": name,
+                "versions": versions[name],
+                "latest_version": versions[name][-1] if versions[name] else None,
+                "labels": meta.get("labels", []),
+                "tags": meta.get("tags", []),
+                "last_updated_at": meta.get("last_updated_at", ''),
+                "last_config": meta.get("last_config"),
+            })
+        self._listing = (revision, (names, entries))
+        return names, entries
 
     def create_prompt(self, name, content, config, parent_id=None):
+        # Version assignment, the push and the local update happen as one step
+        with self._lock, self._writing():
+            return self._create_prompt(name, content, config, parent_id)
+
+    def _create_prompt(self, name, content, config, parent_id):
+        prompt_info = self._prepare_prompt(name, content, parent_id)
+
+        duplicate = self._find_duplicate(prompt_info)
+        if duplicate:
+            self._alias_prompt(duplicate)
+            return duplicate
+
+        # Push to Langfuse
+        try:
+            self._push_prompt(name, content, config, parent_id)
+        except Exception as e:
+            logger.error(f"Error creating prompt '{name}': {e}")
+            raise
+
+        # Update and persist the local tree
+        self._add_nodes([prompt_info])
+
+        return prompt_info
+
+    def _prepare_prompt(self, name, content, parent_id, version=None):
         # Validate the parent ID
         if parent_id:
             if not self.get_prompt_by_id(parent_id):
                 raise ValueError(f"Parent ID '{parent_id}' does not exist.")
 
         # Assign version as the next available version for the prompt name
-        version = self.get_next_version(name)
+        if version is None:
+            version = self.get_next_version(name)
 
-        # Create a unique ID for the prompt version
-        prompt_id = f"{name}_v{version}"
-        timestamp = datetime.now(timezone.utc).isoformat()
-
-        # Prepare minimal prompt info
-        prompt_info = {
-            "id": prompt_id,
+        # Prepare minimal prompt info, with a unique ID for the prompt version
+        return self._new_node({
+            "id": f"{name}_v{version}",
             "name": name,
             "version": version,
             "parent_id": parent_id,
-            "created_at": timestamp
-        }
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "content_hash": content_hash(content),
+            "content": content
+        })
 
-        # Push to Langfuse
+    def _new_node(self, node):
+        return PromptNode.from_dict(node) if self.compact_nodes else node
+
+    def _find_duplicate(self, prompt_info):
+        if self.dedupe is None:
+            return None
+        return self.index.find_content(prompt_info["name"], prompt_info["content_hash"])
+
+    def _alias_prompt(self, prompt_info):
+        if self.dedupe != 'alias':
+            return
         try:
-            self.langfuse_client.create_prompt(
-                name=name,
-                prompt=content,
-                config=config,
-                labels=["production"],  # Adjust labels as needed
-                tags=config.get("tags", [])  # Assuming tags are part of config
-            )
+            self.langfuse_client.client.prompt_version.update(
+                name=prompt_info["name"], version=prompt_info["version"], new_labels=["production"])
         except Exception as e:
-            logger.error(f"Error creating prompt '{name}': {e}")
+            logger.error(f"Error labelling prompt '{prompt_info['id']}' as production: {e}")
             raise
+        self._record_alias(prompt_info)
 
-        # Update local tree
-        if name not in self.tree["prompts"]:
-            self.tree["prompts"][name] = []
-        self.tree["prompts"][name].append(prompt_info)
+    def create_prompts(self, items):
+        """Register many prompt versions at once.
 
-        # Save the updated tree locally
-        self.save_tree()
+        ``items`` are dicts with ``name``, ``content`` and optionally ``config``
+        and ``parent_id``. Parents are validated up front and versions assigned
+        per name; names are pushed concurrently (at most max_workers at a time)
+        but each name's versions in order, stopping at its first failure so the
+        local numbering never drifts from Langfuse. Everything that was pushed
+        is persisted in one write. With ``dedupe`` set, items whose content
+        matches an existing or earlier item of the same name are not pushed.
+        Returns one ``{"prompt", "error", "duplicate"}`` dict per item, in
+        input order.
+        """
+        with self._lock, self._writing():
+            results, queues, duplicates = self._plan_prompts(items)
 
-        return prompt_info
+            def push_versions(queue):
+                for i, prompt_info in queue:
+                    item = items[i]
+                    try:
+                        self._push_prompt(item["name"], item["content"], item.get("config") or {},
+                                          item.get("parent_id"))
+                    except Exception as e:
+                        logger.error(f"Error creating prompt '{item['name']}': {e}")
+                        self._skip_rest(results, queue, i, e)
+                        return
+                    results[i]["prompt"] = prompt_info
 
-    def sync_with_langfuse(self):
-        try:
-            # Fetch all prompts from Langfuse
-            response = self.langfuse_client.client.prompts.list()
-            langfuse_prompts = response.data  # List of PromptMeta objects
-        except Exception as e:
-            logger.error(f"Error fetching prompts from Langfuse: {e}")
-            return
+            if self.max_workers <= 1 or len(queues) <= 1:
+                for queue in queues:
+                    push_versions(queue)
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(queues))) as executor:
+                    list(executor.map(push_versions, queues))
+
+            self._record_created(results)
+            for i, original, alias in duplicates:
+                if alias:
+                    try:
+                        self._alias_prompt(original)
+                    except Exception as e:
+                        results[i]["error"] = str(e)
+                        continue
+                self._resolve_duplicate(results, i, original)
+        return results
+
+    def _plan_prompts(self, items):
+        # Validate parents and assign versions in one pass. Returns the result
+        # slots, one ordered (index, prompt_info) queue per name, and the
+        # (index, original, alias) duplicates, where original is an existing
+        # node or the index of an earlier item in the batch. Only the last
+        # item of a name may move its production label back to an old version
+        results = [{"prompt": None, "error": None, "duplicate": False} for _ in items]
+        next_versions = {}
+        queues = {}
+        planned = {}
+        duplicates = []
+        for i, item in enumerate(items):
+            name = item["name"]
+            try:
+                prompt_info = self._prepare_prompt(name, item["content"], item.get("parent_id"),
+                                                   next_versions.get(name))
+            except ValueError as e:
+                results[i]["error"] = str(e)
+                continue
+            if self.dedupe is not None:
+                key = (name, prompt_info["content_hash"])
+                original = self._find_duplicate(prompt_info)
+                if original is None:
+                    original = planned.get(key)
+                if original is not None:
+                    duplicates.append((i, original))
+                    continue
+                planned[key] = i
+            next_versions[name] = prompt_info["version"] + 1
+            queues.setdefault(name, []).append((i, prompt_info))
+        last = {item["name"]: i for i, item in enumerate(items)}
+        duplicates = [(i, original, not isinstance(original, int) and last[items[i]["name"]] == i)
+                      for i, original in duplicates]
+        return results, list(queues.values()), duplicates
+
+    @staticmethod
+    def _resolve_duplicate(results, i, original):
+        results[i]["duplicate"] = True
+        if not isinstance(original, int):
+            results[i]["prompt"] = original
+        else:
+            results[i]["prompt"] = results[original]["prompt"]
+            results[i]["error"] = results[original]["error"]
+
+    @staticmethod
+    def _skip_rest(results, queue, failed_at, error):
+        # Later versions of the same name would be misnumbered in Langfuse
+        skipping = False
+        for i, prompt_info in queue:
+            if i == failed_at:
+                results[i]["error"] = str(error)
+                skipping = True
+            elif skipping:
+                results[i]["error"] = (f"Not pushed: an earlier version of '{prompt_info['name']}' "
+                                       f"failed ({error}).")
+
+    def _record_created(self, results):
+        # Persist only what actually reached Langfuse, once
+        created = [result["prompt"] for result in results if result["prompt"]]
+        if created:
+            self._add_nodes(created)
+
+    def _push_prompt(self, name, content, config, parent_id):
+        self.langfuse_client.create_prompt(**self._prompt_payload(name, content, config, parent_id))
+
+    @staticmethod
+    def _prompt_payload(name, content, config, parent_id):
+        # Keep the lineage in the Langfuse config so a sync can rebuild it
+        config = dict(config, parent_id=parent_id)
+        return dict(
+            name=name,
+            prompt=content,
+            config=config,
+            labels=["production"],  # Adjust labels as needed
+            tags=config.get("tags", [])  # Assuming tags are part of config
+        )
+
+    # Times a sync lists Langfuse when another process keeps writing to the
+    # shared files while it fetches
+    SYNC_ATTEMPTS = 3
+
+    def sync_with_langfuse(self, incremental=None):
+        # Readers keep using the current tree and index until the rebuilt
+        # ones are swapped in at the end. Langfuse is read without the file
+        # lock, so other processes can go on creating prompts meanwhile
+        with self._lock:
+            self.sync_state = 'syncing'
+            try:
+                synced = self._sync(incremental)
+            except Exception as e:
+                logger.error(f"Error syncing prompts with Langfuse: {e}", exc_info=True)
+                self.last_sync_error = str(e)
+                synced = False
+            if not synced:
+                with self._writing():
+                    self._finish_sync(False)
+
+    def _finish_sync(self, synced):
+        if synced:
+            self.sync_state = 'ready'
+            self.last_synced_at = datetime.now(timezone.utc).isoformat()
+            self.last_sync_error = None
+            self.ready.set()
+        else:
+            self.sync_state = 'failed'
+
+    def _sync(self, incremental):
+        # An incremental sync reuses local nodes: versions never change once
+        # created, so only versions missing from the local tree are fetched
+        if incremental is None:
+            incremental = self.incremental_sync
+
+        for attempt in range(self.SYNC_ATTEMPTS):
+            self._follow(force=True)
+            mark = self._shared_mark()
+            try:
+                # Fetch all prompts from Langfuse
+                response = self.langfuse_client.client.prompts.list()
+                langfuse_prompts = response.data  # List of PromptMeta objects
+            except Exception as e:
+                logger.error(f"Error fetching prompts from Langfuse: {e}")
+                self.last_sync_error = str(e)
+                return False
+
+            local_versions, keys = self._plan_sync(langfuse_prompts, incremental)
+
+            # Fetch the details of every missing version concurrently; results come
+            # back in submission order so the rebuilt tree is deterministic
+            details = dict(zip(keys, self._fetch_details(keys)))
+
+            with self._writing():
+                # What another process pushed since may be missing from the
+                # listing; list again rather than drop it
+                if self._shared_mark() != mark and attempt + 1 < self.SYNC_ATTEMPTS:
+                    continue
+                self._apply_sync(langfuse_prompts, incremental, local_versions, details)
+                self._finish_sync(True)
+                return True
+
+    def _shared_mark(self):
+        # The shared change the local state reflects, to tell whether another
+        # process wrote in between
+        return self._seen_change if self.shared else None
+
+    def _plan_sync(self, langfuse_prompts, incremental):
+        # Work out which versions need their details fetched: the ones not in
+        # the local tree, since versions never change once created
+        local_versions = {}
+        keys = []
+        for p in langfuse_prompts:
+            local = {node["version"]: node for node in self.index.nodes(p.name)} if incremental else {}
+            local_versions[p.name] = local
+            keys.extend((p.name, version) for version in p.versions if version not in local)
+        return local_versions, keys
 
+    def _apply_sync(self, langfuse_prompts, incremental, local_versions, details):
         # Rebuild the local tree from Langfuse
-        self.tree = {"prompts": {}}
+        tree = {"prompts": {}}
+        new_nodes = []
+        reused = 0
+        in_order = True
 
         for p in langfuse_prompts:
             prompt_name = p.name
-            versions = p.versions  # List of version numbers
-
-            if prompt_name not in self.tree["prompts"]:
-                self.tree["prompts"][prompt_name] = []
-
-            for version in versions:
-                prompt_id = f"{prompt_name}_v{version}"
-
-                # Fetch the prompt details from Langfuse
-                try:
-                    prompt_client = self.langfuse_client.get_prompt(
-                        name=prompt_name,
-                        version=version,
-                        cache_ttl_seconds=0,  # Disable caching to get the latest
-                        max_retries=2,
-                        fetch_timeout_seconds=10,
-                    )
-                    config = prompt_client.config
-                    parent_id = config.get("parent_id")
-                except Exception as e:
-                    logger.error(f"Error fetching prompt '{prompt_name}' version {version}: {e}")
-                    parent_id = None
-
-                # Prepare minimal prompt info
-                prompt_info = {
-                    "id": prompt_id,
-                    "name": prompt_name,
-                    "version": version,
-                    "parent_id": parent_id,
-                    "created_at": p.last_updated_at.isoformat() if p.last_updated_at else ''
-                }
+            local = local_versions[prompt_name]
+
+            if prompt_name not in tree["prompts"]:
+                tree["prompts"][prompt_name] = []
+
+            for version in p.versions:
+                prompt_info = local.get(version)
+                if prompt_info is None:
+                    detail = details.get((prompt_name, version))
+                    if detail is None:
+                        if incremental:
+                            # Leave it missing so the next sync fetches it again
+                            continue
+                        detail = self.NO_DETAILS
+                    # Prepare minimal prompt info
+                    prompt_info = self._new_node({
+                        "id": f"{prompt_name}_v{version}",
+                        "name": prompt_name,
+                        "version": version,
+                        "parent_id": detail["parent_id"],
+                        "created_at": p.last_updated_at.isoformat() if p.last_updated_at else '',
+                        "content_hash": content_hash(detail["content"]) if detail["content"] is not None else None,
+                        "content": detail["content"]
+                    })
+                    new_nodes.append(prompt_info)
+                    # A version fetched late, after a newer one was stored
+                    in_order = in_order and version > max(local, default=0)
+                else:
+                    reused += 1
+
+                tree["prompts"][prompt_name].append(prompt_info)
+
+        # Save the updated tree locally. If nothing local was dropped and the
+        # new nodes come after the local ones, they are appended; otherwise
+        # the tree is replaced
+        if incremental and reused == self.index.count() and in_order:
+            if new_nodes:
+                self._add_nodes(new_nodes)
+        else:
+            self.tree = tree
+            self.save_tree()
+        self.save_watermark(langfuse_prompts)
+
+    def _fetch_prompt(self, name, version):
+        return self.langfuse_client.get_prompt(
+            name=name,
+            version=version,
+            cache_ttl_seconds=0,  # Disable caching to get the latest
+            max_retries=self.max_retries,
+            fetch_timeout_seconds=self.fetch_timeout_seconds,
+        )
 
-                self.tree["prompts"][prompt_name].append(prompt_info)
+    # Stand-in, in a full sync, when a version's details could not be fetched
+    NO_DETAILS = {"parent_id": None, "content": None}
 
-        # Save the updated tree locally
-        self.save_tree()
+    def _fetch_detail(self, name, version):
+        # Fetch the prompt details from Langfuse: lineage and content; None
+        # when the fetch failed
+        try:
+            prompt_client = self._fetch_prompt(name, version)
+            return {"parent_id": prompt_client.config.get("parent_id"), "content": prompt_client.prompt}
+        except Exception as e:
+            logger.error(f"Error fetching prompt '{name}' version {version}: {e}")
+            return None
+
+    def _fetch_details(self, keys):
+        # Resolve (name, version) pairs to details, at most max_workers at a time
+        if self.max_workers <= 1 or len(keys) <= 1:
+            return [self._fetch_detail(name, version) for name, version in keys]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(keys))) as executor:
+            return list(executor.map(lambda key: self._fetch_detail(*key), keys))
 
     def get_prompt_by_id(self, prompt_id):
-        for prompts in self.tree["prompts"].values():
-            for prompt in prompts:
-                if prompt["id"] == prompt_id:
-                    return prompt
-        return None
+        return self.index.get(prompt_id)
 
     def get_next_version(self, name):
-        # Get the list of versions for the prompt name
-        versions = [p['version'] for p in self.tree['prompts'].get(name, [])]
-        return max(versions, default=0) + 1
+        # Langfuse's last listing counts too: a version whose details could
+        # not be fetched is missing from the tree, but its number is taken
+        listed = self._listing_meta.get(name, {}).get("versions") or [0]
+        return max(self.index.next_version(name), max(listed) + 1)
+
+    def get_children(self, prompt_id):
+        return self.index.get_children(prompt_id)
+
+    def get_ancestors(self, prompt_id):
+        return self.index.ancestors(prompt_id)
+
+    def get_descendants(self, prompt_id):
+        return self.index.descendants(prompt_id)
+
+    def get_subtree(self, prompt_id):
+        return self.index.subtree(prompt_id)
+
+    def get_path(self, from_id, to_id):
+        return self.index.path(from_id, to_id)
+
+    def get_content(self, prompt_id):
+        # Local content when the node has it, otherwise one fetch from Langfuse
+        prompt_info = self.get_prompt_by_id(prompt_id)
+        if prompt_info is None:
+            raise ValueError(f"Prompt ID '{prompt_id}' does not exist.")
+        if prompt_info.get("content") is not None:
+            return prompt_info["content"]
+        return self._fetch_prompt(prompt_info["name"], prompt_info["version"]).prompt
+
+    def diff(self, prompt_id, other_id=None, context=3):
+        """Unified diff from ``prompt_id`` to ``other_id``.
+
+        Without ``other_id`` the node is compared with its parent. Versions
+        with the same content hash short-circuit to an empty diff.
+        """
+        if other_id is None:
+            prompt_info = self.get_prompt_by_id(prompt_id)
+            if prompt_info is None:
+                raise ValueError(f"Prompt ID '{prompt_id}' does not exist.")
+            if not prompt_info["parent_id"]:
+                raise ValueError(f"Prompt ID '{prompt_id}' has no parent to diff against.")
+            prompt_id, other_id = prompt_info["parent_id"], prompt_id
+
+        old, new = self.get_prompt_by_id(prompt_id), self.get_prompt_by_id(other_id)
+        if old and new and old.get("content_hash") and old.get("content_hash") == new.get("content_hash"):
+            return ''
+        return diff_contents(self.get_content(prompt_id), self.get_content(other_id),
+                             prompt_id, other_id, context)
 
     def get_latest_prompt(self, name):
-        if name in self.tree['prompts']:
-            prompts = self.tree['prompts'][name]
-            # Sort prompts by version descending
-            sorted_prompts = sorted(prompts, key=lambda x: x['version'], reverse=True)
-            latest_prompt_info = sorted_prompts[0]
+        self._follow()
+        try:
+            return self.prompt_cache.get(name, lambda: self._fetch_latest_prompt(name))
+        except Exception as e:
+            logger.error(f"Error fetching latest prompt '{name}': {e}")
+            return None
 
-            # Fetch the full prompt details from Langfuse
-            try:
-                prompt_client = self.langfuse_client.get_prompt(
-                    name=name,
-                    version=latest_prompt_info['version'],
-                    cache_ttl_seconds=0,
-                    max_retries=2,
-                    fetch_timeout_seconds=10,
-                )
-                return prompt_client
-            except Exception as e:
-                logger.error(f"Error fetching latest prompt '{name}': {e}")
-                return None
-        else:
-            return None
\ No newline at end of file
+    # Compiled variants kept per prompt name before they are all dropped
+    COMPILED_PER_NAME = 32
+
+    def get_compiled_prompt(self, name, **variables):
+        """Return ``(prompt_client, compiled)`` for the latest version of ``name``.
+
+        The compiled text is memoized per (name, version, variables), so a warm
+        request neither fetches nor compiles. ``(None, None)`` when there is
+        no version to serve.
+        """
+        prompt_client = self.get_latest_prompt(name)
+        if prompt_client is None:
+            return None, None
+        return prompt_client, self.compile_prompt(name, prompt_client, **variables)
+
+    def compile_prompt(self, name, prompt_client, **variables):
+        # The compile half of get_compiled_prompt, for callers timing the
+        # lookup and the compile apart
+        key = (prompt_client.version, tuple(sorted(variables.items())))
+        compiled = self._compiled.get(name)
+        if compiled is None:
+            compiled = self._compiled.setdefault(name, {})
+        text = compiled.get(key)
+        if text is None:
+            text = prompt_client.compile(**variables)
+            if len(compiled) >= self.COMPILED_PER_NAME:
+                compiled.clear()
+            compiled[key] = text
+        return text
+
+    def _fetch_latest_prompt(self, name):
+        # Resolve the version at load time so a background refresh follows the tree
+        latest_prompt_info = self._served_prompt(name)
+        if latest_prompt_info is None:
+            return None
+        # Fetch the full prompt details from Langfuse
+        return self._fetch_prompt(name, latest_prompt_info['version'])
@@ -9,6 +9,7 @@ setup(
         # For example:
         # 'flask',
         'langfuse',
+        'httpx',
     ],
     author='Federico Rubbi',
     description='A package for prompt optimization',
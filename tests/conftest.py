@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+
+@pytest.fixture
+def file_path(tmp_path):
+    return os.path.join(tmp_path, 'prompt_history.json')
+
+
+class Clock:
+    # Time moves only when a test sets ``now``, or by ``step`` on every reading
+    def __init__(self):
+        self.now = 0.0
+        self.step = 0.0
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
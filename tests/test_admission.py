@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.admission import AdmissionController, Overloaded, TokenBuckets, admission_from_env, client_key
+from promptpilot.versioning.tree import PromptTree
+
+
+def test_token_bucket_allows_bursts_then_refills(clock):
+    buckets = TokenBuckets(rate=2, burst=3, clock=clock)
+
+    assert [buckets.take("a") for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("a") == pytest.approx(0.5)
+    assert buckets.take("b") == 0
+    clock.now += 0.5
+    assert buckets.take("a") == 0
+
+
+def test_rate_limited_client_gets_429_with_retry_after(clock):
+    controller = AdmissionController(rate=1, burst=1, clock=clock)
+    with controller.admit("a"):
+        pass
+    with pytest.raises(Overloaded) as refused:
+        controller.acquire("a")
+    assert (refused.value.status, refused.value.retry_after) == (429, 1)
+    assert controller.stats()["rejected"]["rate_limited"] == 1
+
+
+def test_full_queue_and_expired_wait_are_refused():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, max_wait=0.1)
+    started_at = controller.acquire()
+    outcome = []
+
+    def waiter():
+        try:
+            controller.acquire()
+            outcome.append("admitted")
+        except Overloaded as e:
+            outcome.append(e.status)
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while controller.stats()["queue_depth"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+    with pytest.raises(Overloaded) as refused:
+        controller.acquire()
+    assert refused.value.status == 503
+    thread.join()
+    controller.release(started_at)
+
+    assert outcome == [503]
+    stats = controller.stats()
+    assert stats["rejected"]["queue_full"] == 1
+    assert stats["rejected"]["deadline"] == 1
+    assert (stats["active"], stats["queue_depth"]) == (0, 0)
+
+
+def test_queued_request_is_admitted_when_a_slot_frees():
+    controller = AdmissionController(max_concurrency=1, max_queue=4, max_wait=5)
+    started_at = controller.acquire()
+    admitted = threading.Event()
+
+    def waiter():
+        controller.release(controller.acquire())
+        admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not admitted.is_set()
+    controller.release(started_at)
+    thread.join()
+
+    assert admitted.is_set()
+    assert controller.stats()["admitted"] == 2
+    assert controller.stats()["max_wait_seconds"] >= 0.04
+
+
+def test_request_that_cannot_make_its_deadline_is_refused_on_arrival(clock):
+    controller = AdmissionController(max_concurrency=1, max_queue=4, max_wait=2, clock=clock)
+    started_at = controller.acquire()
+    clock.now += 3
+    controller.release(started_at)
+    controller.acquire()
+
+    # Recent requests held their slot for 3 s, more than the 2 s wait allowed
+    with pytest.raises(Overloaded) as refused:
+        controller.acquire()
+    assert (refused.value.status, refused.value.retry_after) == (503, 3)
+    assert controller.stats()["queue_depth"] == 0
+
+
+def test_admission_from_env():
+    assert admission_from_env({}) is None
+    controller = admission_from_env({"ADMISSION_MAX_CONCURRENCY": "2", "RATE_LIMIT_RPS": "0.5"})
+    assert (controller.max_concurrency, controller.max_queue, controller.buckets.burst) == (2, 8, 1)
+
+
+def test_client_key_trusts_only_the_configured_header():
+    headers = {"X-Client-Id": "spoofed", "X-Forwarded-For": "spoofed, 10.0.0.7"}
+    assert client_key("10.0.0.1", headers) == "10.0.0.1"
+    assert client_key("10.0.0.1", headers, "X-Forwarded-For") == "10.0.0.7"
+    assert client_key("10.0.0.1", {}, "X-Forwarded-For") == "10.0.0.1"
+
+
+def test_message_routes_refuse_with_retry_after(tmp_path, monkeypatch, clock):
+    from app import app as app_module
+
+    def create(**kwargs):
+        if kwargs.get("stream"):
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="reply"))])])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="reply"))])
+
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    controller = AdmissionController(rate=1, burst=1, clock=clock)
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "admission", controller)
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    client = app_module.app.test_client()
+
+    def post(path, addr):
+        # A fresh X-Client-Id per request does not get around the limit
+        return client.post(path, json={"message": "Hi"}, headers={"X-Client-Id": str(time.perf_counter())},
+                           environ_base={"REMOTE_ADDR": addr})
+
+    assert post("/message", "10.0.0.1").status_code == 200
+    refused = post("/message", "10.0.0.1")
+    assert refused.status_code == 429
+    assert refused.headers["Retry-After"] == "1"
+    assert post("/message", "10.0.0.2").status_code == 200
+
+    streamed = post("/message/stream", "10.0.0.3")
+    assert streamed.status_code == 200 and "event: done" in streamed.get_data(as_text=True)
+    assert post("/message/stream", "10.0.0.3").status_code == 429
+
+    stats = client.get("/stats").get_json()
+    assert stats["admission"]["admitted"] == 3
+    assert stats["admission"]["rejected"]["rate_limited"] == 2
+    assert stats["admission"]["active"] == 0
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from langfuse.openai import AsyncOpenAI
+
+from benchmarks.fake_langfuse import AsyncFakeLangfuse
+from benchmarks.fake_ollama import FakeOllama
+from promptpilot.serving.admission import AdmissionController
+from promptpilot.serving.chat import PROMPT_NAME
+from promptpilot.serving.response_cache import ResponseCache
+from promptpilot.serving.sessions import SessionStore
+from promptpilot.versioning.async_tree import AsyncPromptTree
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def ollama():
+    return FakeOllama(reply="A mind-bending heist.")
+
+
+@pytest.fixture
+def asgi(tmp_path, ollama, monkeypatch):
+    from app import asgi as asgi_module
+
+    langfuse = AsyncFakeLangfuse()
+    langfuse._create_prompt(PROMPT_NAME, "You are an {{criticLevel}} critic of {{movie}}.", {}, ["production"], [])
+    traces = []
+    services = asgi_module.Services()
+    services.ollama = AsyncOpenAI(base_url="http://ollama/v1", api_key="ollama", max_retries=0,
+                                  http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=ollama)))
+    services.langfuse_api = langfuse
+    services.prompt_manager = AsyncPromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'))
+    services.tracer = SimpleNamespace(trace=lambda **kwargs: traces.append(kwargs))
+    monkeypatch.setattr(asgi_module, "services", services)
+    return asgi_module, traces
+
+
+def test_message_uses_latest_prompt(asgi, ollama):
+    asgi_module, _ = asgi
+
+    async def scenario():
+        await asgi_module.services.prompt_manager.sync_with_langfuse()
+        client = asgi_module.app.test_client()
+        response = await client.post("/message", json={"message": "Inception?"})
+        return response.status_code, await response.get_json()
+
+    status, body = run(scenario())
+    assert status == 200
+    assert body == {"response": "A mind-bending heist."}
+    assert ollama.requests == 1
+
+
+def test_message_validation_and_upstream_failure(asgi, ollama):
+    asgi_module, _ = asgi
+    asgi_module.services.ollama = AsyncOpenAI(
+        base_url="http://127.0.0.1:9/v1", api_key="ollama", max_retries=0,
+        http_client=httpx.AsyncClient(timeout=1))
+
+    async def scenario():
+        client = asgi_module.app.test_client()
+        missing = await client.post("/message", json={})
+        failed = await client.post("/message", json={"message": "Inception?"})
+        return missing.status_code, failed.status_code
+
+    assert run(scenario()) == (400, 500)
+
+
+def test_stream_sends_tokens_and_records_trace(asgi):
+    asgi_module, traces = asgi
+
+    async def scenario():
+        client = asgi_module.app.test_client()
+        await client.post("/message", json={"message": "Inception?"})
+        response = await client.post("/message/stream", json={"message": "Inception?"})
+        body = await response.get_data(as_text=True)
+        return response.mimetype, body, await (await client.get("/metrics")).get_data(as_text=True)
+
+    mimetype, body, scrape = run(scenario())
+    events = [frame.split("\n") for frame in body.split("\n\n") if frame]
+    assert mimetype == "text/event-stream"
+    assert [event for event, _ in events][-1] == "event: done"
+    assert json.loads(events[-1][1][len("data: "):])["response"] == "A mind-bending heist."
+    assert traces[0]["output"] == "A mind-bending heist."
+    assert traces[0]["metadata"]["stream_status"] == "completed"
+    assert set(traces[0]["metadata"]["timings_ms"]) == {"prompt_lookup", "prompt_compile", "upstream",
+                                                        "first_token", "total"}
+    for route, stage in (("/message", "prompt_lookup"), ("/message", "prompt_compile"), ("/message", "upstream"),
+                         ("/message/stream", "first_token")):
+        assert f'chat_stage_seconds_count{{route="{route}",stage="{stage}"}}' in scrape
+
+
+def test_disconnect_cancels_upstream_call(asgi, ollama):
+    asgi_module, _ = asgi
+    ollama.latency = 5
+
+    async def scenario():
+        client = asgi_module.app.test_client()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(client.post("/message", json={"message": "Inception?"}), 0.2)
+        await asyncio.sleep(0)
+
+    run(scenario())
+    assert ollama.requests == 1
+    assert ollama.in_flight == 0
+
+
+def test_prompts_and_ready(asgi):
+    asgi_module, _ = asgi
+
+    async def scenario():
+        client = asgi_module.app.test_client()
+        before = (await client.get("/ready")).status_code
+        await asgi_module.services.prompt_manager.sync_with_langfuse()
+        after = (await client.get("/ready")).status_code
+        listing = await client.get("/prompts")
+        prompts = await listing.get_json()
+        revalidated = await client.get("/prompts", headers={"If-None-Match": listing.headers["ETag"]})
+        page = await (await client.get("/")).get_data(as_text=True)
+        return before, after, prompts, revalidated.status_code, page
+
+    before, after, prompts, revalidated, page = run(scenario())
+    assert (before, after, revalidated) == (503, 200, 304)
+    assert prompts[0]["name"] == PROMPT_NAME
+    assert prompts[0]["latest_version"] == 1
+    assert "/message/stream" in page
+
+
+def test_sessions_and_cache_carry_over_between_routes(asgi, ollama):
+    asgi_module, traces = asgi
+    asgi_module.services.sessions = SessionStore()
+    asgi_module.services.response_cache = ResponseCache()
+
+    async def scenario():
+        client = asgi_module.app.test_client()
+        first = await (await client.post("/message", json={"message": "Inception?", "session_id": None})).get_json()
+        streamed = await client.post("/message/stream", json={"message": "And Memento?",
+                                                                "session_id": first["session_id"]})
+        await streamed.get_data()
+        await asyncio.sleep(0.1)
+        bad = await client.post("/message", json={"message": "Heat?", "session_id": 7})
+        return first, streamed.headers["X-Session-Id"], bad.status_code, await bad.get_json()
+
+    first, streamed_session, bad_status, bad_body = run(scenario())
+    session_id = first["session_id"]
+    assert first == {"response": "A mind-bending heist.", "session_id": session_id}
+    assert streamed_session == session_id and traces[-1]["session_id"] == session_id
+    assert [message["role"] for message in asgi_module.services.sessions.history(session_id)] == [
+        "user", "assistant", "user", "assistant"]
+    assert (bad_status, bad_body) == (400, {"error": "session_id must be a string or null."})
+    assert asgi_module.services.response_cache.stats()["size"] == 2
+
+
+def test_admission_refuses_when_busy_and_releases_streams(asgi, ollama):
+    asgi_module, _ = asgi
+    admission = asgi_module.services.admission = AdmissionController(max_concurrency=1, max_queue=0)
+    asgi_module.services.admission_waits = None
+
+    async def scenario():
+        client = asgi_module.app.test_client()
+        held = admission.acquire()
+        refused = await client.post("/message", json={"message": "Inception?"})
+        admission.release(held)
+        streamed = await client.post("/message/stream", json={"message": "Inception?"})
+        await streamed.get_data()
+        answered = await client.post("/message", json={"message": "Inception?"})
+        return refused, answered.status_code
+
+    refused, answered = run(scenario())
+    assert refused.status_code == 503 and refused.headers["Retry-After"] == "1"
+    assert answered == 200
+    assert admission.stats()["active"] == 0 and admission.stats()["admitted"] == 3
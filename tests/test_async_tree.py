@@ -0,0 +1,229 @@
+import asyncio
+import json
+import os
+import threading
+
+import httpx
+
+from benchmarks.fake_langfuse import AsyncFakeLangfuse, FakeLangfuse
+from promptpilot.versioning.async_tree import AsyncLangfuseClient, AsyncPromptTree
+from promptpilot.versioning.tree import PromptTree
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_sync_matches_blocking_tree(file_path, tmp_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=5, versions_per_prompt=6, latency=0.01)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path, max_concurrency=4)
+        assert await tree.sync_with_langfuse()
+        return tree
+
+    tree = run(scenario())
+    blocking = PromptTree(FakeLangfuse(prompt_count=5, versions_per_prompt=6), os.path.join(tmp_path, 'b.json'))
+
+    assert tree.tree == blocking.tree
+    assert tree.sync_status()["state"] == "ready"
+    assert 1 < langfuse.max_in_flight <= 4
+
+
+def test_concurrent_identical_fetches_share_one_call(file_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, versions_per_prompt=2, latency=0.05)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path)
+        await asyncio.gather(*(tree.sync_with_langfuse() for _ in range(5)))
+        fetched = langfuse.calls["get_prompt"]
+        clients = await asyncio.gather(*(tree.get_latest_prompt("prompt-0") for _ in range(50)))
+        return fetched, clients
+
+    fetched, clients = run(scenario())
+
+    assert langfuse.calls["list"] == 1
+    assert fetched == 2
+    assert langfuse.calls["get_prompt"] == 3
+    assert {client.version for client in clients} == {2}
+
+
+def test_cancelling_one_caller_keeps_the_shared_fetch(file_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, latency=0.05)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path)
+        await tree.sync_with_langfuse()
+        first = asyncio.ensure_future(tree.get_latest_prompt("prompt-0"))
+        second = asyncio.ensure_future(tree.get_latest_prompt("prompt-0"))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return first, await second
+
+    first, second = run(scenario())
+
+    assert first.cancelled()
+    assert second.version == 1
+
+
+def test_cancelling_every_caller_cancels_the_fetch(file_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, latency=0.2)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path)
+        await tree.sync_with_langfuse()
+        waiter = asyncio.ensure_future(tree.get_latest_prompt("prompt-0"))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.01)
+        return tree
+
+    tree = run(scenario())
+
+    assert tree._in_flight == {}
+    assert tree.prompt_cache.stats()["size"] == 0
+
+
+def test_concurrent_creates_get_distinct_versions(file_path):
+    langfuse = AsyncFakeLangfuse(latency=0.01)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path)
+        root = await tree.create_prompt("root", "r1", {})
+        children = await asyncio.gather(*(
+            tree.create_prompt("child", f"c{i}", {}, parent_id=root["id"]) for i in range(5)))
+        bulk = await tree.create_prompts([{"name": "child", "content": "c5"}, {"name": "x", "content": "x1"}])
+        return tree, children, bulk
+
+    tree, children, bulk = run(scenario())
+
+    assert sorted(child["version"] for child in children) == [1, 2, 3, 4, 5]
+    assert bulk[0]["prompt"]["id"] == "child_v6"
+    assert langfuse._get_prompt("child", 6).prompt == "c5"
+    assert [n["id"] for n in tree.get_descendants("root_v1")][:1] == ["child_v1"]
+
+
+def test_shared_trees_number_versions_under_the_file_lock(file_path):
+    langfuse = AsyncFakeLangfuse(latency=0.01)
+
+    async def scenario():
+        trees = [AsyncPromptTree(langfuse, file_path, shared=True, refresh_interval=0) for _ in range(2)]
+        created = await asyncio.gather(*(trees[i % 2].create_prompt("critic", f"c{i}", {}) for i in range(6)))
+        bulk = await asyncio.gather(*(tree.create_prompts([{"name": "critic", "content": f"b{i}"}])
+                                      for i, tree in enumerate(trees)))
+        return trees, created, bulk
+
+    trees, created, bulk = run(scenario())
+    versions = [prompt["version"] for prompt in created] + [result[0]["prompt"]["version"] for result in bulk]
+    assert sorted(versions) == list(range(1, 9))
+    # Langfuse numbered the pushes the same way
+    reloaded = PromptTree(langfuse, file_path, sync_on_init='never')
+    assert [(node["version"], node["content"]) for node in reloaded.index.nodes("critic")] == [
+        (version, langfuse._get_prompt("critic", version).prompt) for version in range(1, 9)]
+
+
+def test_async_langfuse_client_uses_prompts_api():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.method == "POST":
+            body = json.loads(request.content)
+            return httpx.Response(200, json=dict(body, version=1))
+        if request.url.path == "/api/public/v2/prompts":
+            page = int(request.url.params["page"])
+            return httpx.Response(200, json={
+                "data": [{"name": f"p{page}", "versions": [1], "labels": [], "tags": [],
+                          "lastUpdatedAt": "2024-01-01T00:00:00Z", "lastConfig": {}}],
+                "meta": {"page": page, "limit": 100, "totalItems": 2, "totalPages": 2},
+            })
+        return httpx.Response(200, json={"type": "text", "name": "movie critic", "version": 3,
+                                         "prompt": "Review {{movie}}", "config": {"parent_id": "x_v1"},
+                                         "labels": [], "tags": []})
+
+    async def scenario():
+        client = AsyncLangfuseClient("pk", "sk", "http://langfuse", transport=httpx.MockTransport(handler))
+        listing = await client.list_prompts()
+        prompt = await client.get_prompt("movie critic", version=3)
+        await client.create_prompt("movie critic", "Review {{movie}}", config={"parent_id": None})
+        await client.aclose()
+        return listing, prompt
+
+    listing, prompt = run(scenario())
+
+    assert [p.name for p in listing] == ["p1", "p2"]
+    assert prompt.compile(movie="Inception") == "Review Inception"
+    assert prompt.config["parent_id"] == "x_v1"
+    assert requests[2].url.raw_path == b"/api/public/v2/prompts/movie%20critic?version=3"
+    assert requests[0].headers["authorization"].startswith("Basic ")
+
+
+def test_failed_sync_is_retried_until_ready(file_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, versions_per_prompt=2, failure_rate=1.0)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path, sync_retry_seconds=0.01)
+        task = asyncio.ensure_future(tree.sync_until_ready())
+        while tree.sync_status()["state"] != "failed":
+            await asyncio.sleep(0.01)
+        langfuse.failure_rate = 0.0
+        await asyncio.wait_for(task, 5)
+        return tree
+
+    tree = run(scenario())
+    assert tree.sync_status()["ready"]
+    assert langfuse.calls["list"] >= 2
+
+
+def test_sync_applies_off_the_event_loop_and_never_stays_syncing(file_path, monkeypatch):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, versions_per_prompt=2)
+    threads = []
+
+    def broken(*args):
+        threads.append(threading.current_thread())
+        raise OSError("disk full")
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path)
+        monkeypatch.setattr(tree.local, "_apply_sync", broken)
+        return tree, await tree.sync_with_langfuse()
+
+    tree, synced = run(scenario())
+    assert synced is False
+    assert threads and threads[0] is not threading.main_thread()
+    assert tree.sync_status()["state"] == "failed" and "disk full" in tree.sync_status()["last_error"]
+
+
+def test_stale_refresh_task_is_kept_until_done(file_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, versions_per_prompt=2, latency=0.01)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path, prompt_cache_ttl=0)
+        await tree.sync_with_langfuse()
+        await tree.get_latest_prompt("prompt-0")
+        await tree.get_latest_prompt("prompt-0")
+        pending = set(tree._refreshes)
+        await asyncio.gather(*pending)
+        return pending, tree._refreshes
+
+    pending, left = run(scenario())
+    assert len(pending) == 1 and not left
+
+
+def test_latest_prompt_follows_shared_state_off_the_event_loop(file_path, monkeypatch):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, versions_per_prompt=2)
+    threads = []
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path, shared=True, refresh_interval=60)
+        await tree.sync_with_langfuse()
+        tree.local._next_follow = 0
+        follow = tree.local._follow
+        monkeypatch.setattr(tree.local, "_follow", lambda: threads.append(threading.current_thread()) or follow())
+        prompts = [await tree.get_latest_prompt("prompt-0") for _ in range(3)]
+        return prompts
+
+    prompts = run(scenario())
+    assert [prompt.version for prompt in prompts] == [2, 2, 2]
+    # Once per refresh_interval, and never on the loop's thread
+    assert len(threads) == 1 and threads[0] is not threading.main_thread()
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture
+def snapshot_path(file_path):
+    # Local snapshot from a previous run
+    PromptTree(FakeLangfuse(prompt_count=2, versions_per_prompt=3), file_path)
+    return file_path
+
+
+@pytest.fixture
+def slow_langfuse():
+    langfuse = FakeLangfuse(prompt_count=2, versions_per_prompt=4, latency=0.1)
+    return langfuse
+
+
+def test_cold_start_serves_snapshot_while_syncing(snapshot_path, slow_langfuse):
+    listing, answer = threading.Event(), threading.Event()
+    list_prompts = slow_langfuse.client.prompts.list
+
+    def held_list(**kwargs):
+        listing.set()
+        answer.wait(5)
+        return list_prompts(**kwargs)
+
+    slow_langfuse.client.prompts.list = held_list
+    tree = PromptTree(slow_langfuse, snapshot_path, max_workers=1, sync_on_init='background')
+
+    # Langfuse has not answered yet, and the snapshot is already served
+    assert listing.wait(5)
+    assert tree.get_prompt_by_id("prompt-1_v3")["parent_id"] == "prompt-1_v2"
+    assert not tree.ready.is_set()
+    assert tree.get_prompt_by_id("prompt-1_v4") is None
+
+    answer.set()
+    assert tree.wait_for_sync(timeout=5)
+    assert tree.sync_status()["state"] == "ready"
+    assert tree.get_prompt_by_id("prompt-1_v4")["parent_id"] == "prompt-1_v3"
+
+
+def test_blocking_start_waits_for_sync(snapshot_path, slow_langfuse):
+    start = time.perf_counter()
+    tree = PromptTree(slow_langfuse, snapshot_path, max_workers=1)
+
+    assert time.perf_counter() - start >= 0.8
+    assert tree.ready.is_set()
+
+
+def test_unreachable_langfuse_reports_failure(snapshot_path):
+    langfuse = FakeLangfuse(failure_rate=1.0)
+
+    tree = PromptTree(langfuse, snapshot_path, sync_on_init='background', sync_retry_seconds=0.05)
+    deadline = time.monotonic() + 5
+    while tree.sync_status()["state"] != "failed" and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    status = tree.sync_status()
+    assert status["state"] == "failed"
+    assert not status["ready"]
+    assert "Simulated list failure" in status["last_error"]
+    assert tree.get_prompt_by_id("prompt-0_v1") is not None
+
+    # The background thread keeps retrying until Langfuse is back
+    langfuse.failure_rate = 0.0
+    assert tree.wait_for_sync(timeout=5)
+    assert tree.sync_status()["last_error"] is None
+    assert langfuse.calls["list"] >= 2
+    tree._sync_thread.join(timeout=5)
+    assert not tree._sync_thread.is_alive()
+
+
+def test_never_mode_leaves_sync_to_caller(snapshot_path, slow_langfuse):
+    tree = PromptTree(slow_langfuse, snapshot_path, sync_on_init='never')
+
+    assert slow_langfuse.calls["list"] == 0
+    assert tree.sync_status()["state"] == "pending"
+
+    with pytest.raises(ValueError):
+        PromptTree(slow_langfuse, snapshot_path, sync_on_init='sometimes')
+
+
+def test_app_ready_endpoint(snapshot_path, monkeypatch):
+    from app import app as app_module
+
+    tree = PromptTree(FakeLangfuse(prompt_count=1), snapshot_path, sync_on_init='never')
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    client = app_module.app.test_client()
+
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.get_json()["state"] == "pending"
+
+    tree.sync_with_langfuse()
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.get_json()["ready"] is True
@@ -0,0 +1,44 @@
+import json
+import os
+
+from benchmarks.bench_tree import compare, main
+
+SMALL = ['--prompts', '3', '--versions', '4', '--latency', '0', '--runs', '2', '--lookups', '10']
+
+
+def test_runner_writes_results_and_baseline(tmp_path):
+    baseline = os.path.join(tmp_path, 'baseline.json')
+    output = os.path.join(tmp_path, 'results.json')
+
+    assert main(SMALL + ['--baseline', baseline, '--update-baseline']) == 0
+    with open(baseline) as f:
+        report = json.load(f)
+    assert set(report["results"]) == {
+        "sync_full", "sync_incremental", "create_prompt", "get_prompt_by_id",
+        "get_latest_prompt_cold", "get_latest_prompt_warm", "load_tree", "save_tree"}
+    assert report["results"]["sync_full"]["runs"] == 2
+    assert report["config"]["versions"] == 4
+
+    # Generous tolerance: this only checks the comparison is wired up
+    main(SMALL + ['--baseline', baseline, '--tolerance', '1000', '--output', output])
+    with open(output) as f:
+        assert json.load(f)["regressions"] == {}
+
+
+def test_injected_failures_are_counted(tmp_path):
+    output = os.path.join(tmp_path, 'results.json')
+    main(SMALL + ['--failure-rate', '1', '--output', output])
+    with open(output) as f:
+        report = json.load(f)
+    assert report["langfuse"]["failures"] == report["langfuse"]["calls"] > 0
+    assert report["results"]["create_prompt"]["errors"] == 2
+
+
+def test_compare_flags_only_real_slowdowns():
+    baseline = {"results": {"fast": {"median": 1e-6}, "slow": {"median": 0.010}, "same": {"median": 0.010}}}
+    results = {"fast": {"median": 3e-6}, "slow": {"median": 0.020}, "same": {"median": 0.011},
+               "new": {"median": 1.0}}
+
+    regressions = compare(results, baseline, tolerance=0.25, min_delta=1e-4)
+    assert list(regressions) == ["slow"]
+    assert regressions["slow"]["ratio"] == 2.0
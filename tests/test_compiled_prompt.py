@@ -0,0 +1,76 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.fake_langfuse import AsyncFakeLangfuse, FakeLangfuse, FakePromptClient
+from promptpilot.versioning.async_tree import AsyncPromptTree
+from promptpilot.versioning.tree import PromptTree
+
+
+class CountingPromptClient(FakePromptClient):
+    compiles = 0
+
+    def compile(self, **kwargs):
+        CountingPromptClient.compiles += 1
+        return super().compile(**kwargs)
+
+
+class CountingLangfuse(FakeLangfuse):
+    def get_prompt(self, name, version=None, **kwargs):
+        fake = super().get_prompt(name, version, **kwargs)
+        return CountingPromptClient(fake.name, fake.version, fake.prompt, fake.config)
+
+
+@pytest.fixture(autouse=True)
+def reset_compiles():
+    CountingPromptClient.compiles = 0
+
+
+@pytest.fixture
+def tree(tmp_path):
+    tree = PromptTree(CountingLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    tree.create_prompt("critic", "You are a {{level}} critic.", {})
+    return tree
+
+
+def test_compiled_prompt_is_memoized_per_version_and_variables(tree):
+    prompt, text = tree.get_compiled_prompt("critic", level="harsh")
+    assert (prompt.version, text) == (1, "You are a harsh critic.")
+    assert tree.get_compiled_prompt("critic", level="harsh")[1] == text
+    assert CountingPromptClient.compiles == 1
+
+    assert tree.get_compiled_prompt("critic", level="kind")[1] == "You are a kind critic."
+    assert CountingPromptClient.compiles == 2
+    assert tree.get_compiled_prompt("missing", level="harsh") == (None, None)
+
+
+def test_new_version_and_sync_invalidate_compiled_prompts(tree):
+    tree.get_compiled_prompt("critic", level="harsh")
+    tree.create_prompt("critic", "You are a very {{level}} critic.", {})
+
+    prompt, text = tree.get_compiled_prompt("critic", level="harsh")
+    assert (prompt.version, text) == (2, "You are a very harsh critic.")
+
+    tree.langfuse_client.create_prompt("critic", "Synced {{level}} critic.")
+    tree.sync_with_langfuse()
+    prompt, text = tree.get_compiled_prompt("critic", level="harsh")
+    assert (prompt.version, text) == (3, "Synced harsh critic.")
+    assert CountingPromptClient.compiles == 3
+
+
+def test_async_tree_shares_compiled_prompts(tmp_path):
+    langfuse = AsyncFakeLangfuse()
+    langfuse._create_prompt("critic", "You are a {{level}} critic.", {}, ["production"], [])
+    tree = AsyncPromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'))
+
+    async def scenario():
+        await tree.sync_with_langfuse()
+        first = await tree.get_compiled_prompt("critic", level="harsh")
+        second = await tree.get_compiled_prompt("critic", level="harsh")
+        return first, second
+
+    (prompt, text), (_, again) = asyncio.run(scenario())
+    assert (prompt.version, text) == (1, "You are a harsh critic.")
+    assert again is text
+    assert tree.local._compiled["critic"] == {(1, (("level", "harsh"),)): text}
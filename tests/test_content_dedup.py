@@ -0,0 +1,156 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.fake_langfuse import AsyncFakeLangfuse, FakeLangfuse
+from promptpilot.versioning.async_tree import AsyncPromptTree
+from promptpilot.versioning.content import content_hash
+from promptpilot.versioning.sqlite_storage import SQLiteStorage
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture
+def langfuse():
+    return FakeLangfuse(prompt_count=1, versions_per_prompt=2)
+
+
+def test_hashes_recorded_on_create_and_sync(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path)
+    synced = tree.get_prompt_by_id("prompt-0_v2")
+    assert synced["content"] == "prompt-0 content v2 {{movie}}"
+    assert synced["content_hash"] == content_hash(synced["content"])
+
+    created = tree.create_prompt("prompt-0", "new content", {}, parent_id="prompt-0_v2")
+    assert created["content_hash"] == content_hash("new content")
+    # Chat prompts hash the same regardless of key order
+    assert content_hash([{"role": "user", "content": "hi"}]) == content_hash([{"content": "hi", "role": "user"}])
+
+
+def test_dedupe_off_pushes_identical_content(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path)
+    created = tree.create_prompt("prompt-0", "prompt-0 content v2 {{movie}}", {})
+    assert created["id"] == "prompt-0_v3"
+    assert langfuse.calls["create_prompt"] == 1
+
+
+def test_dedupe_skip_returns_existing_version(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, dedupe='skip')
+    existing = tree.create_prompt("prompt-0", "prompt-0 content v1 {{movie}}", {})
+    assert existing["id"] == "prompt-0_v1"
+    assert langfuse.calls["create_prompt"] == 0
+    assert langfuse.calls["update_labels"] == 0
+    # Same content under another name is not a duplicate
+    assert tree.create_prompt("other", "prompt-0 content v1 {{movie}}", {})["id"] == "other_v1"
+
+
+def test_dedupe_alias_moves_production_label(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, dedupe='alias')
+    existing = tree.create_prompt("prompt-0", "prompt-0 content v1 {{movie}}", {})
+    assert existing["id"] == "prompt-0_v1"
+    assert langfuse.calls["create_prompt"] == 0
+    assert langfuse.labels[("prompt-0", "production")] == 1
+
+
+def test_alias_is_served_until_a_newer_version(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, dedupe='alias')
+    assert tree.get_compiled_prompt("prompt-0", movie="Heat")[1] == "prompt-0 content v2 Heat"
+
+    tree.create_prompt("prompt-0", "prompt-0 content v1 {{movie}}", {})
+    assert tree.get_latest_prompt("prompt-0").version == 1
+    assert tree.get_compiled_prompt("prompt-0", movie="Heat")[1] == "prompt-0 content v1 Heat"
+    # A resync or a restart keeps serving the alias
+    tree.sync_with_langfuse()
+    assert PromptTree(langfuse, file_path, dedupe='alias').get_latest_prompt("prompt-0").version == 1
+
+    tree.create_prompt("prompt-0", "prompt-0 content v3 {{movie}}", {})
+    assert tree.get_compiled_prompt("prompt-0", movie="Heat")[1] == "prompt-0 content v3 Heat"
+    assert PromptTree(langfuse, file_path, dedupe='alias').get_latest_prompt("prompt-0").version == 3
+
+
+def test_unknown_dedupe_mode_rejected(langfuse, file_path):
+    with pytest.raises(ValueError):
+        PromptTree(langfuse, file_path, dedupe='merge')
+
+
+def test_bulk_dedupe_within_batch_and_against_history(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, dedupe='alias')
+    results = tree.create_prompts([
+        {"name": "prompt-0", "content": "fresh"},
+        {"name": "prompt-0", "content": "prompt-0 content v2 {{movie}}"},
+        {"name": "prompt-0", "content": "fresh"},
+        {"name": "prompt-0", "content": "fresher"},
+    ])
+
+    assert [r["duplicate"] for r in results] == [False, True, True, False]
+    assert [r["prompt"]["id"] for r in results] == ["prompt-0_v3", "prompt-0_v2", "prompt-0_v3", "prompt-0_v4"]
+    assert langfuse.calls["create_prompt"] == 2
+    # A later item in the batch wins the production label
+    assert langfuse.calls["update_labels"] == 0
+    assert langfuse.labels[("prompt-0", "production")] == 4
+
+    results = tree.create_prompts([{"name": "prompt-0", "content": "prompt-0 content v1 {{movie}}"}])
+    assert results[0]["prompt"]["id"] == "prompt-0_v1"
+    assert langfuse.labels[("prompt-0", "production")] == 1
+
+
+def test_diff_uses_local_content(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path)
+    tree.create_prompt("prompt-0", "prompt-0 content v3 {{movie}}\nnow with a second line", {},
+                       parent_id="prompt-0_v2")
+    fetches = langfuse.calls["get_prompt"]
+
+    diff = tree.diff("prompt-0_v3")
+    assert "-prompt-0 content v2 {{movie}}" in diff
+    assert "+now with a second line" in diff
+    assert diff.startswith("--- prompt-0_v2\n+++ prompt-0_v3")
+    assert "+prompt-0 content v2" in tree.diff("prompt-0_v1", "prompt-0_v2")
+    assert langfuse.calls["get_prompt"] == fetches
+
+
+def test_diff_of_identical_content_is_empty(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path)
+    tree.create_prompt("prompt-0", "prompt-0 content v2 {{movie}}", {}, parent_id="prompt-0_v2")
+    assert tree.diff("prompt-0_v3") == ''
+    with pytest.raises(ValueError):
+        tree.diff("prompt-0_v1")
+
+
+def test_content_fetched_for_nodes_saved_before_hashing(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path)
+    node = tree.get_prompt_by_id("prompt-0_v1")
+    del node["content"], node["content_hash"]
+    assert tree.get_content("prompt-0_v1") == "prompt-0 content v1 {{movie}}"
+
+
+def test_sqlite_storage_finds_duplicates(langfuse, tmp_path, file_path):
+    storage = SQLiteStorage(os.path.join(tmp_path, 'prompt_history.db'))
+    tree = PromptTree(langfuse, file_path, storage=storage, dedupe='skip')
+    chat = [{"role": "system", "content": "be brief"}]
+    tree.create_prompt("chat", chat, {})
+
+    assert storage.get("chat_v1")["content"] == chat
+    assert tree.create_prompt("chat", chat, {})["id"] == "chat_v1"
+    assert tree.create_prompt("prompt-0", "prompt-0 content v1 {{movie}}", {})["id"] == "prompt-0_v1"
+    assert langfuse.calls["create_prompt"] == 1
+
+
+def test_async_tree_dedupes_and_aliases(file_path):
+    langfuse = AsyncFakeLangfuse(prompt_count=1, versions_per_prompt=2)
+
+    async def scenario():
+        tree = AsyncPromptTree(langfuse, file_path, dedupe='alias')
+        await tree.sync_with_langfuse()
+        existing = await tree.create_prompt("prompt-0", "prompt-0 content v1 {{movie}}", {})
+        served = (await tree.get_latest_prompt("prompt-0")).version
+        results = await tree.create_prompts([{"name": "prompt-0", "content": "fresh"},
+                                             {"name": "prompt-0", "content": "fresh"}])
+        return existing, results, served
+
+    existing, results, served = asyncio.run(scenario())
+    assert existing["id"] == "prompt-0_v1" and served == 1
+    assert [r["prompt"]["id"] for r in results] == ["prompt-0_v3", "prompt-0_v3"]
+    assert langfuse.calls["create_prompt"] == 1
+    # Only the existing-version duplicate was relabelled; v3 was created as production
+    assert langfuse.calls["update_labels"] == 1
+    assert langfuse.labels[("prompt-0", "production")] == 3
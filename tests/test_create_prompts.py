@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture
+def langfuse():
+    return FakeLangfuse(prompt_count=1, versions_per_prompt=2, latency=0.01)
+
+
+@pytest.fixture
+def prompt_tree(langfuse, tmp_path):
+    return PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'), max_workers=4)
+
+
+def versions_in_langfuse(langfuse, name):
+    return {v: langfuse.get_prompt(name, v).prompt for v in range(1, langfuse.get_prompt(name).version + 1)}
+
+
+def test_bulk_create_assigns_versions_and_persists_once(prompt_tree, langfuse):
+    appends = []
+    append = prompt_tree.storage.append
+    prompt_tree.storage.append = lambda tree, nodes: appends.append(len(nodes)) or append(tree, nodes)
+
+    results = prompt_tree.create_prompts(
+        [{"name": "prompt-0", "content": f"p0 candidate {i}", "parent_id": "prompt-0_v2"} for i in range(3)]
+        + [{"name": f"new-{i}", "content": f"new {i}"} for i in range(4)]
+    )
+
+    assert [r["error"] for r in results] == [None] * 7
+    assert [r["prompt"]["id"] for r in results[:3]] == ["prompt-0_v3", "prompt-0_v4", "prompt-0_v5"]
+    assert appends == [7]
+    assert langfuse.max_in_flight > 1
+    # Langfuse numbered the versions the same way the local tree did
+    assert versions_in_langfuse(langfuse, "prompt-0")[4] == "p0 candidate 1"
+    assert prompt_tree.get_prompt_by_id("prompt-0_v5")["parent_id"] == "prompt-0_v2"
+
+
+def test_bulk_create_reports_partial_failures(prompt_tree, langfuse):
+    create_prompt = langfuse.create_prompt
+
+    def flaky_create_prompt(name, prompt, **kwargs):
+        if prompt == "bad":
+            raise RuntimeError("rejected")
+        return create_prompt(name=name, prompt=prompt, **kwargs)
+
+    langfuse.create_prompt = flaky_create_prompt
+
+    results = prompt_tree.create_prompts([
+        {"name": "a", "content": "a1"},
+        {"name": "a", "content": "bad"},
+        {"name": "a", "content": "a3"},
+        {"name": "b", "content": "b1", "parent_id": "missing_v1"},
+        {"name": "b", "content": "b2"},
+    ])
+
+    assert results[0]["prompt"]["id"] == "a_v1"
+    assert results[1]["error"] == "rejected"
+    assert results[2]["prompt"] is None and "earlier version" in results[2]["error"]
+    assert results[3]["error"] == "Parent ID 'missing_v1' does not exist."
+    assert results[4]["prompt"]["id"] == "b_v1"
+
+    # The local tree only holds what reached Langfuse, and a sync agrees
+    local = {name: [n["version"] for n in prompt_tree.index.nodes(name)] for name in ("a", "b")}
+    assert local == {"a": [1], "b": [1]}
+    prompt_tree.sync_with_langfuse()
+    assert {name: [n["version"] for n in prompt_tree.index.nodes(name)] for name in ("a", "b")} == local
+
+
+def test_bulk_create_with_nothing_valid_does_not_write(prompt_tree):
+    appends = []
+    prompt_tree.storage.append = lambda tree, nodes: appends.append(nodes)
+
+    results = prompt_tree.create_prompts([{"name": "a", "content": "x", "parent_id": "nope_v1"}])
+
+    assert results[0]["prompt"] is None
+    assert appends == []
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.dispatch import ChatDispatcher, chat_dispatcher_from_env
+from promptpilot.versioning.tree import PromptTree
+
+
+class Upstream:
+    """Completion call that blocks until released and records its arguments."""
+
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.release = threading.Event()
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, **kwargs):
+        with self._lock:
+            self.calls.append((time.monotonic(), kwargs))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self.release.wait(5)
+            if kwargs["messages"] == self.fail_on:
+                raise ConnectionError(f"ollama failed on {kwargs['messages']}")
+            return f"reply to {kwargs['messages']}"
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def call_all(dispatcher, messages):
+    results = [None] * len(messages)
+
+    def call(i):
+        try:
+            results[i] = dispatcher.complete(model="m", messages=messages[i])
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(messages))]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_identical_requests_share_one_call_and_errors_reach_each_caller():
+    upstream = Upstream(fail_on="b")
+    dispatcher = ChatDispatcher(upstream, concurrency=4)
+    threads, results = call_all(dispatcher, ["a", "a", "a", "b", "b"])
+    wait_for(lambda: dispatcher.stats()["requests"] == 5)
+    upstream.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(upstream.calls) == 2
+    assert results[:3] == ["reply to a"] * 3
+    assert all(isinstance(result, ConnectionError) for result in results[3:])
+    assert dispatcher.stats()["coalesced"] == 3
+    assert dispatcher.stats()["errors"] == 1
+
+    # Nothing in flight any more, so the next request calls upstream again
+    assert dispatcher.complete(model="m", messages="a") == "reply to a"
+    assert len(upstream.calls) == 3
+    dispatcher.close()
+
+
+def test_concurrency_caps_upstream_calls():
+    upstream = Upstream()
+    dispatcher = ChatDispatcher(upstream, concurrency=2)
+    threads, results = call_all(dispatcher, [str(i) for i in range(6)])
+    wait_for(lambda: len(upstream.calls) == 2)
+    time.sleep(0.05)
+    assert len(upstream.calls) == 2
+    upstream.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert upstream.max_in_flight == 2
+    assert sorted(results) == [f"reply to {i}" for i in range(6)]
+    dispatcher.close()
+
+
+def test_requests_within_max_wait_are_released_together():
+    upstream = Upstream()
+    upstream.release.set()
+    dispatcher = ChatDispatcher(upstream, max_wait=0.2, max_batch_size=3, concurrency=3)
+    threads, results = call_all(dispatcher, ["a", "b", "c"])
+    for thread in threads:
+        thread.join()
+
+    started = [at for at, _ in upstream.calls]
+    assert max(started) - min(started) < 0.1
+    assert sorted(results) == ["reply to a", "reply to b", "reply to c"]
+    assert dispatcher.stats()["batches"] == 1
+    dispatcher.close()
+
+
+def test_dispatcher_from_env():
+    assert chat_dispatcher_from_env(lambda **kwargs: None, {}) is None
+    dispatcher = chat_dispatcher_from_env(lambda **kwargs: None, {
+        "CHAT_DISPATCH": "1", "CHAT_DISPATCH_MAX_WAIT_MS": "5", "CHAT_DISPATCH_CONCURRENCY": "2"})
+    assert (dispatcher.max_wait, dispatcher.concurrency) == (0.005, 2)
+    dispatcher.close()
+
+
+def test_message_route_goes_through_dispatcher(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="reply"))])
+
+    dispatcher = ChatDispatcher(lambda **kwargs: app_module.client.chat.completions.create(**kwargs))
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "dispatcher", dispatcher)
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+    response = app_module.app.test_client().post("/message", json={"message": "Inception?"})
+    assert response.get_json() == {"response": "reply"}
+    assert dispatcher.stats()["upstream_calls"] == 1
+    assert requests[0]["messages"][1]["content"] == "Inception?"
+    dispatcher.close()
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+
+import httpx
+from langfuse import Langfuse
+import pytest
+
+from benchmarks.fake_langfuse_api import FakeLangfuseAPI
+from benchmarks.fake_ollama import FakeOllama, serve_in_thread
+from benchmarks.load_harness import compare, main, percentile, run_open_loop, stack_env
+
+
+@pytest.fixture
+def langfuse_api():
+    api = FakeLangfuseAPI()
+    url, stop = serve_in_thread(api)
+    yield api, Langfuse(public_key="pk-lf-test", secret_key="sk-lf-test", host=url)
+    stop()
+
+
+def test_fake_langfuse_api_serves_the_sdk(langfuse_api):
+    api, langfuse = langfuse_api
+    langfuse.create_prompt(name="critic", prompt="Be terse.", config={"parent_id": None}, labels=["production"])
+    langfuse.create_prompt(name="critic", prompt="Be fair.", config={"parent_id": "critic_v1"})
+    langfuse.client.prompt_version.update(name="critic", version=2, new_labels=["staging"])
+
+    assert [(meta.name, meta.versions) for meta in langfuse.client.prompts.list().data] == [("critic", [1, 2])]
+    assert langfuse.get_prompt("critic", cache_ttl_seconds=0).prompt == "Be terse."
+    assert langfuse.get_prompt("critic", label="staging", cache_ttl_seconds=0).config == {"parent_id": "critic_v1"}
+
+    langfuse.trace(id="t-1", name="message", input="Inception?", output="Great.", tags=["ext_eval_pipelines"])
+    langfuse.trace(id="t-2", name="message", input="Tenet?", output="Loud.")
+    langfuse.score(trace_id="t-1", name="tone", value="neutral", data_type="CATEGORICAL")
+    langfuse.score(trace_id="t-1", name="joyfulness", value=0.8, data_type="NUMERIC")
+    langfuse.flush()
+
+    assert [trace.id for trace in langfuse.fetch_traces(tags="ext_eval_pipelines").data] == ["t-1"]
+    trace = langfuse.fetch_trace("t-1").data
+    assert (trace.output, sorted(score.name for score in trace.scores)) == ("Great.", ["joyfulness", "tone"])
+    assert api.stats()["scores"] == 2
+
+
+def test_fake_ollama_latency_distribution_and_token_rate():
+    fixed = FakeOllama(latency=0.2)
+    spread = FakeOllama(latency=0.2, latency_sigma=0.5, seed=1)
+    samples = sorted(spread.first_token_delay() for _ in range(1001))
+    assert fixed.first_token_delay() == 0.2
+    assert 0.18 < samples[500] < 0.22 and samples[990] > 0.5
+
+    ollama = FakeOllama(reply=" ".join(["word"] * 20), token_rate=100)
+    url, stop = serve_in_thread(ollama)
+    try:
+        response = httpx.post(f"{url}/v1/chat/completions", json={"model": "smollm2", "messages": []})
+    finally:
+        stop()
+    assert response.elapsed.total_seconds() >= 0.2
+
+
+def test_open_loop_counts_errors_rejections_and_drops():
+    calls = []
+
+    async def op():
+        calls.append(None)
+        status = [200, 200, 503, 500][len(calls) % 4]
+        await asyncio.sleep(0.05)
+        return status
+
+    async def stuck():
+        await asyncio.sleep(0.3)
+        return 200
+
+    result = asyncio.run(run_open_loop("message", op, rps=40, duration=0.5, max_in_flight=100))
+    assert (result["sent"], result["ok"], result["rejected"], result["errors"]) == (20, 10, 5, 5)
+    assert result["error_kinds"] == {"500": 5, "503": 5}
+    assert result["latency_s"]["p50"] >= 0.05
+
+    result = asyncio.run(run_open_loop("prompts", stuck, rps=100, duration=0.2, max_in_flight=5))
+    assert (result["sent"], result["dropped"]) == (5, 15)
+    assert percentile([1, 2, 3, 4], 0.5) == 2 and percentile([], 0.99) is None
+
+
+def test_harness_reports_every_scenario(tmp_path, capsys, monkeypatch):
+    # The harness points the evaluator at the fakes through the environment
+    for name in stack_env("", ""):
+        monkeypatch.setenv(name, "")
+    output = tmp_path / "report.json"
+    main(["--duration", "1", "--message-rps", "4", "--prompts-rps", "8", "--evaluator-rps", "1",
+          "--eval-traces", "2", "--ollama-latency", "0.01", "--reply-words", "5", "--label", "test",
+          "--output", str(output)])
+    logging.disable(logging.NOTSET)
+    report = json.loads(output.read_text())
+
+    assert report["label"] == "test"
+    for name, sent in (("message", 4), ("prompts", 8), ("evaluator", 1)):
+        scenario = report["scenarios"][name]
+        assert (scenario["sent"], scenario["ok"], scenario["error_rate"]) == (sent, sent, 0.0)
+        assert scenario["latency_s"]["p99"] >= scenario["latency_s"]["p50"] > 0
+    assert report["fakes"]["langfuse"]["scores"] == 4
+    assert report["fakes"]["ollama"]["requests"] == 4 + 2
+
+    lines = compare(report, report)
+    assert lines[1].split()[:2] == ["message", "throughput_rps"] and lines[1].endswith("+0.0%")
+    assert "message" in capsys.readouterr().err
@@ -0,0 +1,137 @@
+import io
+import json
+import logging
+from logging.handlers import QueueListener
+import queue
+import threading
+import time
+
+from promptpilot import logs
+from promptpilot.logs import JsonFormatter, SampledQueueHandler, log_event, parse_sample_rates, setup_logging
+
+
+def record_for(event, level=logging.INFO, **fields):
+    records = []
+    logger = logging.getLogger("test.logs.record")
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    try:
+        log_event(logger, event, level, **fields)
+    finally:
+        logger.removeHandler(handler)
+    return records[0]
+
+
+def test_json_formatter_truncates_fields_and_messages():
+    formatter = JsonFormatter(max_length=5)
+    entry = json.loads(formatter.format(record_for("chat.reply", user_input="Inception?", tokens=12,
+                                                   timings={"stage": "upstream-call"})))
+    assert entry["event"] == "chat.reply" and entry["level"] == "INFO" and entry["logger"] == "test.logs.record"
+    assert entry["user_input"] == "Incep... [5 more chars]"
+    assert (entry["tokens"], entry["timings"]) == (12, {"stage": "upstr... [8 more chars]"})
+
+    plain = logging.LogRecord("app", logging.ERROR, __file__, 1, "failed: %s", ("a long reason",), None)
+    assert json.loads(formatter.format(plain))["message"] == "faile... [16 more chars]"
+    assert str(record_for("chat.reply", response="ok").getMessage()) == "chat.reply response='ok'"
+
+
+def test_handler_samples_events_and_never_waits_on_a_full_queue():
+    draws = iter([0.05, 0.5, 0.05, 0.9])
+    handler = SampledQueueHandler(queue.Queue(maxsize=2), {"chat.reply": 0.1}, random=lambda: next(draws))
+    for _ in range(4):
+        handler.handle(record_for("chat.reply"))
+    assert handler.stats() == {"queued": 2, "sampled_out": 2, "dropped": 0, "backlog": 2}
+
+    start = time.perf_counter()
+    handler.handle(record_for("eval.trace_evaluated"))
+    assert time.perf_counter() - start < 0.5
+    assert handler.stats()["dropped"] == 1
+    assert parse_sample_rates("chat.reply=0.1, *=0.5") == {"chat.reply": 0.1, "*": 0.5}
+
+
+def test_formatting_and_io_happen_on_the_writer_thread():
+    threads = []
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            threads.append(threading.current_thread())
+            self.format(record)
+            time.sleep(0.05)
+
+    log_queue = queue.Queue()
+    listener = QueueListener(log_queue, SlowHandler())
+    listener.start()
+    handler = SampledQueueHandler(log_queue)
+    start = time.perf_counter()
+    for _ in range(20):
+        handler.handle(record_for("chat.reply", response="x" * 10000))
+    elapsed = time.perf_counter() - start
+    listener.stop()
+
+    assert elapsed < 0.5
+    assert len(threads) == 20 and threading.current_thread() not in threads
+
+
+def test_setup_logging_writes_json_lines(monkeypatch, tmp_path):
+    root = logging.getLogger()
+    monkeypatch.setattr(logs, "_pipeline", None)
+    monkeypatch.setattr(root, "level", root.level)
+    stream = io.StringIO()
+    path = tmp_path / "debug.log"
+    path.write_text("from an earlier run\n")
+    pipeline = setup_logging(file_path=str(path), file_level=logging.DEBUG, stream=stream, file_mode="w",
+                             environ={"LOG_MAX_LENGTH": "8", "LOG_SAMPLE": "chat.debug=0"})
+    assert setup_logging() is pipeline
+    try:
+        logger = logging.getLogger("test.logs.setup")
+        log_event(logger, "chat.reply", response="A fine film, well paced.")
+        log_event(logger, "chat.debug", response="never")
+        logger.debug("only in the file")
+    finally:
+        pipeline.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["event"], line["response"]) for line in lines] == [("chat.reply", "A fine f... [16 more chars]")]
+    messages = [json.loads(line).get("message") for line in path.read_text().splitlines()]
+    assert messages == [None, "only in ... [8 more chars]"]
+    assert pipeline.stats()["sampled_out"] == 1
+    assert pipeline.handler not in root.handlers
+    pipeline.stop()
+
+
+def test_setup_logging_falls_back_to_info_for_an_unknown_level(monkeypatch):
+    root = logging.getLogger()
+    monkeypatch.setattr(logs, "_pipeline", None)
+    monkeypatch.setattr(root, "level", root.level)
+    stream = io.StringIO()
+    pipeline = setup_logging(stream=stream, environ={"LOG_LEVEL": "verbose"})
+    try:
+        assert root.level == logging.INFO
+        logging.getLogger("test.logs.level").debug("hidden")
+    finally:
+        pipeline.stop()
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(line["level"], line["message"]) for line in lines] == [
+        ("WARNING", "Unknown log level 'verbose', using INFO.")]
+
+
+def test_handler_counts_records_from_many_threads():
+    handler = SampledQueueHandler(queue.Queue(maxsize=1000), {"chat.reply": 0.5}, random=lambda: 0.7)
+    record = record_for("eval.trace_evaluated")
+    sampled = record_for("chat.reply")
+
+    def log():
+        for _ in range(300):
+            handler.handle(record)
+            handler.handle(sampled)
+
+    threads = [threading.Thread(target=log) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert handler.stats() == {"queued": 1000, "sampled_out": 1200, "dropped": 200, "backlog": 1000}
@@ -0,0 +1,102 @@
+import os
+from types import SimpleNamespace
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.metrics import Registry, StageTimer, stats_gauges
+from promptpilot.serving.sessions import SessionStore
+from promptpilot.versioning.tree import PromptTree
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests handled", ["route", "status"])
+    in_flight = registry.gauge("in_flight", "Requests being handled")
+    latency = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    requests.inc(route="/message", status=200)
+    requests.inc(2, route="/message", status=200)
+    in_flight.set(3)
+    for value in (0.05, 0.5, 5):
+        latency.observe(value, stage='up"stream')
+    registry.add_collector(lambda: stats_gauges("cache", {"hits": 4, "rejected": {"full": 1}, "size": None}))
+
+    lines = registry.render().splitlines()
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/message",status="200"} 3' in lines
+    assert "in_flight 3" in lines
+    assert 'latency_seconds_bucket{stage="up\\"stream",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="up\\"stream",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="up\\"stream",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="up\\"stream"} 5.55' in lines
+    assert 'latency_seconds_count{stage="up\\"stream"} 3' in lines
+    assert "cache_hits 4" in lines
+    assert 'cache_rejected{kind="full"} 1' in lines
+    assert not any(line.startswith("cache_size") for line in lines)
+
+
+def test_stage_timer_records_stages_and_total(clock):
+    clock.step = 0.25
+    registry = Registry()
+    histogram = registry.histogram("stage_seconds", "Stages", ["stage"])
+    timer = StageTimer(histogram, clock=clock)
+    with timer.stage("prompt"):
+        pass
+    with timer.stage("upstream"):
+        pass
+    timer.finish()
+
+    assert timer.timings_ms() == {"prompt": 250.0, "upstream": 250.0, "total": 1250.0}
+    assert histogram.value(stage="upstream") == {"count": 1, "sum": 0.25}
+
+
+def test_message_timings_reach_metrics_and_trace(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    traces = []
+
+    def create(**kwargs):
+        if kwargs.get("stream"):
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="reply"))])])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="reply"))],
+                               usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3))
+
+    def fail(**kwargs):
+        raise ConnectionError("ollama is down")
+
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace(trace=lambda **kw: traces.append(kw)))
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    client = app_module.app.test_client()
+    tokens_before = app_module.TOKENS.value(kind="completion")
+    errors_before = app_module.UPSTREAM_ERRORS.value(error="ConnectionError")
+
+    assert client.post("/message", json={"message": "Hi"}).status_code == 200
+    assert "event: done" in client.post("/message/stream", json={"message": "Hi"}).get_data(as_text=True)
+    app_module.client.chat.completions.create = fail
+    assert client.post("/message", json={"message": "Hi"}).status_code == 500
+
+    assert set(traces[0]["metadata"]["timings_ms"]) == {"prompt_lookup", "prompt_compile", "upstream", "serialize",
+                                                        "total"}
+    assert traces[0]["output"] == "reply"
+    assert set(traces[1]["metadata"]["timings_ms"]) == {"prompt_lookup", "prompt_compile", "upstream",
+                                                        "first_token", "total"}
+    assert "ollama is down" in traces[2]["metadata"]["error"]
+    assert app_module.TOKENS.value(kind="completion") - tokens_before == 3
+    assert app_module.UPSTREAM_ERRORS.value(error="ConnectionError") - errors_before == 1
+
+    scrape = client.get("/metrics")
+    assert scrape.mimetype == "text/plain"
+    body = scrape.get_data(as_text=True)
+    assert 'chat_stage_seconds_count{route="/message",stage="upstream"}' in body
+    assert 'chat_stage_seconds_count{route="/message/stream",stage="first_token"}' in body
+    assert 'chat_requests_in_flight{route="/message"} 0' in body
+    assert 'chat_requests_in_flight{route="/message/stream"} 0' in body
+    assert 'chat_requests_total{route="/message",status="200"}' in body
+
+    # Session lookups are timed apart from compiling the prompt
+    monkeypatch.setattr(app_module, "sessions", SessionStore())
+    app_module.client.chat.completions.create = create
+    assert client.post("/message", json={"message": "Hi", "session_id": None}).status_code == 200
+    assert set(traces[3]["metadata"]["timings_ms"]) == {"prompt_lookup", "prompt_compile", "session_history",
+                                                        "upstream", "serialize", "total"}
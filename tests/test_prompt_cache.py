@@ -0,0 +1,116 @@
+import os
+import threading
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.cache import PromptCache
+from promptpilot.versioning.tree import PromptTree
+
+
+def wait_for_refresh(cache):
+    if cache._executor is not None:
+        cache._executor.shutdown(wait=True)
+        cache._executor = None
+
+
+def test_fresh_entries_are_hits(clock):
+    cache = PromptCache(ttl_seconds=10, clock=clock)
+    loads = []
+
+    assert cache.get("a", lambda: loads.append(1) or "v1") == "v1"
+    assert cache.get("a", lambda: loads.append(1) or "v2") == "v1"
+    assert len(loads) == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_stale_entries_are_served_while_refreshing(clock):
+    cache = PromptCache(ttl_seconds=10, stale_ttl_seconds=10, clock=clock)
+    cache.get("a", lambda: "v1")
+    clock.now = 15
+
+    assert cache.get("a", lambda: "v2") == "v1"
+    wait_for_refresh(cache)
+    assert cache.get("a", lambda: "v3") == "v2"
+    assert cache.stats()["stale_hits"] == 1
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_expired_entries_are_reloaded_inline(clock):
+    cache = PromptCache(ttl_seconds=10, stale_ttl_seconds=10, clock=clock)
+    cache.get("a", lambda: "v1")
+    clock.now = 25
+
+    assert cache.get("a", lambda: "v2") == "v2"
+    assert cache.stats()["misses"] == 2
+
+
+def test_failed_refresh_keeps_stale_value(clock):
+    cache = PromptCache(ttl_seconds=10, clock=clock)
+    cache.get("a", lambda: "v1")
+    clock.now = 15
+
+    def boom():
+        raise RuntimeError("down")
+
+    assert cache.get("a", boom) == "v1"
+    wait_for_refresh(cache)
+    assert cache.stats()["refresh_errors"] == 1
+    assert cache.get("a", lambda: "v2") == "v1"
+
+
+def test_lru_eviction(clock):
+    cache = PromptCache(max_size=2, clock=clock)
+    cache.get("a", lambda: "a")
+    cache.get("b", lambda: "b")
+    cache.get("a", lambda: "a")
+    cache.get("c", lambda: "c")
+
+    assert cache.get("b", lambda: "b2") == "b2"
+    assert cache.stats()["evictions"] == 2
+
+
+def test_invalidate_drops_refresh_in_flight(clock):
+    cache = PromptCache(ttl_seconds=10, clock=clock)
+    cache.get("a", lambda: "v1")
+    clock.now = 15
+    release = threading.Event()
+
+    def slow_loader():
+        release.wait(5)
+        return "late"
+
+    assert cache.get("a", slow_loader) == "v1"
+    cache.invalidate("a")
+    release.set()
+    wait_for_refresh(cache)
+
+    assert cache.get("a", lambda: "v2") == "v2"
+
+
+def test_get_latest_prompt_is_cached_until_create(tmp_path):
+    langfuse = FakeLangfuse(prompt_count=1, versions_per_prompt=2)
+    tree = PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'))
+    fetched = langfuse.calls["get_prompt"]
+
+    assert tree.get_latest_prompt("prompt-0").version == 2
+    assert tree.get_latest_prompt("prompt-0").version == 2
+    assert langfuse.calls["get_prompt"] == fetched + 1
+    assert tree.prompt_cache.stats()["hits"] == 1
+
+    tree.create_prompt("prompt-0", "v3", {}, parent_id="prompt-0_v2")
+    assert tree.get_latest_prompt("prompt-0").version == 3
+
+    tree.sync_with_langfuse()
+    assert tree.prompt_cache.stats()["size"] == 0
+    assert tree.get_latest_prompt("missing") is None
+
+
+def test_get_latest_prompt_without_cache(tmp_path):
+    langfuse = FakeLangfuse(prompt_count=1)
+    tree = PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'), prompt_cache_size=0)
+    fetched = langfuse.calls["get_prompt"]
+
+    tree.get_latest_prompt("prompt-0")
+    tree.get_latest_prompt("prompt-0")
+
+    assert langfuse.calls["get_prompt"] == fetched + 2
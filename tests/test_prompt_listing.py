@@ -0,0 +1,101 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.sqlite_storage import SQLiteStorage
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def tree(request, tmp_path):
+    langfuse = FakeLangfuse()
+    for name in ("gamma", "alpha", "beta"):
+        langfuse.create_prompt(name, f"You are {name}.", config={"temperature": 0.1}, labels=["production"])
+    langfuse.create_prompt("alpha", "You are alpha, v2.")
+    storage = SQLiteStorage(os.path.join(tmp_path, 'prompts.db')) if request.param == "sqlite" else None
+    return PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'), storage=storage)
+
+
+def test_list_prompts_pages_by_name(tree):
+    page, after = tree.list_prompts(limit=2)
+    assert [entry["name"] for entry in page] == ["alpha", "beta"]
+    assert page[0]["versions"] == [1, 2]
+    assert page[0]["latest_version"] == 2
+    assert page[0]["labels"] == ["production"]
+    assert "last_config" not in page[0]
+
+    page, after = tree.list_prompts(after=after, limit=2)
+    assert [entry["name"] for entry in page] == ["gamma"]
+    assert after is None
+
+
+def test_list_prompts_field_selection(tree):
+    page, _ = tree.list_prompts(fields=["name", "last_config"])
+    assert page[1] == {"name": "beta", "last_config": {"temperature": 0.1}}
+    with pytest.raises(ValueError):
+        tree.list_prompts(fields=["name", "secret"])
+
+
+def test_revision_changes_with_local_state(tree):
+    tag = tree.revision_tag
+    tree.list_prompts()
+    assert tree.revision_tag == tag
+
+    tree.create_prompt("delta", "You are delta.", {})
+    assert tree.revision_tag != tag
+    assert [entry["name"] for entry in tree.list_prompts(fields=["name"])[0]] == ["alpha", "beta", "delta", "gamma"]
+
+    tag = tree.revision_tag
+    tree.sync_with_langfuse()
+    assert tree.revision_tag != tag
+
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    langfuse = FakeLangfuse()
+    for i in range(5):
+        langfuse.create_prompt(f"prompt-{i}", "You are a critic.")
+    tree = PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'))
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace())
+    return tree, app_module.app.test_client()
+
+
+def test_prompts_endpoint_pages_with_cursor(app_client):
+    tree, client = app_client
+    names = []
+    cursor = None
+    while True:
+        response = client.get("/prompts", query_string={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        names.extend(entry["name"] for entry in response.get_json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert names == [f"prompt-{i}" for i in range(5)]
+
+    assert client.get("/prompts", query_string={"fields": "latest_version"}).get_json()[0] == {
+        "name": "prompt-0", "latest_version": 1}
+    assert client.get("/prompts", query_string={"fields": "nope"}).status_code == 400
+    assert client.get("/prompts", query_string={"limit": "0"}).status_code == 400
+    assert client.get("/prompts", query_string={"cursor": "!!"}).status_code == 400
+
+
+def test_prompts_endpoint_revalidates_with_etag(app_client):
+    tree, client = app_client
+    first = client.get("/prompts")
+    etag = first.headers["ETag"]
+
+    cached = client.get("/prompts", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    tree.create_prompt("prompt-5", "You are a new critic.", {})
+    fresh = client.get("/prompts", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != etag
+    assert len(fresh.get_json()) == 6
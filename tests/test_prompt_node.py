@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.node import PromptNode, compact_tree, epoch_micros
+from promptpilot.versioning.storage import JournalStorage, JsonFileStorage
+from promptpilot.versioning.tree import PromptTree
+
+
+def test_node_reads_like_a_dict():
+    node = PromptNode(id="a_v2", name="a", version=2, parent_id="a_v1",
+                      created_at="2024-05-01T10:00:00.123456+00:00", content_hash="ab" * 32, content="hi")
+
+    assert node["id"] == "a_v2" and node["version"] == 2 and node.get("parent_id") == "a_v1"
+    assert node["created_at"] == "2024-05-01T10:00:00.123456+00:00"
+    assert node["content_hash"] == "ab" * 32
+    assert node.get("missing") is None
+    assert node == {"id": "a_v2", "name": "a", "version": 2, "parent_id": "a_v1",
+                    "created_at": "2024-05-01T10:00:00.123456+00:00", "content_hash": "ab" * 32,
+                    "content": "hi"}
+    assert not hasattr(node, '__dict__')
+
+
+@pytest.mark.parametrize("created_at", [
+    "2024-05-01T10:00:00+00:00",
+    "2024-05-01T10:00:00.000001+00:00",
+    "1969-12-31T23:59:59.5+00:00",
+    "2024-05-01T12:00:00+02:00",
+    "2024-05-01T10:00:00.000000+00:00",
+    "2024-05-01 10:00:00+00:00",
+    "",
+])
+def test_timestamps_round_trip_exactly(created_at):
+    node = PromptNode(id="a_v1", name="a", version=1, created_at=created_at)
+    assert node["created_at"] == created_at
+
+
+def test_only_canonical_utc_timestamps_become_integers():
+    assert epoch_micros("1970-01-01T00:00:01.000002+00:00") == 1_000_002
+    assert epoch_micros("2024-05-01T12:00:00+02:00") is None
+    assert epoch_micros("") is None
+
+
+@pytest.mark.parametrize("content_hash", ["ab" * 32, "AB" * 32, "12" * 32, "short", None])
+def test_hashes_round_trip_exactly(content_hash):
+    node = PromptNode(id="a_v1", name="a", version=1, content_hash=content_hash)
+    assert node["content_hash"] == content_hash
+
+
+def test_legacy_and_unknown_keys_survive(file_path):
+    legacy = {"id": "a_v1", "name": "a", "version": 1, "parent_id": None,
+              "created_at": "2024-01-01T00:00:00+00:00", "labels": ["x"]}
+    node = PromptNode.from_dict(legacy)
+
+    assert node.to_dict() == legacy
+    assert "content" not in node
+    assert node.get("content") is None
+    assert node["labels"] == ["x"]
+
+
+def test_compact_tree_serializes_to_the_same_json(file_path):
+    tree = {"prompts": {"a": [
+        {"id": "a_v1", "name": "a", "version": 1, "parent_id": None,
+         "created_at": "2024-01-01T00:00:00.250000+00:00", "content_hash": "0f" * 32, "content": "one"},
+        {"id": "a_v2", "name": "a", "version": 2, "parent_id": "a_v1",
+         "created_at": "2024-01-02T00:00:00+00:00", "content_hash": None, "content": None},
+    ]}}
+    JsonFileStorage(file_path).save(tree)
+    with open(file_path) as f:
+        original = f.read()
+
+    compact = compact_tree(JsonFileStorage(file_path).load())
+    assert compact["prompts"]["a"][1].parent_id is compact["prompts"]["a"][0].id
+    JsonFileStorage(file_path).save(compact)
+    with open(file_path) as f:
+        assert f.read() == original
+
+    journal = JournalStorage(file_path)
+    journal.append(compact, [PromptNode(id="a_v3", name="a", version=3, parent_id="a_v2", content="three")])
+    journal.close()
+    assert JournalStorage(file_path).load()["prompts"]["a"][2]["content"] == "three"
+
+
+def test_prompt_tree_with_compact_nodes(file_path):
+    langfuse = FakeLangfuse(prompt_count=2, versions_per_prompt=3)
+    tree = PromptTree(langfuse, file_path, compact_nodes=True)
+    created = tree.create_prompt("prompt-0", "new", {}, parent_id="prompt-0_v3")
+
+    assert isinstance(created, PromptNode)
+    assert all(isinstance(node, PromptNode) for nodes in tree.tree["prompts"].values() for node in nodes)
+    assert [n["id"] for n in tree.get_ancestors("prompt-0_v4")] == ["prompt-0_v3", "prompt-0_v2", "prompt-0_v1"]
+
+    # The file is plain node dicts, readable by a tree with the dict layout
+    with open(file_path) as f:
+        assert json.load(f)["prompts"]["prompt-0"][3]["content"] == "new"
+    reloaded = PromptTree(langfuse, file_path, sync_on_init='never')
+    assert reloaded.get_prompt_by_id("prompt-0_v4") == created
@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.chat import PROMPT_NAME, build_messages
+from promptpilot.serving.response_cache import (ResponseCache, SQLiteResponseCache, response_cache_from_env,
+                                                response_cache_key)
+from promptpilot.versioning.tree import PromptTree
+
+
+def key_for(version, content, user_input, params=None, model="smollm2"):
+    prompt = SimpleNamespace(name="critic", version=version, compile=lambda **kwargs: content)
+    return response_cache_key(model, prompt, build_messages(prompt, user_input), user_input, params)
+
+
+def test_key_changes_with_prompt_model_and_params_but_not_spacing():
+    base = key_for(1, "Be terse.", "What about Inception?")
+
+    assert key_for(1, "Be terse.", "  what ABOUT\tinception? ") == base
+    assert key_for(2, "Be terse.", "What about Inception?") != base
+    assert key_for(1, "Be verbose.", "What about Inception?") != base
+    assert key_for(1, "Be terse.", "What about Inception?", model="llama3") != base
+    assert key_for(1, "Be terse.", "What about Inception?", {"temperature": 0.2}) != base
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return ResponseCache(**kwargs)
+        return SQLiteResponseCache(os.path.join(tmp_path, 'responses.db'), **kwargs)
+    return make
+
+
+def test_entries_expire_after_ttl(make_cache, clock):
+    cache = make_cache(ttl_seconds=60, clock=clock)
+    cache.set("a", "answer")
+
+    clock.now += 59
+    assert cache.get("a") == "answer"
+    clock.now += 1
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_is_evicted_past_byte_cap(make_cache, clock):
+    cache = make_cache(max_bytes=10, clock=clock)
+    cache.set("a", "aaaa")
+    clock.now += 1
+    cache.set("b", "bbbb")
+    clock.now += 1
+    assert cache.get("a") == "aaaa"
+    clock.now += 1
+    cache.set("c", "cccc")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "aaaa"
+    assert cache.get("c") == "cccc"
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["size"], stats["bytes"]) == (1, 2, 8)
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+
+
+def test_byte_total_follows_replacements(make_cache):
+    cache = make_cache()
+    cache.set("a", "aaaa")
+    cache.set("a", "bb")
+    cache.set("b", "bbb")
+    assert (cache.stats()["size"], cache.stats()["bytes"]) == (2, 5)
+    cache.clear()
+    assert cache.stats()["bytes"] == 0
+
+
+def test_sqlite_hits_write_use_times_in_batches(tmp_path, clock):
+    path = os.path.join(tmp_path, 'responses.db')
+    cache = SQLiteResponseCache(path, clock=clock, touch_interval=10)
+    cache.set("a", "answer")
+
+    def used_at():
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT used_at FROM responses WHERE key = 'a'").fetchone()[0]
+
+    stored_at = used_at()
+    clock.now += 5
+    assert cache.get("a") == "answer"
+    assert used_at() == stored_at
+    clock.now += 5
+    assert cache.get("a") == "answer"
+    assert used_at() == stored_at + 10
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = os.path.join(tmp_path, 'responses.db')
+    writer, reader = SQLiteResponseCache(path), SQLiteResponseCache(path)
+    writer.set("a", "answer")
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(reader.get("a")))
+    thread.start()
+    thread.join()
+    assert results == ["answer"]
+
+
+def test_cache_from_env():
+    assert response_cache_from_env({}) is None
+    assert isinstance(response_cache_from_env({"RESPONSE_CACHE": "memory", "RESPONSE_CACHE_TTL": "5"}),
+                      ResponseCache)
+    with pytest.raises(ValueError):
+        response_cache_from_env({"RESPONSE_CACHE": "redis"})
+
+
+def test_message_serves_hits_and_misses_on_new_prompt_version(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    langfuse = FakeLangfuse()
+    tree = PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    tree.create_prompt(PROMPT_NAME, "You are a terse critic.", {})
+    requests, traces = [], []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"reply {len(requests)}"))])
+
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache())
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace(trace=lambda **kw: traces.append(kw)))
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    client = app_module.app.test_client()
+
+    first = client.post("/message", json={"message": "Inception?"}).get_json()
+    second = client.post("/message", json={"message": " inception? "}).get_json()
+    assert first == second == {"response": "reply 1"}
+    assert requests[0]["tags"] == ["cache-miss"]
+    assert [trace["tags"] for trace in traces] == [["cache-miss"], ["cache-hit"]]
+    assert traces[1]["metadata"]["prompt_version"] == 1
+
+    tree.create_prompt(PROMPT_NAME, "You are a verbose critic.", {})
+    third = client.post("/message", json={"message": "Inception?"}).get_json()
+    assert third == {"response": "reply 2"}
+    assert app_module.response_cache.stats()["hits"] == 1
+
+
+def test_stream_shares_the_cache_with_message(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    tree.create_prompt(PROMPT_NAME, "You are a terse critic.", {})
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+                     for token in ("A ", "heist.")])
+
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "response_cache", ResponseCache())
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace(trace=lambda **kw: None))
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    client = app_module.app.test_client()
+
+    streamed = [client.post("/message/stream", json={"message": "Inception?"}).get_data(as_text=True)
+                for _ in range(2)]
+    assert all('"response": "A heist."' in body for body in streamed)
+    assert streamed[1].count("event: token") == 1
+    assert client.post("/message", json={"message": "Inception?"}).get_json() == {"response": "A heist."}
+    assert len(requests) == 1 and requests[0]["tags"] == ["cache-miss"]
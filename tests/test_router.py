@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from types import SimpleNamespace
+
+import pytest
+from openai import OpenAI
+from werkzeug.test import EnvironBuilder
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from benchmarks.fake_ollama import FakeOllama, serve_in_thread
+from promptpilot.serving.metrics import table_gauges
+from promptpilot.serving.router import ModelRouter, model_router_from_env, router_urls
+from promptpilot.versioning.tree import PromptTree
+
+
+def make_client(url):
+    return OpenAI(base_url=url, api_key="ollama", max_retries=0)
+
+
+@pytest.fixture
+def backends():
+    started = []
+
+    def start(count, **kwargs):
+        for _ in range(count):
+            fake = FakeOllama(**kwargs)
+            url, stop = serve_in_thread(fake)
+            started.append(stop)
+            yield fake, f"{url}/v1"
+
+    yield lambda count, **kwargs: list(start(count, **kwargs))
+    for stop in started:
+        stop()
+
+
+def ask(router, model="smollm2"):
+    return router.chat.completions.create(model=model, messages=[{"role": "user", "content": "Hi"}])
+
+
+def test_concurrent_requests_spread_over_least_loaded(backends):
+    servers = backends(3, latency=0.2)
+    router = ModelRouter([url for _, url in servers], make_client)
+
+    with ThreadPoolExecutor(6) as pool:
+        replies = list(pool.map(lambda _: ask(router), range(6)))
+
+    assert all(reply.choices[0].message.content for reply in replies)
+    assert [fake.max_in_flight for fake, _ in servers] == [2, 2, 2]
+    stats = router.stats()["backends"]
+    assert all(entry["outstanding"] == 0 and entry["latency_ms"] >= 200 for entry in stats.values())
+
+
+def test_prefers_backends_with_the_model_loaded(backends):
+    (warm, warm_url), (cold, cold_url) = backends(1, loaded=["smollm2:latest"]) + backends(1, loaded=["llama3"])
+    router = ModelRouter([cold_url, warm_url], make_client)
+    router.check_health()
+
+    for _ in range(4):
+        ask(router)
+    ask(router, model="llama3")
+
+    assert (warm.requests, cold.requests) == (4, 1)
+    assert router.stats()["backends"][warm_url]["models"] == ["smollm2"]
+
+
+def test_failing_backend_is_ejected_and_reintroduced(backends):
+    (good, good_url), (flaky, flaky_url) = backends(2)
+    router = ModelRouter([good_url, flaky_url], make_client)
+
+    flaky.down = True
+    router.check_health()
+    assert router.stats()["backends"][flaky_url]["healthy"] is False
+    for _ in range(3):
+        ask(router)
+    assert (good.requests, flaky.requests) == (3, 0)
+
+    flaky.down = False
+    router.check_health()
+    for _ in range(4):
+        ask(router)
+    assert flaky.requests == 2
+
+
+def test_unreachable_backend_is_retried_elsewhere_and_ejected(backends):
+    (fake, url), = backends(1)
+    dead_url = "http://127.0.0.1:9/v1"
+    router = ModelRouter([dead_url, url], make_client, eject_after=1)
+
+    for _ in range(3):
+        assert ask(router).choices[0].message.content == fake.reply
+
+    stats = router.stats()
+    assert stats["retried"] == 1
+    assert stats["backends"][dead_url]["healthy"] is False
+    assert stats["backends"][dead_url]["errors"] == 1
+    assert fake.requests == 3
+    gauges = {gauge.name: gauge for gauge in table_gauges("backend", stats["backends"], "backend")}
+    assert gauges["backend_healthy"].value(backend=dead_url) == 0
+    assert gauges["backend_requests"].value(backend=url) == 3
+
+
+def test_stream_holds_its_backend_until_consumed(backends):
+    (fake, url), = backends(1)
+    router = ModelRouter([url], make_client)
+
+    stream = router.chat.completions.create(model="smollm2", messages=[], stream=True)
+    assert router.stats()["backends"][url]["outstanding"] == 1
+    text = "".join(chunk.choices[0].delta.content or "" for chunk in stream)
+    assert text == fake.reply
+    assert router.stats()["backends"][url]["outstanding"] == 0
+
+
+def test_stream_closed_before_iterating_releases_its_backend(backends, tmp_path, monkeypatch):
+    from app import app as app_module
+
+    (_, url), = backends(1)
+    router = ModelRouter([url], make_client)
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "client", router)
+    monkeypatch.setattr(app_module, "response_cache", None)
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace(trace=lambda **kw: None))
+
+    # The server closes the body before pulling the first event, as when
+    # the client has already gone
+    environ = EnvironBuilder(path="/message/stream", method="POST", json={"message": "Hi"}).get_environ()
+    body = app_module.app.wsgi_app(environ, lambda status, headers: None)
+    assert router.stats()["backends"][url]["outstanding"] == 1
+    body.close()
+    assert router.stats()["backends"][url]["outstanding"] == 0
+
+
+def test_router_from_env():
+    assert router_urls({"OLLAMA_BASE_URL": "http://a/v1"}) == ["http://a/v1"]
+    assert router_urls({"OLLAMA_BASE_URLS": "http://a/v1, http://b/v1,"}) == ["http://a/v1", "http://b/v1"]
+    assert model_router_from_env(make_client, {"OLLAMA_BASE_URLS": "http://a/v1"}) is None
+    urls = "http://127.0.0.1:9/v1,http://127.0.0.1:7/v1"
+    router = model_router_from_env(make_client, {"OLLAMA_BASE_URLS": urls, "OLLAMA_HEALTH_INTERVAL_S": "60"})
+    router.close()
+    assert [backend.url for backend in router.backends] == urls.split(",")
@@ -0,0 +1,131 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.chat import PROMPT_NAME
+from promptpilot.serving.sessions import SQLiteSessionStore, SessionStore, estimate_tokens, session_store_from_env
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    # Both stores must behave the same
+    if request.param == "memory":
+        return SessionStore
+    return lambda **options: SQLiteSessionStore(os.path.join(tmp_path, 'chat_sessions.db'), **options)
+
+
+def test_history_is_truncated_in_steps_keeping_the_latest_exchange(make_store):
+    store = make_store(max_history_tokens=100)
+    session_id = store.resume()
+    text = "x" * 80  # 24 tokens a message
+    assert estimate_tokens(text) == 24
+
+    prefixes = []
+    for turn in range(6):
+        store.record(session_id, f"{turn} {text}"[:80], text)
+        prefixes.append(store.history(session_id)[0]["content"])
+
+    # Over budget on the third exchange: down to at most half of it at once,
+    # then the oldest turn stays the same until the budget is hit again
+    assert prefixes[0] == prefixes[1] == "0 " + text[:78]
+    assert prefixes[2] == prefixes[3] == "2 " + text[:78]
+    assert prefixes[4] == prefixes[5] == "4 " + text[:78]
+    history = store.history(session_id)
+    assert [m["role"] for m in history] == ["user", "assistant", "user", "assistant"]
+    assert store.stats()["truncated_turns"] == 8
+
+
+def test_idle_sessions_expire_and_least_recent_are_evicted(make_store, clock):
+    store = make_store(idle_ttl=60, max_sessions=2, clock=clock)
+    first = store.resume()
+    clock.now = 30
+    second = store.resume()
+    clock.now = 70
+    assert store.resume(first) != first
+    assert store.resume(second) == second
+    store.resume()
+
+    assert store.stats()["sessions"] == 2
+    assert (store.stats()["expired"], store.stats()["evictions"]) == (1, 1)
+    assert store.resume(None) not in (first, second)
+
+
+def test_dropped_turns_are_summarized_in_the_background(make_store):
+    calls = []
+
+    def summarize(summary, turns):
+        calls.append((summary, turns))
+        return f"summary {len(calls)}"
+
+    store = make_store(max_history_tokens=60, summarize=summarize)
+    session_id = store.resume()
+    for turn in range(3):
+        store.record(session_id, f"question {turn}", "y" * 60)
+    deadline = time.monotonic() + 5
+    while store.stats()["summaries"] < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert calls[0] == (None, [("user", "question 0"), ("assistant", "y" * 60),
+                               ("user", "question 1"), ("assistant", "y" * 60)])
+    history = store.history(session_id)
+    assert history[0] == {"role": "system", "content": "Earlier in this conversation: summary 1"}
+    assert history[-2]["content"] == "question 2"
+
+
+def test_sqlite_sessions_are_shared_between_workers(tmp_path):
+    path = os.path.join(tmp_path, 'chat_sessions.db')
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    session_id = first.resume()
+    first.record(session_id, "Inception?", "Dreams within dreams.")
+
+    assert second.resume(session_id) == session_id
+    second.record(session_id, "And Memento?", "Backwards.")
+    assert [m["content"] for m in first.history(session_id)] == [
+        "Inception?", "Dreams within dreams.", "And Memento?", "Backwards."]
+    assert first.stats()["turns"] == 4
+
+
+def test_store_from_env(tmp_path):
+    assert session_store_from_env(environ={"CHAT_SESSIONS": "off"}) is None
+    store = session_store_from_env(summarize=print, environ={"CHAT_SESSION_MAX_TOKENS": "500"})
+    assert (type(store), store.max_history_tokens, store.summarize) == (SessionStore, 500, None)
+    path = os.path.join(tmp_path, 'chat_sessions.db')
+    store = session_store_from_env(environ={"CHAT_SESSIONS": "sqlite", "CHAT_SESSION_PATH": path})
+    assert isinstance(store, SQLiteSessionStore) and store.db_path == path
+
+
+def test_message_remembers_the_conversation(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    tree.create_prompt(PROMPT_NAME, "You are a terse critic.", {})
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs["messages"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"reply {len(requests)}"))])
+
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "sessions", SessionStore())
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace(trace=lambda **kw: None))
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    client = app_module.app.test_client()
+
+    first = client.post("/message", json={"message": "Inception?", "session_id": None}).get_json()
+    second = client.post("/message", json={"message": "And Memento?", "session_id": first["session_id"]}).get_json()
+    stateless = client.post("/message", json={"message": "Tenet?"}).get_json()
+
+    assert second == {"response": "reply 2", "session_id": first["session_id"]}
+    assert [m["content"] for m in requests[1]] == ["You are a terse critic.", "Inception?", "reply 1", "And Memento?"]
+    assert stateless == {"response": "reply 3"}
+    assert len(requests[2]) == 2
+
+    for route in ("/message", "/message/stream"):
+        bad = client.post(route, json={"message": "Heat?", "session_id": ["a"]})
+        assert bad.status_code == 400 and bad.get_json() == {"error": "session_id must be a string or null."}
+    assert len(requests) == 3
@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import threading
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.shared import FileLock
+from promptpilot.versioning.tree import PromptTree
+
+
+def serve(path, started, done, results):
+    # One worker process of a deployment sharing ``path``
+    langfuse = FakeLangfuse(prompt_count=3, versions_per_prompt=2)
+    tree = PromptTree(langfuse, path, sync_on_init='leader', refresh_interval=0.05)
+    started.wait()
+    ready = tree.wait_for_sync(timeout=20)
+    results.put((tree.is_leader, langfuse.calls["list"], ready, tree.get_next_version("prompt-0")))
+    done.wait()
+
+
+def test_one_process_syncs_for_the_deployment(tmp_path):
+    path = os.path.join(tmp_path, 'prompt_history.json')
+    context = multiprocessing.get_context('spawn')
+    started, done = context.Barrier(3), context.Event()
+    results = context.Queue()
+    workers = [context.Process(target=serve, args=(path, started, done, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=60) for _ in workers]
+    done.set()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    assert sorted(leader for leader, _, _, _ in outcomes) == [False, False, True]
+    assert sum(calls for _, calls, _, _ in outcomes) == 1
+    assert all(ready and next_version == 3 for _, _, ready, next_version in outcomes)
+
+
+def test_follower_takes_over_when_the_leader_exits(tmp_path):
+    path = os.path.join(tmp_path, 'prompt_history.json')
+    context = multiprocessing.get_context('spawn')
+    started, done = context.Barrier(1), context.Event()
+    results = context.Queue()
+    worker = context.Process(target=serve, args=(path, started, done, results))
+    worker.start()
+    assert results.get(timeout=60)[0] is True
+
+    langfuse = FakeLangfuse(prompt_count=1)
+    follower = PromptTree(langfuse, path, sync_on_init='leader', refresh_interval=0)
+    assert not follower.is_leader and follower.ready.is_set()
+    done.set()
+    worker.join(timeout=30)
+
+    follower.sync_status()
+    assert follower.is_leader
+    follower._sync_thread.join(timeout=10)
+    assert langfuse.calls["list"] == 1
+    assert follower.get_next_version("prompt-1") == 1
+
+
+def test_followers_see_writes_without_clobbering_them(tmp_path):
+    path = os.path.join(tmp_path, 'prompt_history.json')
+    langfuse = FakeLangfuse(prompt_count=2)
+    leader = PromptTree(langfuse, path, sync_on_init='leader', refresh_interval=0)
+    follower = PromptTree(langfuse, path, sync_on_init='leader', refresh_interval=0)
+    assert leader.wait_for_sync(timeout=10) and follower.wait_for_sync(timeout=10)
+    assert (leader.is_leader, follower.is_leader) == (True, False)
+    assert langfuse.calls["list"] == 1
+    tag = follower.revision_tag
+
+    leader.create_prompt("critic", "Be terse.", {})
+    follower.create_prompt("critic", "Be verbose.", {})
+    leader.create_prompt("critic", "Be fair.", {})
+
+    assert follower.revision_tag != tag
+    # Either process can revalidate the other's ETag
+    assert follower.revision_tag == leader.revision_tag
+    assert [node["content"] for node in follower.index.nodes("critic")] == ["Be terse.", "Be verbose.", "Be fair."]
+    assert follower.get_latest_prompt("critic").prompt == "Be fair."
+    names = [entry["name"] for entry in follower.list_prompts()[0]]
+    assert names == ["critic", "prompt-0", "prompt-1"]
+    reloaded = PromptTree(langfuse, path, sync_on_init='never')
+    assert reloaded.get_next_version("critic") == 4
+
+
+def test_followers_create_prompts_while_the_leader_fetches(tmp_path):
+    path = os.path.join(tmp_path, 'prompt_history.json')
+    langfuse = FakeLangfuse(prompt_count=1, versions_per_prompt=2)
+    leader = PromptTree(langfuse, path, shared=True, sync_on_init='never', refresh_interval=0)
+    follower = PromptTree(langfuse, path, shared=True, sync_on_init='never', refresh_interval=0)
+    fetching, created = threading.Event(), threading.Event()
+    timed_out = []
+    fetch_details = leader._fetch_details
+
+    def held_fetch(keys):
+        fetching.set()
+        timed_out.append(not created.wait(5))
+        return fetch_details(keys)
+
+    leader._fetch_details = held_fetch
+    sync = threading.Thread(target=leader.sync_with_langfuse)
+    sync.start()
+    assert fetching.wait(5)
+    follower.create_prompt("critic", "Be terse.", {})
+    created.set()
+    sync.join(10)
+
+    assert timed_out and not any(timed_out)
+    # The listing predated the new prompt, so the leader listed again
+    assert langfuse.calls["list"] == 2 and leader.sync_status()["state"] == "ready"
+    assert leader.get_next_version("critic") == 2 and leader.get_next_version("prompt-0") == 3
+
+
+def test_file_lock_excludes_other_holders(tmp_path):
+    path = os.path.join(tmp_path, 'history.lock')
+    first, second = FileLock(path), FileLock(path)
+    with first:
+        with first:
+            assert first.held
+        assert not second.acquire(blocking=False)
+    assert second.acquire(blocking=False)
+    second.release()
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.sqlite_storage import SQLiteStorage
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return os.path.join(tmp_path, 'prompt_history.db')
+
+
+@pytest.fixture
+def langfuse():
+    return FakeLangfuse()
+
+
+@pytest.fixture
+def prompt_tree(langfuse, db_path, tmp_path):
+    tree = PromptTree(langfuse, os.path.join(tmp_path, 'prompt_history.json'),
+                      storage=SQLiteStorage(db_path))
+    # root_v1 -> root_v2 -> child_v1 -> child_v2
+    #         -> other_v1
+    tree.create_prompt("root", "r1", {})
+    tree.create_prompt("root", "r2", {}, parent_id="root_v1")
+    tree.create_prompt("child", "c1", {}, parent_id="root_v2")
+    tree.create_prompt("child", "c2", {}, parent_id="child_v1")
+    tree.create_prompt("other", "o1", {}, parent_id="root_v1")
+    return tree
+
+
+def ids(nodes):
+    return [node["id"] for node in nodes]
+
+
+def test_queries_run_against_the_database(prompt_tree):
+    assert prompt_tree._tree is None
+    assert prompt_tree.get_prompt_by_id("child_v2")["parent_id"] == "child_v1"
+    assert prompt_tree.get_prompt_by_id("missing_v1") is None
+    assert prompt_tree.get_next_version("root") == 3
+    assert prompt_tree.get_latest_prompt("child").version == 2
+
+
+def test_lineage_queries_in_sql(prompt_tree):
+    assert ids(prompt_tree.get_children("root_v1")) == ["root_v2", "other_v1"]
+    assert ids(prompt_tree.get_ancestors("child_v2")) == ["child_v1", "root_v2", "root_v1"]
+    assert ids(prompt_tree.get_descendants("root_v1")) == ["root_v2", "other_v1", "child_v1", "child_v2"]
+    assert ids(prompt_tree.get_path("child_v2", "other_v1")) == [
+        "child_v2", "child_v1", "root_v2", "root_v1", "other_v1"]
+
+    subtree = prompt_tree.get_subtree("root_v1")
+    assert [c["node"]["id"] for c in subtree["children"]] == ["root_v2", "other_v1"]
+    assert subtree["children"][0]["children"][0]["children"][0]["node"]["id"] == "child_v2"
+
+
+def test_cycles_terminate(db_path):
+    storage = SQLiteStorage(db_path)
+    storage.save({"prompts": {"a": [
+        {"id": "a_v1", "name": "a", "version": 1, "parent_id": "a_v2", "created_at": ""},
+        {"id": "a_v2", "name": "a", "version": 2, "parent_id": "a_v1", "created_at": ""},
+    ]}})
+
+    assert ids(storage.ancestors("a_v1")) == ["a_v2"]
+    assert ids(storage.descendants("a_v1")) == ["a_v2"]
+
+
+def test_database_uses_wal_and_indexes(db_path, prompt_tree):
+    conn = prompt_tree.storage._connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(prompts)")}
+    assert {"prompts_name_version", "prompts_parent_id"} <= indexes
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT * FROM prompts WHERE parent_id = ?", ("x",)).fetchall()
+    assert "prompts_parent_id" in str([tuple(row) for row in plan])
+
+
+def test_processes_share_one_store(prompt_tree, langfuse, db_path, tmp_path):
+    other = PromptTree(langfuse, os.path.join(tmp_path, 'other.json'),
+                       storage=SQLiteStorage(db_path), incremental_sync=True)
+    other.create_prompt("root", "r3", {}, parent_id="root_v2")
+
+    assert prompt_tree.get_prompt_by_id("root_v3")["parent_id"] == "root_v2"
+    assert prompt_tree.get_next_version("root") == 4
+
+
+def test_sync_and_materialized_tree(prompt_tree, langfuse):
+    langfuse.create_prompt(name="fresh", prompt="f1", config={})
+
+    prompt_tree.sync_with_langfuse()
+
+    tree = prompt_tree.tree
+    assert list(tree["prompts"]) == ["root", "child", "other", "fresh"]
+    assert ids(tree["prompts"]["child"]) == ["child_v1", "child_v2"]
+    assert prompt_tree.get_ancestors("child_v2")[-1]["id"] == "root_v1"
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.serving.sse import AsyncCompletionStream, CompletionStream
+from promptpilot.versioning.tree import PromptTree
+
+
+def chunk(token):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+
+class FakeStream:
+    def __init__(self, tokens, fail_after=None):
+        self.tokens = tokens
+        self.fail_after = fail_after
+        self.closed = False
+
+    def __iter__(self):
+        for i, token in enumerate(self.tokens):
+            if i == self.fail_after:
+                raise ConnectionError("ollama went away")
+            yield chunk(token)
+
+    def close(self):
+        self.closed = True
+
+
+def parse(frames):
+    events = []
+    for frame in frames:
+        event, data = frame.strip().split("\n")
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_tokens_then_done_with_timings(clock):
+    clock.step = 0.1
+    finished = []
+    stream = CompletionStream(FakeStream(["Hel", None, "lo", "!"]), on_finish=finished.append,
+                              started_at=0.0, clock=clock)
+    events = parse(stream)
+
+    assert events[:3] == [("token", {"token": "Hel"}), ("token", {"token": "lo"}), ("token", {"token": "!"})]
+    assert events[3] == ("done", {"response": "Hello!", "ttft_ms": 100.0, "total_ms": 200.0})
+    assert finished == [stream]
+    assert stream.status == 'completed'
+
+
+def test_upstream_error_mid_stream_ends_with_error_event():
+    upstream = FakeStream(["a", "b", "c"], fail_after=2)
+    finished = []
+    events = parse(CompletionStream(upstream, on_finish=finished.append))
+
+    assert [event for event, _ in events] == ["token", "token", "error"]
+    assert events[-1][1]["response"] == "ab"
+    assert finished[0].status == 'error'
+    assert "ollama went away" in finished[0].error
+    assert upstream.closed
+
+
+def test_client_disconnect_closes_upstream():
+    upstream = FakeStream(["a", "b", "c"])
+    finished = []
+    frames = iter(CompletionStream(upstream, on_finish=finished.append))
+    next(frames)
+    frames.close()
+
+    assert upstream.closed
+    assert finished[0].status == 'cancelled'
+    assert finished[0].text == "a"
+
+
+def test_closing_unstarted_async_events_finishes_the_stream():
+    upstream = FakeStream(["a"])
+    finished = []
+
+    async def scenario():
+        events = AsyncCompletionStream(upstream, on_finish=finished.append).events()
+        await events.aclose()
+        await events.aclose()
+
+    asyncio.run(scenario())
+    assert upstream.closed
+    assert [(result.status, result.text) for result in finished] == [("cancelled", "")]
+
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    from app import app as app_module
+
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'), sync_on_init='never')
+    traces = []
+    monkeypatch.setattr(app_module, "prompt_manager", tree)
+    monkeypatch.setattr(app_module, "langfuse_client", SimpleNamespace(trace=lambda **kw: traces.append(kw)))
+    return app_module, app_module.app.test_client(), traces
+
+
+def test_stream_endpoint_sends_events_and_records_trace(app_client, monkeypatch):
+    app_module, client, traces = app_client
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return FakeStream(["It ", "was ", "great."])
+
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+    response = client.post("/message/stream", json={"message": "Inception?"})
+    assert response.mimetype == "text/event-stream"
+    events = parse(f"{frame}\n\n" for frame in response.get_data(as_text=True).split("\n\n") if frame)
+
+    assert [event for event, _ in events] == ["token", "token", "token", "done"]
+    assert events[-1][1]["response"] == "It was great."
+    assert requests[0]["stream"] is True
+    assert requests[0]["messages"][1] == {"role": "user", "content": "Inception?"}
+    assert traces[0]["id"] == requests[0]["trace_id"]
+    assert traces[0]["output"] == "It was great."
+    assert traces[0]["metadata"]["stream_status"] == "completed"
+    assert traces[0]["metadata"]["ttft_ms"] is not None
+
+
+def test_stream_endpoint_fails_fast_before_streaming(app_client, monkeypatch):
+    app_module, client, traces = app_client
+
+    def create(**kwargs):
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(app_module, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+
+    response = client.post("/message/stream", json={"message": "Inception?"})
+    assert response.status_code == 500
+    assert "error" in response.get_json()
+    assert client.post("/message/stream", json={}).status_code == 400
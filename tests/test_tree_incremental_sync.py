@@ -0,0 +1,117 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture
+def langfuse():
+    return FakeLangfuse(prompt_count=3, versions_per_prompt=4)
+
+
+def test_steady_state_resync_only_lists(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+    assert langfuse.calls == {"list": 1, "get_prompt": 12, "create_prompt": 0, "update_labels": 0}
+
+    tree.sync_with_langfuse()
+
+    assert langfuse.calls == {"list": 2, "get_prompt": 12, "create_prompt": 0, "update_labels": 0}
+
+
+def test_resync_fetches_only_new_versions(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+    langfuse.create_prompt(name="prompt-1", prompt="v5", config={"parent_id": "prompt-1_v4"})
+    langfuse.create_prompt(name="fresh", prompt="v1", config={})
+
+    tree.sync_with_langfuse()
+
+    assert langfuse.calls["get_prompt"] == 14
+    assert [p["version"] for p in tree.tree["prompts"]["prompt-1"]] == [1, 2, 3, 4, 5]
+    assert tree.tree["prompts"]["prompt-1"][-1]["parent_id"] == "prompt-1_v4"
+    assert tree.tree["prompts"]["fresh"][0]["id"] == "fresh_v1"
+
+
+def test_incremental_matches_full_sync(langfuse, file_path, tmp_path):
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+    langfuse.create_prompt(name="prompt-0", prompt="v5", config={"parent_id": "prompt-0_v2"})
+    tree.sync_with_langfuse()
+
+    full = PromptTree(langfuse, os.path.join(tmp_path, 'full.json'))
+
+    def lineage(t):
+        return {name: [(p["id"], p["parent_id"]) for p in nodes]
+                for name, nodes in t.tree["prompts"].items()}
+
+    assert lineage(tree) == lineage(full)
+
+
+def test_removed_prompt_names_are_dropped(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+    del langfuse._meta["prompt-2"]
+
+    tree.sync_with_langfuse()
+
+    assert set(tree.tree["prompts"]) == {"prompt-0", "prompt-1"}
+
+
+def test_watermark_persists_across_instances(langfuse, file_path):
+    PromptTree(langfuse, file_path, incremental_sync=True)
+
+    with open(os.path.splitext(file_path)[0] + '.watermark.json') as f:
+        watermark = json.load(f)
+    assert watermark["prompts"]["prompt-0"]["versions"] == [1, 2, 3, 4]
+
+    PromptTree(langfuse, file_path, incremental_sync=True)
+    assert langfuse.calls["get_prompt"] == 12
+
+
+def test_full_sync_still_refetches_everything(langfuse, file_path):
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+
+    tree.sync_with_langfuse(incremental=False)
+
+    assert langfuse.calls["get_prompt"] == 24
+
+
+def test_failed_detail_fetch_is_retried_on_next_sync(langfuse, file_path):
+    get_prompt = langfuse.get_prompt
+    failing = {("prompt-1", 2)}
+
+    def flaky_get_prompt(name, version=None, **kwargs):
+        if (name, version) in failing:
+            failing.discard((name, version))
+            raise RuntimeError("temporarily unavailable")
+        return get_prompt(name, version, **kwargs)
+
+    langfuse.get_prompt = flaky_get_prompt
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+    assert [p["version"] for p in tree.tree["prompts"]["prompt-1"]] == [1, 3, 4]
+
+    tree.sync_with_langfuse()
+
+    assert [p["version"] for p in tree.tree["prompts"]["prompt-1"]] == [1, 2, 3, 4]
+    assert tree.get_prompt_by_id("prompt-1_v2")["content"] == "prompt-1 content v2 {{movie}}"
+    reloaded = PromptTree(langfuse, file_path, sync_on_init='never')
+    assert [p["version"] for p in reloaded.tree["prompts"]["prompt-1"]] == [1, 2, 3, 4]
+
+
+def test_unfetched_newest_version_is_not_reused(langfuse, file_path):
+    get_prompt = langfuse.get_prompt
+
+    def failing_get_prompt(name, version=None, **kwargs):
+        if (name, version) == ("prompt-1", 4):
+            raise RuntimeError("temporarily unavailable")
+        return get_prompt(name, version, **kwargs)
+
+    langfuse.get_prompt = failing_get_prompt
+    tree = PromptTree(langfuse, file_path, incremental_sync=True)
+    assert [p["version"] for p in tree.tree["prompts"]["prompt-1"]] == [1, 2, 3]
+    assert tree.get_next_version("prompt-1") == 5
+
+    created = tree.create_prompt("prompt-1", "A new take.", {})
+    assert created["version"] == 5 and langfuse._get_prompt("prompt-1", 5).prompt == "A new take."
+    assert PromptTree(langfuse, file_path, sync_on_init='never').get_next_version("prompt-1") == 6
+
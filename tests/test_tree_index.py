@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.index import TreeIndex
+from promptpilot.versioning.tree import PromptTree
+
+
+@pytest.fixture
+def prompt_tree(tmp_path):
+    tree = PromptTree(FakeLangfuse(), os.path.join(tmp_path, 'prompt_history.json'))
+    # root_v1 -> root_v2 -> child_v1 -> child_v2
+    #         -> other_v1
+    tree.create_prompt("root", "r1", {})
+    tree.create_prompt("root", "r2", {}, parent_id="root_v1")
+    tree.create_prompt("child", "c1", {}, parent_id="root_v2")
+    tree.create_prompt("child", "c2", {}, parent_id="child_v1")
+    tree.create_prompt("other", "o1", {}, parent_id="root_v1")
+    return tree
+
+
+def ids(nodes):
+    return [node["id"] for node in nodes]
+
+
+def test_lookups_follow_create_prompt(prompt_tree):
+    assert prompt_tree.get_prompt_by_id("child_v2")["parent_id"] == "child_v1"
+    assert prompt_tree.get_prompt_by_id("missing_v1") is None
+    assert prompt_tree.get_next_version("root") == 3
+    assert prompt_tree.get_next_version("new") == 1
+    assert prompt_tree.index.latest["child"]["id"] == "child_v2"
+
+
+def test_lineage_queries(prompt_tree):
+    assert ids(prompt_tree.get_children("root_v1")) == ["root_v2", "other_v1"]
+    assert ids(prompt_tree.get_ancestors("child_v2")) == ["child_v1", "root_v2", "root_v1"]
+    assert ids(prompt_tree.get_descendants("root_v1")) == ["root_v2", "other_v1", "child_v1", "child_v2"]
+    assert ids(prompt_tree.get_path("child_v2", "other_v1")) == [
+        "child_v2", "child_v1", "root_v2", "root_v1", "other_v1"]
+    assert ids(prompt_tree.get_path("root_v1", "child_v1")) == ["root_v1", "root_v2", "child_v1"]
+
+    subtree = prompt_tree.get_subtree("root_v2")
+    assert subtree["node"]["id"] == "root_v2"
+    assert subtree["children"][0]["node"]["id"] == "child_v1"
+    assert subtree["children"][0]["children"][0]["node"]["id"] == "child_v2"
+
+
+def test_path_between_unrelated_versions_is_none(prompt_tree):
+    prompt_tree.create_prompt("island", "i1", {})
+    assert prompt_tree.get_path("island_v1", "child_v2") is None
+
+
+def test_index_survives_load_and_sync(prompt_tree):
+    reloaded = PromptTree(prompt_tree.langfuse_client, prompt_tree.file_path)
+
+    assert ids(reloaded.get_ancestors("child_v2")) == ["child_v1", "root_v2", "root_v1"]
+    assert reloaded.get_next_version("child") == 3
+
+    reloaded.tree = reloaded.load_tree()
+    assert reloaded.get_prompt_by_id("other_v1")["parent_id"] == "root_v1"
+
+
+def test_ancestors_stop_on_cycles():
+    index = TreeIndex({"prompts": {"a": [
+        {"id": "a_v1", "name": "a", "version": 1, "parent_id": "a_v2", "created_at": ""},
+        {"id": "a_v2", "name": "a", "version": 2, "parent_id": "a_v1", "created_at": ""},
+    ]}})
+
+    assert ids(index.ancestors("a_v1")) == ["a_v2"]
+    assert ids(index.descendants("a_v1")) == ["a_v2"]
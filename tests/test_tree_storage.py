@@ -0,0 +1,102 @@
+import json
+import os
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.storage import JournalStorage, JsonFileStorage
+from promptpilot.versioning.tree import PromptTree
+
+
+def node(name, version, parent_id=None):
+    return {"id": f"{name}_v{version}", "name": name, "version": version,
+            "parent_id": parent_id, "created_at": ""}
+
+
+def test_journal_appends_one_line_per_node(file_path):
+    storage = JournalStorage(file_path)
+    tree = {"prompts": {"a": [node("a", 1), node("a", 2, "a_v1")]}}
+
+    storage.append(tree, tree["prompts"]["a"])
+
+    with open(storage.journal_path) as f:
+        assert [json.loads(line)["id"] for line in f] == ["a_v1", "a_v2"]
+    assert not os.path.exists(file_path)
+
+
+def test_load_replays_snapshot_and_journal(file_path):
+    storage = JournalStorage(file_path)
+    tree = {"prompts": {"a": [node("a", 1)]}}
+    storage.save(tree)
+    tree["prompts"]["a"].append(node("a", 2, "a_v1"))
+    storage.append(tree, [tree["prompts"]["a"][-1]])
+    storage.close()
+
+    assert JournalStorage(file_path).load() == tree
+
+
+def test_load_skips_torn_line_and_duplicates(file_path):
+    storage = JournalStorage(file_path)
+    storage.save({"prompts": {"a": [node("a", 1)]}})
+    with open(storage.journal_path, 'w') as f:
+        f.write(json.dumps(node("a", 1)) + "\n")
+        f.write(json.dumps(node("b", 1)) + "\n")
+        f.write('{"id": "b_v2", "na')
+
+    tree = JournalStorage(file_path).load()
+
+    assert [n["id"] for n in tree["prompts"]["a"]] == ["a_v1"]
+    assert [n["id"] for n in tree["prompts"]["b"]] == ["b_v1"]
+
+
+def test_append_after_torn_line_is_replayed(file_path):
+    storage = JournalStorage(file_path)
+    storage.save({"prompts": {"x": [node("x", 1)]}})
+    with open(storage.journal_path, 'w') as f:
+        f.write(json.dumps(node("x", 2)) + "\n")
+        f.write('{"id": "x_v3", "na')
+
+    reopened = JournalStorage(file_path)
+    tree = reopened.load()
+    tree["prompts"]["x"].append(node("x", 3))
+    reopened.append(tree, [tree["prompts"]["x"][-1]])
+    reopened.close()
+
+    replayed = JournalStorage(file_path).load()
+    assert [n["id"] for n in replayed["prompts"]["x"]] == ["x_v1", "x_v2", "x_v3"]
+
+
+def test_compaction_writes_snapshot_and_resets_journal(file_path):
+    storage = JournalStorage(file_path, compact_every=3)
+    tree = {"prompts": {"a": []}}
+    for version in range(1, 4):
+        tree["prompts"]["a"].append(node("a", version))
+        storage.append(tree, [tree["prompts"]["a"][-1]])
+
+    assert os.path.getsize(storage.journal_path) == 0
+    with open(file_path) as f:
+        assert json.load(f) == tree
+    assert not [name for name in os.listdir(os.path.dirname(file_path)) if name.startswith('.snapshot-')]
+
+
+def test_prompt_tree_with_journal_storage(file_path):
+    langfuse = FakeLangfuse()
+    tree = PromptTree(langfuse, file_path, storage=JournalStorage(file_path), incremental_sync=True)
+    tree.create_prompt("a", "a1", {})
+    tree.create_prompt("a", "a2", {}, parent_id="a_v1")
+    langfuse.create_prompt(name="b", prompt="b1", config={})
+    tree.sync_with_langfuse()
+    tree.storage.close()
+
+    with open(tree.storage.journal_path) as f:
+        assert [json.loads(line)["id"] for line in f] == ["a_v1", "a_v2", "b_v1"]
+
+    reloaded = JournalStorage(file_path).load()
+    assert reloaded == tree.tree
+
+
+def test_json_storage_is_default(file_path):
+    tree = PromptTree(FakeLangfuse(), file_path)
+    tree.create_prompt("a", "a1", {})
+
+    assert isinstance(tree.storage, JsonFileStorage)
+    with open(file_path) as f:
+        assert json.load(f)["prompts"]["a"][0]["id"] == "a_v1"
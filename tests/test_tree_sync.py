@@ -0,0 +1,53 @@
+import os
+
+from benchmarks.fake_langfuse import FakeLangfuse
+from promptpilot.versioning.tree import PromptTree
+
+
+def test_sync_runs_fetches_concurrently_within_cap(file_path):
+    langfuse = FakeLangfuse(prompt_count=4, versions_per_prompt=5, latency=0.01)
+    PromptTree(langfuse, file_path, max_workers=4)
+
+    assert langfuse.calls["get_prompt"] == 20
+    assert 1 < langfuse.max_in_flight <= 4
+
+
+def test_sync_tree_matches_sequential_sync(tmp_path):
+    sequential = PromptTree(FakeLangfuse(prompt_count=3, versions_per_prompt=4),
+                            os.path.join(tmp_path, 'a.json'), max_workers=1)
+    pooled = PromptTree(FakeLangfuse(prompt_count=3, versions_per_prompt=4, latency=0.001),
+                        os.path.join(tmp_path, 'b.json'), max_workers=8)
+
+    assert pooled.tree == sequential.tree
+    assert [p["version"] for p in pooled.tree["prompts"]["prompt-0"]] == [1, 2, 3, 4]
+    assert pooled.tree["prompts"]["prompt-0"][1]["parent_id"] == "prompt-0_v1"
+
+
+def test_sync_passes_timeout_and_retries(file_path):
+    langfuse = FakeLangfuse(prompt_count=1)
+    seen = []
+    get_prompt = langfuse.get_prompt
+
+    def spy(name, version=None, **kwargs):
+        seen.append(kwargs)
+        return get_prompt(name, version, **kwargs)
+
+    langfuse.get_prompt = spy
+    PromptTree(langfuse, file_path, fetch_timeout_seconds=3, max_retries=5)
+
+    assert seen == [{"cache_ttl_seconds": 0, "max_retries": 5, "fetch_timeout_seconds": 3}]
+
+
+def test_sync_failed_fetch_keeps_version_without_parent(file_path):
+    langfuse = FakeLangfuse(prompt_count=2, versions_per_prompt=3)
+
+    def get_prompt(name, version=None, **kwargs):
+        raise RuntimeError("Langfuse is down")
+
+    langfuse.get_prompt = get_prompt
+
+    tree = PromptTree(langfuse, file_path)
+
+    nodes = tree.tree["prompts"]["prompt-1"]
+    assert [p["version"] for p in nodes] == [1, 2, 3]
+    assert all(p["parent_id"] is None for p in nodes)